@@ -0,0 +1,170 @@
+"""
+Adj-RIB-Out, the routes waiting to be advertised to each peer.
+
+Instead of sending an UPDATE message for every prefix as soon as it is
+advertised, the prefixes are queued per peer. When the queue of a peer is
+flushed, all the prefixes sharing the same path attributes are packed into a
+single UPDATE message, as are all the prefixes being withdrawn. A prefix
+advertised or withdrawn again before the flush only keeps the latest change.
+
+After a flush, the MinRouteAdvertisementInterval (MRAI) of the peer has to
+pass before the next one, so route churn in the meantime is coalesced into a
+single round of UPDATE messages. With an MRAI of 0, the queue is still only
+flushed once whatever is currently running has finished, which packs all the
+prefixes advertised at the same moment together.
+
+The prefixes of a group are spread over as many UPDATE messages as it takes
+to keep each of them within the 4096 byte maximum.
+"""
+import logging
+
+from messages import (
+    MAX_MESSAGE_LENGTH,
+    UPDATE_MIN_LENGTH,
+    UpdateMessage,
+    encode_path_attributes,
+    prefix_size,
+)
+
+logger = logging.getLogger("BGP")
+
+
+class AdjRibOut:
+    def __init__(self, router_number, send, schedule, mrai=0, tracker=None):
+        """
+        send(peer, message) sends the UPDATE messages, while
+        schedule(delay, action, argument) runs the flushes later on. The
+        convergence tracker, if any, is told about the queued routes and the
+        UPDATE messages sent.
+        """
+        self.router_number = router_number
+        self.send = send
+        self.schedule = schedule
+        self.default_mrai = mrai
+        self.tracker = tracker
+
+        self.mrai = {}
+        # path attributes of the prefixes waiting for each peer, None for the
+        # withdrawn prefixes
+        self.pending = {}
+        # the peers with a flush or a running MRAI timer
+        self.waiting = set()
+        self.updates_sent = 0
+
+    def set_mrai(self, peer, mrai):
+        self.mrai[peer] = mrai
+
+    def get_mrai(self, peer):
+        return self.mrai.get(peer, self.default_mrai)
+
+    def advertise(self, peer, path_attr, prefixes):
+        pending = self.get_pending(peer)
+        for prefix in prefixes:
+            pending[prefix] = path_attr
+        self.request_flush(peer)
+
+    def withdraw(self, peer, prefixes):
+        pending = self.get_pending(peer)
+        for prefix in prefixes:
+            pending[prefix] = None
+        self.request_flush(peer)
+
+    def get_pending(self, peer):
+        pending = self.pending.get(peer)
+        if pending is None:
+            pending = self.pending[peer] = {}
+            if self.tracker is not None:
+                self.tracker.pending_changed(1)
+        return pending
+
+    def request_flush(self, peer):
+        if peer not in self.waiting:
+            self.waiting.add(peer)
+            self.schedule(0, self.flush, (peer,))
+
+    def flush(self, peer):
+        pending = self.pending.pop(peer, None)
+        if pending:
+            self.send_updates(peer, pending)
+            # whatever gets advertised from now on waits for the MRAI to pass
+            self.schedule(self.get_mrai(peer), self.flush, (peer,))
+        else:
+            # nothing was advertised since the last flush, the MRAI is over
+            self.waiting.discard(peer)
+
+        # only now that the UPDATE messages of the routes are counted as sent
+        if pending is not None and self.tracker is not None:
+            self.tracker.pending_changed(-1)
+
+    def send_updates(self, peer, pending):
+        # group the prefixes by their path attributes, which are interned so
+        # the same attributes are always the same object
+        withdrawn = []
+        groups = {}
+        for prefix, path_attr in pending.items():
+            if path_attr is None:
+                withdrawn.append(prefix)
+                continue
+            groups.setdefault(path_attr, []).append(prefix)
+
+        for routes in split_prefixes(
+            withdrawn, MAX_MESSAGE_LENGTH - UPDATE_MIN_LENGTH
+        ):
+            self.message_sent()
+            self.send(
+                peer,
+                UpdateMessage(
+                    self.router_number,
+                    withdrawn_routes_len=len(routes),
+                    withdrawn_routes=routes,
+                ),
+            )
+
+        for path_attr, prefixes in groups.items():
+            total_pa = path_attr.to_dict()
+            budget = (
+                MAX_MESSAGE_LENGTH
+                - UPDATE_MIN_LENGTH
+                - len(encode_path_attributes(total_pa))
+            )
+            # a prefix takes up to 5 bytes
+            if budget < 5:
+                logger.error(
+                    f"Router {self.router_number} can't advertise {len(prefixes)} "
+                    f"prefixes to {peer}, their path attributes don't fit in an "
+                    "UPDATE message"
+                )
+                continue
+
+            for nlri in split_prefixes(prefixes, budget):
+                message = UpdateMessage(
+                    self.router_number,
+                    total_pa_len=len(total_pa),
+                    total_pa=total_pa,
+                    nlri=nlri,
+                )
+                message.path_attributes = path_attr
+                # counted first, the peer may handle it before send returns
+                self.message_sent()
+                self.send(peer, message)
+
+    def message_sent(self):
+        self.updates_sent += 1
+        if self.tracker is not None:
+            self.tracker.update_sent()
+
+
+def split_prefixes(prefixes, budget):
+    """Splits the prefixes into lists taking up at most budget bytes each"""
+    chunk = []
+    size = 0
+    for prefix in prefixes:
+        length = prefix_size(prefix)
+        if chunk and size + length > budget:
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append(prefix)
+        size += length
+    if chunk:
+        yield chunk
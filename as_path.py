@@ -0,0 +1,114 @@
+"""
+AS paths as persistent linked lists.
+
+An ASPath is the first AS of the path followed by the rest of the path, which
+is itself an ASPath. Prepending an AS creates a single new node pointing to
+the path it was prepended to, so all the paths a router advertises share
+their tails with the paths it learned them from.
+
+Paths are interned: building a path that already exists returns the existing
+one, so two paths are equal exactly when they are the same object. Every
+path caches its length, its hash, its origin AS and a small bitset of the
+ASes on it, which makes the path length and most loop checks O(1).
+"""
+import threading
+import weakref
+
+# the size of the membership bitset, AS numbers share bits modulo its size
+MEMBERSHIP_BITS = 128
+
+_interned = weakref.WeakValueDictionary()
+# routers running in threads build paths at the same time
+_intern_lock = threading.Lock()
+
+
+class ASPath:
+    __slots__ = ("first", "rest", "length", "origin", "members", "hash", "__weakref__")
+
+    def __new__(cls, first, rest=None):
+        first = int(first)
+        key = (first, rest)
+
+        with _intern_lock:
+            path = _interned.get(key)
+            if path is not None:
+                return path
+
+            path = super().__new__(cls)
+            path.first = first
+            path.rest = rest
+            member = 1 << (first % MEMBERSHIP_BITS)
+            if rest is None:
+                path.length = 1
+                path.origin = first
+                path.members = member
+                path.hash = hash(key)
+            else:
+                path.length = rest.length + 1
+                path.origin = rest.origin
+                path.members = rest.members | member
+                path.hash = hash((first, rest.hash))
+            _interned[key] = path
+            return path
+
+    @classmethod
+    def from_numbers(cls, as_numbers):
+        """The path going through the AS numbers, in order"""
+        path = None
+        for as_number in reversed(list(as_numbers)):
+            path = cls(as_number, path)
+        if path is None:
+            raise ValueError("an AS path needs at least one AS")
+        return path
+
+    @classmethod
+    def parse(cls, value):
+        """
+        The path for a space separated string of AS numbers, or for any
+        iterable of them. An ASPath is returned as it is.
+        """
+        if isinstance(value, ASPath):
+            return value
+        if isinstance(value, str):
+            value = value.split()
+        elif isinstance(value, int):
+            value = (value,)
+        return cls.from_numbers(value)
+
+    def prepend(self, as_number):
+        return ASPath(as_number, self)
+
+    def __contains__(self, as_number):
+        as_number = int(as_number)
+        if not self.members >> (as_number % MEMBERSHIP_BITS) & 1:
+            return False
+
+        # another AS sharing the bit might have set it
+        path = self
+        while path is not None:
+            if path.first == as_number:
+                return True
+            path = path.rest
+        return False
+
+    def __iter__(self):
+        path = self
+        while path is not None:
+            yield path.first
+            path = path.rest
+
+    def __len__(self):
+        return self.length
+
+    def __hash__(self):
+        return self.hash
+
+    def __reduce__(self):
+        # unpickling interns the path again
+        return ASPath.from_numbers, (tuple(self),)
+
+    def __str__(self):
+        return " ".join(map(str, self))
+
+    def __repr__(self):
+        return f"ASPath('{self}')"
@@ -0,0 +1,113 @@
+"""
+Convergence benchmark.
+
+Sets up discrete-event simulations of growing numbers of ASes, and measures
+the simulated time to get all the sessions Established and the routes to
+converge, the wall clock time it took, the BGP messages sent by type and the
+peak memory used. Every configuration runs in its own process, so the peak
+memory of one doesn't hide the next.
+
+    python benchmarks/bench_convergence.py --as-counts 10,50,100 --m 1,2,4
+"""
+import argparse
+import collections
+import json
+import subprocess
+import sys
+import time
+
+import common
+
+
+def run_once(as_count, model, m, seed, mrai):
+    topology = {"model": model, "size": as_count}
+    if model == "barabasi-albert":
+        topology["m"] = m
+
+    start = time.perf_counter()
+    scenario = common.converged_simulation(topology, seed, mrai)
+    wall_time = time.perf_counter() - start
+
+    routers = scenario.router_dict.values()
+    messages = collections.Counter()
+    for router in routers:
+        messages.update(router.messages_sent)
+
+    phases = scenario.tracker.phase_times
+    return {
+        "as_count": as_count,
+        "m": m,
+        "links": sum(len(router.paths) for router in routers) // 2,
+        "established_time": phases.get("established"),
+        "convergence_time": phases.get("converged"),
+        "wall_time": wall_time,
+        "events_run": scenario.engine.events_run,
+        "messages": dict(messages),
+        "routes": sum(len(router.path_table) for router in routers),
+        "peak_rss_kb": common.peak_rss(),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks the BGP convergence.")
+    parser.add_argument("--as-counts", default="10,50,100")
+    parser.add_argument(
+        "--m",
+        default="2",
+        help="Links every new AS gets in the Barabasi-Albert model, as a list.",
+    )
+    parser.add_argument(
+        "--model",
+        default="barabasi-albert",
+        choices=["barabasi-albert", "waxman", "tiered", "random"],
+    )
+    parser.add_argument("--mrai", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="JSON file to write the results to.")
+    parser.add_argument(
+        "--single", action="store_true", help="Run a single configuration."
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    as_counts = [int(n) for n in args.as_counts.split(",")]
+    densities = [int(m) for m in args.m.split(",")]
+
+    if args.single:
+        result = run_once(as_counts[0], args.model, densities[0], args.seed, args.mrai)
+        json.dump(result, sys.stdout)
+        return
+
+    results = []
+    for as_count in as_counts:
+        for m in densities:
+            run = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--single",
+                    f"--as-counts={as_count}",
+                    f"--m={m}",
+                    f"--model={args.model}",
+                    f"--mrai={args.mrai}",
+                    f"--seed={args.seed}",
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            results.append(json.loads(run.stdout))
+            print(
+                f"{as_count} ASes, m={m}: converged after "
+                f"{results[-1]['convergence_time']:.2f}s simulated, "
+                f"{results[-1]['wall_time']:.2f}s wall",
+                file=sys.stderr,
+            )
+
+    common.write_results("convergence", vars(args), results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Forwarding benchmark.
+
+Sets up a small discrete-event simulation, gives one of its routers a FIB
+with many prefixes, and measures the latency of determine_next_hop() and the
+packets per second Router.handle_data() forwards, packet by packet and in
+batches.
+
+    python benchmarks/bench_forwarding.py --prefixes 100000 --packets 50000
+"""
+import argparse
+import contextlib
+import io
+import ipaddress
+import random
+
+import common
+from fib import FIB
+from ip_packet import IPPacket
+from packet_batch import PacketBatch
+from path_attributes import PathAttributes
+from rib import RIB
+
+
+def install_fib(router, prefix_count, rng):
+    """
+    Gives the router a FIB of random /24 prefixes spread over its peers, and
+    returns the prefixes.
+    """
+    rib = RIB()
+    peers = sorted(router.paths)
+    prefixes = set()
+    while len(prefixes) < prefix_count:
+        prefixes.add(rng.randrange(1 << 24) << 8)
+
+    for prefix in sorted(prefixes):
+        peer = rng.choice(peers)
+        attributes = PathAttributes(peer, f"50.{peer}.0.1", 0, 0, 0, 0, str(peer))
+        rib.add(f"{ipaddress.IPv4Address(prefix)}/24", attributes, 1)
+    router.fib = FIB.from_rib(rib)
+    return sorted(prefixes)
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    scenario = common.converged_simulation(
+        {"model": "barabasi-albert", "size": args.as_count, "m": 2}, args.seed
+    )
+    router = scenario.router_dict["1"]
+    prefixes = install_fib(router, args.prefixes, rng)
+    destinations = [
+        rng.choice(prefixes) + rng.randrange(1, 255) for _ in range(args.packets)
+    ]
+    addresses = [str(ipaddress.IPv4Address(d)) for d in destinations]
+
+    def new_packets():
+        return [
+            IPPacket(24, 5, 60, router.ip, address, "data") for address in addresses
+        ]
+
+    results = {"as_count": args.as_count, "fib_prefixes": len(router.fib)}
+    with contextlib.redirect_stdout(io.StringIO()):
+        packets = iter(new_packets())
+        latency = common.measure(
+            lambda: router.determine_next_hop(next(packets)), args.packets
+        )
+        results["next_hop_latency_us"] = latency * 1e6
+
+        packets = iter(new_packets())
+        results["handle_data_pps"] = 1 / common.measure(
+            lambda: router.handle_data(next(packets)), args.packets
+        )
+
+        batch = PacketBatch.create(
+            int(ipaddress.IPv4Address(router.ip)), destinations, ["data"] * args.packets
+        )
+        results["handle_data_batch_pps"] = args.packets / common.measure(
+            lambda: router.handle_data_batch(batch.select(slice(None))), 1
+        )
+
+    results["peak_rss_kb"] = common.peak_rss()
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks the packet forwarding.")
+    parser.add_argument("--as-count", type=int, default=20)
+    parser.add_argument("--prefixes", type=int, default=100000)
+    parser.add_argument("--packets", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="JSON file to write the results to.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    common.write_results("forwarding", vars(args), run(args), args.output)
+
+
+if __name__ == "__main__":
+    main()
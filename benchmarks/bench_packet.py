@@ -0,0 +1,73 @@
+"""
+IP packet benchmark.
+
+Measures the cost of the checksums and of the serialization of IPPacket, and
+of the same operations on a PacketBatch, per packet.
+
+    python benchmarks/bench_packet.py --repeat 100000
+"""
+import argparse
+import ipaddress
+
+import common
+from ip_packet import IPPacket
+from packet_batch import PacketBatch
+
+
+def run(args):
+    packet = IPPacket(24, 5, 60, "50.1.0.1", "100.2.2.5", "x" * args.payload_size)
+    data = packet.to_bytes()
+    view = IPPacket.from_buffer(data)
+
+    def decrease_ttl():
+        # keep the TTL from running out
+        packet.ttl = 60
+        packet.decrease_ttl()
+
+    operations = {
+        "generate_checksum": packet.generate_new_checksum,
+        "validate": packet.validate,
+        "decrease_ttl": decrease_ttl,
+        "to_bytes": packet.to_bytes,
+        "from_bytes": lambda: IPPacket.from_bytes(data),
+        "from_buffer": lambda: IPPacket.from_buffer(data),
+        "view_validate": view.validate,
+    }
+    results = {
+        f"{name}_ns": common.measure(operation, args.repeat) * 1e9
+        for name, operation in operations.items()
+    }
+
+    size = args.batch_size
+    batch = PacketBatch.create(
+        int(ipaddress.IPv4Address("50.1.0.1")),
+        [int(ipaddress.IPv4Address("100.2.2.5"))] * size,
+        ["x" * args.payload_size] * size,
+    )
+    batch_operations = {
+        "batch_generate_checksums": batch.generate_new_checksums,
+        "batch_validate": batch.validate,
+        "batch_decrease_ttl": batch.decrease_ttl,
+    }
+    for name, operation in batch_operations.items():
+        results[f"{name}_ns"] = common.measure(operation, 10) / size * 1e9
+
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks the IP packets.")
+    parser.add_argument("--repeat", type=int, default=100000)
+    parser.add_argument("--payload-size", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=100000)
+    parser.add_argument("--output", help="JSON file to write the results to.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    common.write_results("packet", vars(args), run(args), args.output)
+
+
+if __name__ == "__main__":
+    main()
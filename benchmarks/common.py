@@ -0,0 +1,102 @@
+"""
+Helpers shared by the benchmarks.
+
+Every benchmark writes its results as JSON, along with the commit and the
+Python version they were measured with, so runs can be compared over time.
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+# the simulator modules live in the parent directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from event_engine import EventEngine  # noqa: E402
+from scenario import Scenario  # noqa: E402
+from simulation import setup_simulation  # noqa: E402
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss():
+    """The peak resident set size of the process, in kilobytes"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return usage // 1024 if sys.platform == "darwin" else usage
+
+
+def measure(action, repeat):
+    """Runs the action repeat times, and returns the seconds per run"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        action()
+    return (time.perf_counter() - start) / repeat
+
+
+def write_results(name, parameters, results, output=None):
+    """Writes the results to the output file, or prints them if None"""
+    report = {
+        "benchmark": name,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "parameters": parameters,
+        "results": results,
+    }
+    if output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+class BenchmarkScenario(Scenario):
+    """
+    A scenario that keeps the routers around once the simulation is set up,
+    instead of writing results out.
+    """
+
+    def run(self, router_dict, engine=None, tracker=None, metrics=None):
+        self.router_dict = router_dict
+        self.engine = engine
+        self.tracker = tracker
+
+
+def converged_simulation(topology, seed=1, mrai=0):
+    """
+    Sets up a discrete-event simulation of the topology, and returns the
+    scenario holding its routers, engine and convergence tracker once the
+    routes have converged. The simulation output is discarded.
+    """
+    scenario = BenchmarkScenario({"seed": seed, "mrai": mrai, "topology": topology})
+    routes = scenario.build_routes()
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            setup_simulation(
+                routes,
+                engine=EventEngine(seed),
+                mrai=mrai,
+                scenario=scenario,
+            )
+        except SystemExit:
+            pass
+    return scenario
@@ -0,0 +1,144 @@
+"""
+Importer of the CAIDA AS relationship datasets.
+
+CAIDA publishes the relationships between the ASes of the Internet as
+as-rel and as-rel2 files, optionally compressed with gzip or bzip2, with one
+link per line:
+
+    <provider-as>|<customer-as>|-1
+    <peer-as>|<peer-as>|0
+
+as-rel2 files add a fourth field with the source of the inference, and lines
+starting with # are comments. The files are read line by line, and only the
+links are kept, as compact arrays, so the whole Internet (~75k ASes) fits in
+a few megabytes.
+
+The ASes are numbered densely in the order they first appear in the file,
+which is also what the simulation numbers its routers with, unless the AS
+numbers are kept as they are.
+"""
+import bz2
+import collections
+import gzip
+import random
+from array import array
+
+from topology import CUSTOMER, MAX_AS_NUMBER, PEER, Topology
+
+RELATIONSHIPS = {"-1": CUSTOMER, "0": PEER}
+
+
+def open_dataset(path):
+    """Opens the file as text, decompressing it if needed"""
+    with open(path, "rb") as file:
+        magic = file.read(3)
+
+    if magic[:2] == b"\x1f\x8b":
+        return gzip.open(path, "rt")
+    if magic == b"BZh":
+        return bz2.open(path, "rt")
+    return open(path, "r")
+
+
+def read_relationships(path):
+    """
+    Yields the (a, b, relationship) of every link of the file, where the
+    relationship is the one of a to b, CUSTOMER if b is a customer of a.
+    """
+    with open_dataset(path) as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            fields = line.split("|")
+            if len(fields) < 3 or fields[2] not in RELATIONSHIPS:
+                raise ValueError(f"{path}:{number}: malformed relationship {line!r}")
+            yield int(fields[0]), int(fields[1]), RELATIONSHIPS[fields[2]]
+
+
+def load_topology(path):
+    """
+    The topology of the file, along with the AS number of every AS of the
+    topology.
+    """
+    indices = {}
+    as_numbers = array("I")
+    sources = array("I")
+    targets = array("I")
+    relationships = array("b")
+
+    def index(as_number):
+        i = indices.get(as_number)
+        if i is None:
+            i = indices[as_number] = len(as_numbers)
+            as_numbers.append(as_number)
+        return i
+
+    for a, b, relationship in read_relationships(path):
+        sources.append(index(a))
+        targets.append(index(b))
+        relationships.append(relationship)
+
+    topology = Topology.from_edges(
+        len(as_numbers), zip(sources, targets), relationships
+    )
+    return topology, as_numbers
+
+
+def sample(topology, size, seed=None):
+    """
+    The indices of size ASes connected to each other, found by a breadth
+    first search from a random AS. Taking the subgraph they induce keeps the
+    sample connected, unlike picking ASes at random.
+    """
+    rng = random.Random(seed)
+    if size >= len(topology):
+        return list(range(len(topology)))
+
+    chosen = []
+    seen = set()
+    # restart from another random AS if the component runs out of ASes
+    while len(chosen) < size:
+        start = rng.randrange(len(topology))
+        if start in seen:
+            continue
+        seen.add(start)
+        queue = collections.deque([start])
+        while queue and len(chosen) < size:
+            a = queue.popleft()
+            chosen.append(a)
+            neighbours = list(topology.neighbours_of(a))
+            rng.shuffle(neighbours)
+            for b in neighbours:
+                if b not in seen:
+                    seen.add(b)
+                    queue.append(b)
+    return chosen
+
+
+def load_routes(path, sample_size=None, seed=None, remap=True):
+    """
+    The topology of the file, in the {"AS<n>": {peer numbers}} form of the
+    simulation. Only sample_size connected ASes are kept if passed. The ASes
+    are numbered from 1, or keep their AS numbers if remap is False, which
+    only works as long as all of them are small enough to get an address.
+    """
+    topology, as_numbers = load_topology(path)
+    if sample_size is not None:
+        indices = sample(topology, sample_size, seed)
+        topology = topology.subgraph(indices)
+        as_numbers = array("I", (as_numbers[i] for i in indices))
+
+    if remap:
+        return topology.to_routes()
+    largest = max(as_numbers, default=0)
+    if largest > MAX_AS_NUMBER:
+        raise ValueError(
+            f"AS{largest} is above AS{MAX_AS_NUMBER}, the largest AS number the "
+            "simulation can address, the ASes have to be remapped"
+        )
+    return {
+        f"AS{as_numbers[i]}": {as_numbers[b] for b in topology.neighbours_of(i)}
+        for i in range(len(topology))
+    }
@@ -0,0 +1,162 @@
+"""
+Tracking the convergence of the simulation.
+
+The routers notify a ConvergenceTracker whenever something the setup waits
+for happens: a BGP session reaching Established, a router finishing its
+voting or receiving its first round of UPDATE messages, and every UPDATE
+message being queued, sent and handled. Waiting for a phase then blocks on a
+condition variable, which is notified as soon as the phase is complete,
+instead of polling the routers. With a discrete-event simulation the engine
+runs until the phase is complete instead.
+
+The network has converged once it is quiescent: all the sessions are
+Established, no UPDATE message is on its way to a router, no route is
+waiting in an Adj-RIB-Out and no FIB is waiting to be rebuilt. The time
+every phase was complete at is recorded, the convergence time being the
+time the last UPDATE message was handled at. UPDATE messages the receiving
+router drops, as they can't be decoded or its session failed, are no longer
+on their way either.
+
+Routers running in threads are only waited for up to WAIT_TIMEOUT seconds,
+after which the phase is reported as not complete.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger("BGP")
+
+# the phases every router reports on its own
+ROUTER_PHASES = ("voting", "advertised")
+# seconds to wait for a phase of routers running in threads
+WAIT_TIMEOUT = 300
+
+
+class ConvergenceTracker:
+    def __init__(self, routers, sessions, clock=time.monotonic):
+        """
+        Tracks the given number of routers, which have the given number of
+        sessions between them, counting both ends of every session.
+        """
+        self.routers = routers
+        self.sessions = sessions
+        self.clock = clock
+        self.condition = threading.Condition()
+
+        self.start_time = clock()
+        self.phase_times = {}
+        self.done = {phase: set() for phase in ROUTER_PHASES}
+        self.established = set()
+        # UPDATE messages sent but not handled yet
+        self.in_flight = 0
+        # peers with routes waiting in an Adj-RIB-Out, and FIB rebuilds waiting
+        # to run
+        self.pending = 0
+        self.updates_handled = 0
+        self.updates_dropped = 0
+        self.last_update_time = None
+
+    def complete(self, phase, when=None):
+        """Records the time of the phase, if it wasn't complete yet"""
+        if phase not in self.phase_times:
+            self.phase_times[phase] = (
+                (self.clock() if when is None else when) - self.start_time
+            )
+            logger.info(f"Phase {phase} complete at {self.phase_times[phase]:.2f}s")
+            self.condition.notify_all()
+
+    def session_established(self, router, peer):
+        with self.condition:
+            self.established.add((router, peer))
+            if len(self.established) >= self.sessions:
+                self.complete("established")
+
+    def router_done(self, phase, router):
+        with self.condition:
+            self.done[phase].add(router)
+            if len(self.done[phase]) >= self.routers:
+                self.complete(phase)
+
+    def pending_changed(self, change):
+        with self.condition:
+            self.pending += change
+            if self.is_quiescent():
+                self.condition.notify_all()
+
+    def update_sent(self):
+        with self.condition:
+            self.in_flight += 1
+            if self.is_quiescent():
+                self.condition.notify_all()
+
+    def update_handled(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.updates_handled += 1
+            self.last_update_time = self.clock()
+            if self.is_quiescent():
+                self.condition.notify_all()
+
+    def update_dropped(self, count=1):
+        with self.condition:
+            self.in_flight -= count
+            self.updates_dropped += count
+            if self.is_quiescent():
+                self.condition.notify_all()
+
+    def is_complete(self, phase):
+        return phase in self.phase_times
+
+    def is_quiescent(self):
+        return (
+            "established" in self.phase_times
+            and self.in_flight == 0
+            and self.pending == 0
+        )
+
+    def wait_for(self, condition, engine=None, timeout=WAIT_TIMEOUT):
+        """
+        Waits until the condition is true, or runs the engine until then.
+        Returns whether the condition is true, which it may not be after
+        timeout seconds without an engine, or if the engine runs out of
+        events.
+        """
+        if engine is not None:
+            if not engine.run(stop_when=condition):
+                logger.error(f"Simulation ran out of events at {engine.now:.2f}s")
+                return False
+            return True
+
+        with self.condition:
+            if not self.condition.wait_for(condition, timeout):
+                logger.error(
+                    f"Simulation still running after {timeout}s, "
+                    f"{self.in_flight} UPDATE messages in flight and {self.pending} "
+                    "Adj-RIB-Out flushes or FIB rebuilds pending"
+                )
+                return False
+            return True
+
+    def wait(self, phase, engine=None, timeout=WAIT_TIMEOUT):
+        """Waits until the phase is complete"""
+        return self.wait_for(lambda: phase in self.phase_times, engine, timeout)
+
+    def wait_for_convergence(self, engine=None, timeout=WAIT_TIMEOUT):
+        """
+        Waits until the network is quiescent, and records the time it has
+        converged at.
+        """
+        if not self.wait_for(self.is_quiescent, engine, timeout):
+            return False
+        with self.condition:
+            self.complete("converged", self.last_update_time)
+        return True
+
+    def results(self):
+        return {
+            "phases": dict(self.phase_times),
+            "converged": self.is_complete("converged"),
+            "updates_handled": self.updates_handled,
+            "updates_dropped": self.updates_dropped,
+            "updates_in_flight": self.in_flight,
+        }
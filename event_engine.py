@@ -0,0 +1,127 @@
+"""
+Discrete-event simulation engine.
+
+Instead of waiting on the wall clock, everything the routers schedule goes
+into a single priority queue ordered by virtual time. Running the engine pops
+the earliest event, moves the clock forward to it and executes it, so the
+simulated time advances as fast as the CPU allows.
+
+The engine mimics the parts of an asyncio event loop the routers use
+(call_later, call_soon, create_task and time), which lets a router run on it
+the same way it runs on an event loop. Coroutines driven by the engine have to
+await engine.sleep() instead of asyncio.sleep().
+
+Events scheduled for the same time run in the order they were scheduled in,
+and all randomness should come from engine.random, so a run with the same
+seed always gives the same results.
+"""
+import heapq
+import itertools
+import logging
+import random
+
+logger = logging.getLogger("BGP")
+
+
+class ScheduledCall:
+    __slots__ = ("when", "serial_num", "action", "argument", "cancelled")
+
+    def __init__(self, when, serial_num, action, argument):
+        self.when = when
+        self.serial_num = serial_num
+        self.action = action
+        self.argument = argument
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.when, self.serial_num) < (other.when, other.serial_num)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualSleep:
+    __slots__ = ("delay",)
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def __await__(self):
+        yield self.delay
+
+
+class SimulatedTask:
+    """
+    A coroutine driven by the engine, every time it awaits engine.sleep() it
+    is resumed once the virtual clock reaches the end of the sleep.
+    """
+
+    def __init__(self, engine, coro):
+        self.engine = engine
+        self.coro = coro
+        self.handle = engine.call_soon(self.step)
+
+    def step(self):
+        try:
+            delay = self.coro.send(None)
+        except StopIteration:
+            return
+        self.handle = self.engine.call_later(delay, self.step)
+
+    def cancel(self):
+        self.handle.cancel()
+        self.coro.close()
+
+
+class EventEngine:
+    def __init__(self, seed=None):
+        self.now = 0.0
+        self.queue = []
+        self.serial_num = itertools.count()
+        self.random = random.Random(seed)
+        self.events_run = 0
+
+    def time(self):
+        return self.now
+
+    def call_later(self, delay, action, *argument):
+        call = ScheduledCall(
+            self.now + max(delay, 0), next(self.serial_num), action, argument
+        )
+        heapq.heappush(self.queue, call)
+        return call
+
+    def call_soon(self, action, *argument):
+        return self.call_later(0, action, *argument)
+
+    def create_task(self, coro):
+        return SimulatedTask(self, coro)
+
+    def sleep(self, delay):
+        return VirtualSleep(delay)
+
+    def run(self, until=None, stop_when=None):
+        """
+        Runs the events in order of their virtual time. Stops once the clock
+        would go past until, once stop_when() is true, or once there is
+        nothing left to run. Returns whether stop_when() was satisfied.
+        """
+        while self.queue:
+            if stop_when is not None and stop_when():
+                return True
+
+            if until is not None and self.queue[0].when > until:
+                break
+
+            call = heapq.heappop(self.queue)
+            if call.cancelled:
+                continue
+
+            self.now = call.when
+            self.events_run += 1
+            call.action(*call.argument)
+
+        if until is not None:
+            self.now = max(self.now, until)
+
+        return stop_when is not None and stop_when()
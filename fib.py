@@ -0,0 +1,46 @@
+"""
+Forwarding table of the data plane.
+
+The FIB is compiled from the best routes of the RIB and maps every prefix
+straight to the peer the packets are forwarded to. A FIB is never changed
+once built: when the routes change, the router builds a new one and swaps it
+in with a single assignment. Forwarding a packet only ever reads the FIB the
+router pointed to when the lookup started, so it needs no lock and never sees
+a table that is halfway through an update.
+
+Rebuilding the FIB goes over all the prefixes, so the router debounces it,
+and a burst of UPDATE messages only results in a single rebuild.
+"""
+from radix_trie import RadixTrie, parse_prefix
+
+
+class FIB:
+    def __init__(self, trie=None, version=0):
+        self.trie = trie if trie is not None else RadixTrie()
+        self.version = version
+
+    @classmethod
+    def from_rib(cls, rib, version=0):
+        """
+        Compiles the best route of every prefix of the RIB into a new FIB.
+        """
+        trie = RadixTrie()
+        for network in rib.networks():
+            as_path = rib.get(rib.best_route(network), "AS_PATH")
+            prefix, length = parse_prefix(network)
+            # the next hop peer is the AS the path starts with
+            trie.insert(prefix, length, (as_path.first, as_path))
+        return cls(trie, version)
+
+    def __len__(self):
+        return len(self.trie)
+
+    def lookup(self, address):
+        """
+        The pair of next hop peer and AS path of the longest prefix matching
+        the address, which is passed as an integer. None if nothing matches.
+        """
+        return self.trie.lookup(address)
+
+    def lookup_batch(self, addresses):
+        return self.trie.lookup_batch(addresses)
@@ -36,10 +36,40 @@ Steps to take when an IP package is received:
     2. Check TTL if > 0 -> discard
     2. Decrease TTL value
     3. Checksum update
+
+On the wire, a packet is its 20 byte header followed by the payload bytes, see
+IPPacket.to_bytes(). A packet arriving that way is read with from_buffer(),
+which only parses the fields the router asks for and decreases the TTL right
+in the buffer, so the packet can be sent on without encoding it again.
+
+The header checksum is the one's complement sum of the 16 bit words of the
+packed header. Decreasing the TTL only changes a single word, so the checksum
+is then updated incrementally (RFC 1624) instead of being computed again.
 """
-import ipaddress
+import socket
+import struct
+
+# Version/IHL, TOS, Total Length, Identification, Flags/Fragment Offset, TTL,
+# Protocol, Header Checksum, Source and Destination Address
+IP_HEADER = struct.Struct("!BBHHHBBH4s4s")
+HEADER_WORDS = struct.Struct("!10H")
+UINT16 = struct.Struct("!H")
+
 
-from bitstring import BitArray
+def ones_complement_sum(words):
+    total = sum(words)
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return total
+
+
+def update_checksum(checksum, old_word, new_word):
+    """
+    RFC 1624 incremental update of a checksum after one of the 16 bit words it
+    covers changed from old_word to new_word: HC' = ~(~HC + ~m + m')
+    """
+    total = ones_complement_sum((~checksum & 0xFFFF, ~old_word & 0xFFFF, new_word))
+    return ~total & 0xFFFF
 
 
 class IPPacket:
@@ -79,77 +109,37 @@ class IPPacket:
         return True
 
     def generate_new_checksum(self):
-        # get whole header - the checksum field
-        # split into 16 bit words
-        # calculate 2's compliment
-        # sum the words and remainders
-
-        # store the new checksum
-
-        # form 16 bit words
-        words = self.get_16bit_words(False)
-
-        # sum the words together
-        tmp_value = 0
-        for w in words:
-            tmp_value += int(w, 2)
-
-        tmp_value = BitArray(int=tmp_value, length=32)
-
-        overflow = tmp_value.bin[0:16]
-        checksum = tmp_value.bin[16:32]
-
-        # 1's compliment & store the new checksum
-        checksum = BitArray(int=int(checksum, 2) + int(overflow, 2), length=16)
-        checksum.invert()
-        self.header_checksum = int(checksum.bin, 2)
+        # sum the 16 bit words of the header without the checksum, and store
+        # the 1's complement of the sum as the new checksum
+        total = ones_complement_sum(self.get_16bit_words(False))
+        self.header_checksum = ~total & 0xFFFF
 
         return self.header_checksum
 
     def valid_checksum(self):
-        # get whole header - with checksum field
-        # split into 16 bit words
-        # calculate 2's compliment
-        # sum the words and remainders
-        # check if the result equals to all 1's or 0xFFFF
-        words = self.get_16bit_words(True)
-
-        # sum the words together
-        tmp_value = 0
-        for w in words:
-            tmp_value += int(w, 2)
-
-        tmp_value = BitArray(int=tmp_value, length=32)
-
-        overflow = tmp_value.bin[0:16]
-        checksum = tmp_value.bin[16:32]
-
-        res = BitArray(uint=int(checksum, 2) + int(overflow, 2), length=16).bin
-        if res == "1" * 16:
-            return True
-
-        return False
+        # with the checksum included, the words of a valid header add up to
+        # all 1's or 0xFFFF
+        return ones_complement_sum(self.get_16bit_words(True)) == 0xFFFF
 
     def to_data_link_layer_stream(self):
         """
         This function needs to covert the whole ip packet to 0's and 1's to
         send as a data link layer transfer to the router
         """
-        words = self.get_16bit_words(True)
-
-        data_link_stream = ""
-        for w in words:
-            data_link_stream += w
-
-        data_link_stream += BitArray(hex=self.payload.encode("utf-8").hex()).bin
-
-        return data_link_stream
+        data = self.get_header_bytes(True) + self.payload.encode("utf-8")
+        return "".join(format(byte, "08b") for byte in data)
 
     def get_destination_addr(self):
         return self.destination_addr
 
     def decrease_ttl(self):
-        self.ttl -= 0
+        old_word = (self.ttl << 8) | self.protocol
+        self.ttl = max(self.ttl - 1, 0)
+
+        # only the TTL/Protocol word changed, no need to sum the whole header
+        self.header_checksum = update_checksum(
+            self.header_checksum, old_word, (self.ttl << 8) | self.protocol
+        )
 
         if self.ttl == 0:
             print(f"IP packet reached end of life! Dropping...")
@@ -157,32 +147,145 @@ class IPPacket:
 
         return True
 
-    def get_16bit_words(self, verify):
-        # splitting the message into bits
+    def get_header_bytes(self, verify):
+        # the packed header, with the checksum field zeroed unless verifying
         if verify:
             checksum = self.header_checksum
         else:
             checksum = 0
 
-        words = [
-            (
-                BitArray(int=self.version, length=4).bin
-                + BitArray(int=self.hl, length=4).bin
-                + BitArray(int=self.type_of_service, length=8).bin
-            ),
-            BitArray(int=self.total_length, length=16).bin,
-            BitArray(int=self.identification, length=16).bin,
-            self.fragment_flags + BitArray(int=self.fragment_offset, length=13).bin,
-            BitArray(int=self.ttl, length=8).bin
-            + BitArray(int=self.protocol, length=8).bin,
-            BitArray(uint=checksum, length=16).bin,
-            bin(int(ipaddress.IPv4Address(self.source_addr)))[2:18],
-            bin(int(ipaddress.IPv4Address(self.source_addr)))[18:34],
-            bin(int(ipaddress.IPv4Address(self.destination_addr)))[2:18],
-            bin(int(ipaddress.IPv4Address(self.destination_addr)))[18:34],
-        ]
-
-        return words
+        return IP_HEADER.pack(
+            (self.version << 4) | self.hl,
+            self.type_of_service,
+            self.total_length,
+            self.identification,
+            (int(self.fragment_flags, 2) << 13) | self.fragment_offset,
+            self.ttl,
+            self.protocol,
+            checksum,
+            socket.inet_aton(self.source_addr),
+            socket.inet_aton(self.destination_addr),
+        )
+
+    def get_16bit_words(self, verify):
+        return HEADER_WORDS.unpack(self.get_header_bytes(verify))
 
     def get_payload(self):
         return self.payload
+
+    def to_bytes(self):
+        return self.get_header_bytes(True) + self.payload.encode("utf-8")
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """
+        Reads the packet lazily from the buffer, without copying it if it is
+        writable (a bytearray or a memoryview of one).
+        """
+        if isinstance(buffer, bytes) or (
+            isinstance(buffer, memoryview) and buffer.readonly
+        ):
+            buffer = bytearray(buffer)
+        if len(buffer) < IP_HEADER.size:
+            raise ValueError(f"IP packet of {len(buffer)} bytes is too short")
+
+        return IPPacketView(buffer)
+
+    @classmethod
+    def from_bytes(cls, data):
+        view = cls.from_buffer(data)
+        packet = cls(
+            view.total_length,
+            view.hl,
+            view.ttl,
+            view.source_addr,
+            view.destination_addr,
+            view.payload,
+        )
+        packet.type_of_service = view.type_of_service
+        packet.identification = view.identification
+        packet.fragment_flags = view.fragment_flags
+        packet.fragment_offset = view.fragment_offset
+        packet.protocol = view.protocol
+        packet.header_checksum = view.header_checksum
+        return packet
+
+
+class IPPacketView(IPPacket):
+    """
+    An IP packet backed by the buffer it arrived in. The fields are parsed
+    from the buffer whenever they are read, and the TTL and checksum are
+    written straight back into it.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    @property
+    def version(self):
+        return self.buffer[0] >> 4
+
+    @property
+    def hl(self):
+        return self.buffer[0] & 0x0F
+
+    @property
+    def type_of_service(self):
+        return self.buffer[1]
+
+    @property
+    def total_length(self):
+        return UINT16.unpack_from(self.buffer, 2)[0]
+
+    @property
+    def identification(self):
+        return UINT16.unpack_from(self.buffer, 4)[0]
+
+    @property
+    def fragment_flags(self):
+        return format(self.buffer[6] >> 5, "03b")
+
+    @property
+    def fragment_offset(self):
+        return UINT16.unpack_from(self.buffer, 6)[0] & 0x1FFF
+
+    @property
+    def ttl(self):
+        return self.buffer[8]
+
+    @ttl.setter
+    def ttl(self, value):
+        self.buffer[8] = value
+
+    @property
+    def protocol(self):
+        return self.buffer[9]
+
+    @property
+    def header_checksum(self):
+        return UINT16.unpack_from(self.buffer, 10)[0]
+
+    @header_checksum.setter
+    def header_checksum(self, value):
+        UINT16.pack_into(self.buffer, 10, value)
+
+    @property
+    def source_addr(self):
+        return socket.inet_ntoa(bytes(self.buffer[12:16]))
+
+    @property
+    def destination_addr(self):
+        return socket.inet_ntoa(bytes(self.buffer[16:20]))
+
+    @property
+    def payload(self):
+        return bytes(self.buffer[self.hl * 4 :]).decode("utf-8")
+
+    def get_header_bytes(self, verify):
+        header = bytes(self.buffer[: IP_HEADER.size])
+        if verify:
+            return header
+        return header[:10] + bytes(2) + header[12:]
+
+    def to_bytes(self):
+        return self.buffer
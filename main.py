@@ -11,8 +11,17 @@ will be handled by the following steps:
 understandable to the user
 """
 import argparse
+import atexit
+import inspect
 import os
+import random
 
+import caida
+import topology
+from event_engine import EventEngine
+from metrics import MetricsRegistry
+from scenario import load_scenario
+from tracing import Tracer
 from simulation import (
     generate_routing_paths,
     setup_as,
@@ -20,6 +29,21 @@ from simulation import (
 )
 
 
+def topology_parameter(text):
+    """Parses a NAME=VALUE parameter of a topology model"""
+    name, separator, value = text.partition("=")
+    if not separator or not name:
+        raise argparse.ArgumentTypeError(f"{text} is not of the form NAME=VALUE")
+    try:
+        value = int(value)
+    except ValueError:
+        try:
+            value = float(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"{value} is not a number")
+    return name.replace("-", "_"), value
+
+
 def parse_args():
     """
     Parse arguments for the main program.
@@ -34,6 +58,107 @@ def parse_args():
         help="The number of AS systems to be used in the simulation.",
         default=10,
     )
+    parser.add_argument(
+        "--asyncio",
+        action="store_true",
+        help="Run all routers on a single asyncio event loop instead of a thread "
+        "per router.",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=["tcp", "queue"],
+        help="How messages are passed between the routers, either through TCP "
+        "sockets or through in-memory queues.",
+        default="tcp",
+    )
+    parser.add_argument(
+        "--discrete-event",
+        action="store_true",
+        help="Run the simulation on a virtual clock instead of the wall clock, "
+        "ignoring --asyncio and --transport.",
+    )
+    parser.add_argument(
+        "--run-time",
+        type=int,
+        help="Simulated seconds to keep running for after the setup, only used "
+        "with --discrete-event.",
+        default=0,
+    )
+    parser.add_argument(
+        "--mrai",
+        type=float,
+        help="MinRouteAdvertisementInterval, the seconds a router waits between "
+        "two rounds of UPDATE messages to the same peer.",
+        default=0,
+    )
+    parser.add_argument(
+        "--topology",
+        choices=["random", *topology.GENERATORS],
+        help="How the ASes are linked: random links picked interactively or at "
+        "random, Barabasi-Albert preferential attachment, the Waxman model or a "
+        "tiered customer/provider hierarchy.",
+        default="random",
+    )
+    parser.add_argument(
+        "--topology-parameter",
+        action="append",
+        type=topology_parameter,
+        metavar="NAME=VALUE",
+        help="A parameter of the --topology model, such as m=3 for "
+        "barabasi-albert, alpha=0.01, beta=0.4 or average_degree=6 for waxman, "
+        "and tier1_size=10 or tier2_fraction=0.2 for tiered. Can be repeated.",
+        default=[],
+    )
+    parser.add_argument(
+        "--caida",
+        help="Path of a CAIDA as-rel or as-rel2 file (optionally gzip or bzip2 "
+        "compressed) to take the topology from, ignoring --as-number and "
+        "--topology.",
+        default=None,
+    )
+    parser.add_argument(
+        "--caida-sample",
+        type=int,
+        help="Only simulate this many connected ASes of the CAIDA topology.",
+        default=None,
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Record metrics of the routers, which the m command shows and "
+        "scenario results include.",
+    )
+    parser.add_argument(
+        "--trace",
+        help="Record a timeline of the simulation, written to this file in the "
+        "Chrome trace-event format on exit.",
+        default=None,
+    )
+    parser.add_argument(
+        "--trace-buffer",
+        type=int,
+        help="The number of most recent spans kept for the trace.",
+        default=100000,
+    )
+    parser.add_argument(
+        "--scenario",
+        help="Path of a JSON, TOML or YAML scenario file to run without any "
+        "prompts, which sets the topology and all the other options.",
+        default=None,
+    )
+    parser.add_argument(
+        "--results",
+        help="Where to write the JSON results of a scenario, printed out if not "
+        "given.",
+        default=None,
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed for the random choices, making the topology and the "
+        "discrete-event simulation reproducible.",
+        default=None,
+    )
     # parser.add_argument(
     #     "--run-preset",
     #     action="store_true",
@@ -47,6 +172,21 @@ def main():
     Entrypoint for the simulation program.
     """
     args = parse_args()
+    metrics = MetricsRegistry() if args.metrics else None
+    tracer = None
+    if args.trace is not None:
+        tracer = Tracer(args.trace, args.trace_buffer)
+        # also written out when a stalled run is interrupted
+        atexit.register(tracer.flush)
+
+    if args.scenario is not None:
+        run_scenario(args.scenario, args.results, metrics, tracer)
+        return
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    engine = EventEngine(args.seed) if args.discrete_event else None
+
     print(
         "Welcome to our scalable and customizable simulator of AS routing using "
         "the BGP-4 protocol.\nThe current network topology is the following: \n"
@@ -67,11 +207,65 @@ def main():
             "AS9": {1, 2, 8},
             "AS10": {5, 6},
         }
-        setup_simulation(routes)
+        setup_simulation(
+            routes,
+            args.asyncio,
+            args.transport,
+            engine,
+            args.run_time,
+            args.mrai,
+            metrics=metrics,
+            tracer=tracer,
+        )
     else:
-        as_data = setup_as(args.as_number)
-        routes = generate_routing_paths(args.as_number, as_data)
-        setup_simulation(routes)
+        if args.caida is not None:
+            routes = caida.load_routes(args.caida, args.caida_sample, args.seed)
+        elif args.topology == "random":
+            as_data = setup_as(args.as_number)
+            routes = generate_routing_paths(args.as_number, as_data)
+        else:
+            generator = topology.GENERATORS[args.topology]
+            parameters = dict(args.topology_parameter)
+            for name in parameters:
+                if name not in inspect.signature(generator).parameters:
+                    raise SystemExit(f"The {args.topology} topology has no {name}")
+            routes = generator(
+                args.as_number, seed=args.seed, **parameters
+            ).to_routes()
+        setup_simulation(
+            routes,
+            args.asyncio,
+            args.transport,
+            engine,
+            args.run_time,
+            args.mrai,
+            metrics=metrics,
+            tracer=tracer,
+        )
+
+
+def run_scenario(path, results_path=None, metrics=None, tracer=None):
+    """
+    Runs the scenario file from start to end, without any prompts.
+    """
+    scenario = load_scenario(path, results_path)
+    if metrics is None and scenario.metrics:
+        metrics = MetricsRegistry()
+    if scenario.seed is not None:
+        random.seed(scenario.seed)
+    engine = EventEngine(scenario.seed) if scenario.discrete_event else None
+
+    routes = scenario.build_routes()
+    setup_simulation(
+        routes,
+        scenario.asynchronous,
+        scenario.transport,
+        engine,
+        mrai=scenario.mrai,
+        scenario=scenario,
+        metrics=metrics,
+        tracer=tracer,
+    )
 
 
 if __name__ == "__main__":
@@ -1,6 +1,233 @@
 import ipaddress
+import math
+import struct
 from enum import Enum
 
+from as_path import ASPath
+from path_attributes import PathAttributes
+
+# Precompiled wire formats, all fields are in network byte order
+BGP_HEADER = struct.Struct("!16sHB")  # marker, length, type
+OPEN_BODY = struct.Struct("!BHHIB")  # version, my AS, hold time, BGP id, opt. len
+LENGTH_FIELD = struct.Struct("!H")
+ATTR_HEADER = struct.Struct("!BBB")  # flags, type code, length
+ATTR_HEADER_EXTENDED = struct.Struct("!BBH")
+UINT32 = struct.Struct("!I")
+DOUBLE = struct.Struct("!d")
+NOTIFICATION_BODY = struct.Struct("!BB")
+VOTING_BODY = struct.Struct("!HBHIId")
+
+MARKER = b"\xff" * 16
+MAX_MESSAGE_LENGTH = 4096  # RFC 4271
+# an UPDATE message without any routes or path attributes
+UPDATE_MIN_LENGTH = 23
+AS_TRANS = 23456  # RFC 6793, stands in for AS numbers that don't fit 2 octets
+AS_SEQUENCE = 2
+
+# Path attribute flags
+ATTR_OPTIONAL = 0x80
+ATTR_TRANSITIVE = 0x40
+ATTR_EXTENDED_LENGTH = 0x10
+
+# Path attribute type codes, WEIGHT and TRUST_RATE are specific to this simulation
+# and use codes from the unassigned range
+ATTR_TYPE_CODES = {
+    "ORIGIN": 1,
+    "AS_PATH": 2,
+    "NEXT_HOP": 3,
+    "MED": 4,
+    "LOC_PREF": 5,
+    "WEIGHT": 240,
+    "TRUST_RATE": 241,
+}
+ATTR_NAMES = {code: name for name, code in ATTR_TYPE_CODES.items()}
+ATTR_FLAGS = {
+    "ORIGIN": ATTR_TRANSITIVE,
+    "AS_PATH": ATTR_TRANSITIVE,
+    "NEXT_HOP": ATTR_TRANSITIVE,
+    "MED": ATTR_OPTIONAL,
+    "LOC_PREF": ATTR_TRANSITIVE,
+    "WEIGHT": ATTR_OPTIONAL | ATTR_TRANSITIVE,
+    "TRUST_RATE": ATTR_OPTIONAL | ATTR_TRANSITIVE,
+}
+
+
+def encode_prefixes(prefixes):
+    """
+    Encodes a list of IP prefixes as <length, prefix> tuples, where the prefix
+    holds only as many octets as the prefix length requires.
+    """
+    data = bytearray()
+    for prefix in prefixes or ():
+        network = ipaddress.IPv4Network(prefix, strict=False)
+        data.append(network.prefixlen)
+        data += network.network_address.packed[: (network.prefixlen + 7) // 8]
+
+    return bytes(data)
+
+
+def prefix_size(prefix):
+    """The bytes encode_prefixes() takes for the prefix"""
+    _, _, length = prefix.partition("/")
+    return 1 + (int(length or 32) + 7) // 8
+
+
+def decode_prefixes(view, router_number):
+    """
+    Decodes <length, prefix> tuples back into a list of IP prefix strings.
+    """
+    prefixes = []
+    offset = 0
+    while offset < len(view):
+        prefix_len = view[offset]
+        if prefix_len > 32:
+            raise NotificationMessage(router_number, (3, 2))
+
+        octets = (prefix_len + 7) // 8
+        if offset + 1 + octets > len(view):
+            raise NotificationMessage(router_number, (2, 9))  # Invalid Network Field
+
+        address = bytes(view[offset + 1 : offset + 1 + octets]).ljust(4, b"\x00")
+        prefixes.append("%d.%d.%d.%d/%d" % (*address, prefix_len))
+        offset += 1 + octets
+
+    return prefixes
+
+
+def encode_attribute_value(name, value):
+    if name == "AS_PATH":
+        as_numbers = list(ASPath.parse(value))
+        data = bytearray()
+        # a single segment can hold at most 255 AS numbers
+        for i in range(0, len(as_numbers), 255):
+            segment = as_numbers[i : i + 255]
+            data += bytes((AS_SEQUENCE, len(segment)))
+            data += struct.pack(f"!{len(segment)}I", *segment)
+        return bytes(data)
+
+    if name == "NEXT_HOP":
+        return ipaddress.IPv4Address(value).packed
+
+    if name == "TRUST_RATE":
+        return DOUBLE.pack(float(value))
+
+    return UINT32.pack(int(value))
+
+
+def decode_attribute_value(name, view, router_number):
+    try:
+        if name == "AS_PATH":
+            as_numbers = []
+            offset = 0
+            while offset < len(view):
+                count = view[offset + 1]
+                as_numbers += struct.unpack_from(f"!{count}I", view, offset + 2)
+                offset += 2 + 4 * count
+            return ASPath.from_numbers(as_numbers)
+
+        if name == "NEXT_HOP":
+            return "%d.%d.%d.%d" % tuple(view)
+
+        if name == "TRUST_RATE":
+            return DOUBLE.unpack(view)[0]
+
+        return UINT32.unpack(view)[0]
+    except (struct.error, IndexError, TypeError) as e:
+        raise NotificationMessage(router_number, (2, 5)) from e  # Attribute Length Error
+
+
+def encode_path_attributes(path_attr):
+    data = bytearray()
+    for name, value in (path_attr or {}).items():
+        value = encode_attribute_value(name, value)
+        if len(value) > 255:
+            data += ATTR_HEADER_EXTENDED.pack(
+                ATTR_FLAGS[name] | ATTR_EXTENDED_LENGTH,
+                ATTR_TYPE_CODES[name],
+                len(value),
+            )
+        else:
+            data += ATTR_HEADER.pack(ATTR_FLAGS[name], ATTR_TYPE_CODES[name], len(value))
+        data += value
+
+    return bytes(data)
+
+
+def decode_path_attributes(view, router_number):
+    path_attr = {}
+    offset = 0
+    while offset < len(view):
+        if offset + ATTR_HEADER.size > len(view):
+            raise NotificationMessage(router_number, (2, 1))  # Malformed Attribute List
+
+        flags, type_code, length = ATTR_HEADER.unpack_from(view, offset)
+        header_size = ATTR_HEADER.size
+        if flags & ATTR_EXTENDED_LENGTH:
+            flags, type_code, length = ATTR_HEADER_EXTENDED.unpack_from(view, offset)
+            header_size = ATTR_HEADER_EXTENDED.size
+
+        start = offset + header_size
+        offset = start + length
+        if offset > len(view):
+            raise NotificationMessage(router_number, (2, 5))  # Attribute Length Error
+
+        if type_code not in ATTR_NAMES:
+            if not flags & ATTR_OPTIONAL:
+                # Unrecognized Well-known Attribute
+                raise NotificationMessage(router_number, (2, 2))
+            continue
+
+        name = ATTR_NAMES[type_code]
+        path_attr[name] = decode_attribute_value(name, view[start:offset], router_number)
+
+    return path_attr
+
+
+def read_messages(buffer, router_number):
+    """
+    Decodes every complete message found in the passed stream buffer and
+    removes them from it. Any partially received message is left in the
+    buffer until the rest of it arrives.
+    """
+    messages = []
+    offset = 0
+    with memoryview(buffer) as view:
+        while len(view) - offset >= BGP_HEADER.size:
+            (msg_length,) = LENGTH_FIELD.unpack_from(view, offset + len(MARKER))
+            if not BGP_HEADER.size <= msg_length <= MAX_MESSAGE_LENGTH:
+                # the stream can't be brought back in sync after this, and
+                # there is no point in buffering a message that long
+                raise NotificationMessage(router_number, (0, 2))  # Bad Message Length
+
+            if len(view) - offset < msg_length:
+                break
+
+            messages.append(
+                BGPMessage.decode(view[offset : offset + msg_length], router_number)
+            )
+            offset += msg_length
+
+    del buffer[:offset]
+    return messages
+
+
+def count_messages(buffer, message_type):
+    """
+    Counts the messages of the type in the passed stream buffer, such as the
+    ones a router drops along with a failed session, without decoding them.
+    """
+    count = 0
+    offset = 0
+    while len(buffer) - offset >= BGP_HEADER.size:
+        _, msg_length, msg_type = BGP_HEADER.unpack_from(buffer, offset)
+        if msg_type == message_type.value:
+            count += 1
+        if msg_length < BGP_HEADER.size:
+            # whatever follows can't be told apart anymore
+            break
+        offset += msg_length
+    return count
+
 
 class Message(Enum):
     MESSAGE = 0
@@ -39,7 +266,7 @@ class BGPMessage:
 
     def __init__(self, router_number, msg_length: int = None):
         self.version = 4
-        self.max_length = 4096
+        self.max_length = MAX_MESSAGE_LENGTH
 
         #  Need to be set for each BGP message accordingly
         self.msg_type = Message.MESSAGE
@@ -57,6 +284,62 @@ class BGPMessage:
     def __str__(self):
         return self.msg_type.name
 
+    def encode(self):
+        """
+        Returns the message in its wire format, the 19 byte header followed by
+        the message body. Raises a ValueError if it is longer than the 4096
+        bytes RFC 4271 allows.
+        """
+        body = self.encode_body()
+        self.msg_length = BGP_HEADER.size + len(body)
+        if self.msg_length > self.max_length:
+            raise ValueError(
+                f"{self.msg_type.name} message of {self.msg_length} bytes is longer "
+                f"than {self.max_length} bytes"
+            )
+        return BGP_HEADER.pack(self.marker, self.msg_length, self.msg_type.value) + body
+
+    def encode_body(self):
+        return b""
+
+    @classmethod
+    def decode(cls, data, router_number):
+        """
+        Parses a single message in its wire format. The sender is not part of
+        the message, it is known from the session the message came from.
+        """
+        view = memoryview(data)
+        if len(view) < BGP_HEADER.size:
+            raise NotificationMessage(router_number, (3, 1))
+
+        marker, msg_length, msg_type = BGP_HEADER.unpack_from(view)
+        if marker != MARKER:
+            raise NotificationMessage(router_number, (0, 1))
+
+        if not BGP_HEADER.size <= msg_length <= MAX_MESSAGE_LENGTH:
+            raise NotificationMessage(router_number, (0, 2))  # Bad Message Length
+
+        if msg_length > len(view):
+            raise NotificationMessage(router_number, (3, 1))
+
+        try:
+            message_class = MESSAGE_CLASSES[Message(msg_type)]
+        except (ValueError, KeyError) as e:
+            raise NotificationMessage(router_number, (0, 3)) from e  # Bad Message Type
+
+        if not issubclass(message_class, cls):
+            raise NotificationMessage(router_number, (0, 3))  # Bad Message Type
+
+        message = message_class.decode_body(
+            router_number, view[BGP_HEADER.size : msg_length]
+        )
+        message.msg_length = msg_length
+        return message
+
+    @classmethod
+    def decode_body(cls, router_number, body):
+        return cls(router_number)
+
     def get_message_type(self):
         return self.msg_type
 
@@ -122,6 +405,7 @@ class UpdateMessage(BGPMessage):
         # and are using only a small subset of path attributes in the UPDATE messages
         self.total_pa = total_pa  # {attr. type: attr. value, ...}
         self.total_pa_len = total_pa_len  # "2 bytes" in size
+        self.path_attributes = None
 
         # UPDATE message Length - 23 - Total Path Attributes Length - Withdrawn Routes Length
         # path attributes advertised apply for the prefixes found in the NLRI
@@ -139,12 +423,58 @@ class UpdateMessage(BGPMessage):
                 self.router_number, (2, 1)
             )  # Malformed Attribute List
 
+    def encode_body(self):
+        withdrawn_routes = encode_prefixes(self.withdrawn_routes)
+        path_attr = encode_path_attributes(self.total_pa)
+        return (
+            LENGTH_FIELD.pack(len(withdrawn_routes))
+            + withdrawn_routes
+            + LENGTH_FIELD.pack(len(path_attr))
+            + path_attr
+            + encode_prefixes(self.nlri)
+        )
+
+    @classmethod
+    def decode_body(cls, router_number, body):
+        if len(body) < 4:
+            raise NotificationMessage(router_number, (3, 1))
+
+        (withdrawn_routes_len,) = LENGTH_FIELD.unpack_from(body)
+        pa_offset = 2 + withdrawn_routes_len
+        if pa_offset + 2 > len(body):
+            raise NotificationMessage(router_number, (2, 1))  # Malformed Attribute List
+
+        (total_pa_len,) = LENGTH_FIELD.unpack_from(body, pa_offset)
+        nlri_offset = pa_offset + 2 + total_pa_len
+        if nlri_offset > len(body):
+            raise NotificationMessage(router_number, (2, 1))  # Malformed Attribute List
+
+        return cls(
+            router_number,
+            withdrawn_routes_len=withdrawn_routes_len,
+            withdrawn_routes=decode_prefixes(body[2:pa_offset], router_number),
+            total_pa_len=total_pa_len,
+            total_pa=decode_path_attributes(
+                body[pa_offset + 2 : nlri_offset], router_number
+            ),
+            nlri=decode_prefixes(body[nlri_offset:], router_number),
+        )
+
+    def get_withdrawn_routes(self):
+        return self.withdrawn_routes or []
+
     def get_nlri(self):
         return self.nlri
 
     def get_path_attr(self):
         return self.total_pa
 
+    def get_path_attributes(self):
+        """The interned PathAttributes of the message"""
+        if self.path_attributes is None:
+            self.path_attributes = PathAttributes.from_dict(self.total_pa)
+        return self.path_attributes
+
 
 class KeepAliveMessage(BGPMessage):
     """
@@ -190,6 +520,27 @@ class OpenMessage(BGPMessage):
         self.hold_time = hold_time
         self.bgp_id = bgp_id
 
+    def encode_body(self):
+        my_as = int(self.router_number)
+        return OPEN_BODY.pack(
+            self.version,
+            my_as if my_as <= 0xFFFF else AS_TRANS,
+            self.hold_time,
+            int(ipaddress.IPv4Address(self.bgp_id)),
+            0,  # no optional parameters
+        )
+
+    @classmethod
+    def decode_body(cls, router_number, body):
+        try:
+            version, _, hold_time, bgp_id, _ = OPEN_BODY.unpack_from(body)
+        except struct.error as e:
+            raise NotificationMessage(router_number, (3, 1)) from e
+
+        message = cls(router_number, str(ipaddress.IPv4Address(bgp_id)), hold_time)
+        message.version = version
+        return message
+
     def verify(self):
         self.verify_header()
         if self.version != 4:
@@ -241,14 +592,18 @@ class VotingMessage(BGPMessage):
     +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
     |               TTL             |
     +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
-    |    Q or A     | Num. of peers |
-    +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
-    |             Origin            |
-    +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
-    |        Peer in question       |
-    +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
-    |           Vote value          |
+    |    Q or A     |
     +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+    |         Num. of peers         |
+    +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+    |                             Origin                            |
+    +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+    |                        Peer in question                       |
+    +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+    |                                                               |
+    +                           Vote value                          +
+    |                                                               |
+    +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
 
     We decided to make the Voting message similar to the Open message.
     The Voting message will contain the "TTL" value which will tell the
@@ -265,7 +620,10 @@ class VotingMessage(BGPMessage):
 
     Peer in question - the peer the router must vote for
 
-    Vote value - the value of the vote a router provides for the query
+    Vote value - the value of the vote a router provides for the query, encoded
+    as a double. NaN is used when no vote is set.
+
+    AS numbers are 4 octets wide, so the simulation can grow past 65535 AS's.
 
     Once a router receives a voting message with the TTL value 0, it returns it
     to the peer in question, which forwards it to the origin. The origin updates its
@@ -275,7 +633,7 @@ class VotingMessage(BGPMessage):
     def __init__(
         self, router_number, origin, q_or_a, peer_in_question, vote_value=None
     ):
-        super().__init__(router_number, 29)
+        super().__init__(router_number, 19 + VOTING_BODY.size)
         self.msg_type = Message.VOTING
         self.voting_type = q_or_a
         self.num_of_2nd_neighbours = 0
@@ -284,7 +642,42 @@ class VotingMessage(BGPMessage):
         self.peer_in_question = peer_in_question
         self.vote_value = vote_value
 
-        self.min_length = 19 + 10  # bytes
+        self.min_length = 19 + VOTING_BODY.size  # bytes
+
+    def encode_body(self):
+        return VOTING_BODY.pack(
+            self.ttl,
+            self.voting_type,
+            self.num_of_2nd_neighbours,
+            int(self.origin),
+            int(self.peer_in_question),
+            math.nan if self.vote_value is None else self.vote_value,
+        )
+
+    @classmethod
+    def decode_body(cls, router_number, body):
+        try:
+            (
+                ttl,
+                q_or_a,
+                num_of_2nd_neighbours,
+                origin,
+                peer_in_question,
+                vote_value,
+            ) = VOTING_BODY.unpack_from(body)
+        except struct.error as e:
+            raise NotificationMessage(router_number, (3, 1)) from e
+
+        message = cls(
+            router_number,
+            origin,
+            q_or_a,
+            peer_in_question,
+            None if math.isnan(vote_value) else vote_value,
+        )
+        message.ttl = ttl
+        message.num_of_2nd_neighbours = num_of_2nd_neighbours
+        return message
 
     def verify(self):
         self.verify_header()
@@ -345,6 +738,18 @@ class NotificationMessage(BGPMessage, Exception):
         super().__init__(router_number, 21)
         self.msg_type = Message.NOTIFICATION
         self.min_length = 21  # octets
+        self.error_subcode = error_subcode
+
+    def encode_body(self):
+        # the error is sent as the (code, subcode) key of error_sub_code
+        return NOTIFICATION_BODY.pack(*self.error_subcode)
+
+    @classmethod
+    def decode_body(cls, router_number, body):
+        try:
+            return cls(router_number, NOTIFICATION_BODY.unpack_from(body))
+        except struct.error as e:
+            raise NotificationMessage(router_number, (3, 1)) from e
 
     error_code = {
         1: "Message Header Error",
@@ -386,6 +791,17 @@ class NotificationMessage(BGPMessage, Exception):
     }
 
 
+MESSAGE_CLASSES = {
+    Message.MESSAGE: BGPMessage,
+    Message.OPEN: OpenMessage,
+    Message.UPDATE: UpdateMessage,
+    Message.NOTIFICATION: NotificationMessage,
+    Message.KEEPALIVE: KeepAliveMessage,
+    Message.TRUSTRATE: TrustRateMessage,
+    Message.VOTING: VotingMessage,
+}
+
+
 class FiniteStateMachineError(Exception):
     # BGP Finite State
     #    Machine Error
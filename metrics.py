@@ -0,0 +1,198 @@
+"""
+Metrics of the routers.
+
+A MetricsRegistry holds counters, gauges and histograms, every one of them
+with a fixed set of label names, such as the router and the message type.
+The routers record into the metrics of the registry they were given, and a
+snapshot of all the metrics can be taken at any point, as a dict, as JSON or
+in the Prometheus text format.
+
+Values the routers keep track of anyway, like the size of their RIB, are not
+recorded again: the router registers a function returning them, which only
+runs when a snapshot is taken.
+
+Routers without a registry get DISABLED, whose metrics are shared objects
+doing nothing, so the metrics cost close to nothing when they are off.
+Recording a value is not locked, each router only records values under its
+own labels.
+"""
+import bisect
+import json
+
+# upper bounds in seconds of the buckets of the latency histograms
+LATENCY_BUCKETS = (
+    0.00001,
+    0.00005,
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        # the value of every combination of labels
+        self.values = {}
+        self.collectors = []
+
+    def collect_from(self, function):
+        """
+        Adds the values returned by the function, a dict of the label values
+        to the value, to the values of the metric on every snapshot.
+        """
+        self.collectors.append(function)
+
+    def samples(self):
+        """The (name suffix, labels, value) of every value of the metric"""
+        values = self.values.copy()
+        for collect in self.collectors:
+            for labels, value in collect().items():
+                values[labels] = values.get(labels, 0) + value
+        return [("", labels, value) for labels, value in sorted(values.items())]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, labels, value):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = buckets
+
+    def observe(self, labels, value):
+        histogram = self.values.get(labels)
+        if histogram is None:
+            # the count of every bucket, plus the overflow, then sum and count
+            histogram = self.values[labels] = [0] * (len(self.buckets) + 1) + [0, 0]
+        histogram[bisect.bisect_left(self.buckets, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def samples(self):
+        samples = []
+        for labels, histogram in sorted(self.values.copy().items()):
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), histogram):
+                total += count
+                samples.append(("_bucket", labels + (str(bound),), total))
+            samples.append(("_sum", labels, histogram[-2]))
+            samples.append(("_count", labels, histogram[-1]))
+        return samples
+
+
+class NullMetric:
+    """Stands in for every metric of a disabled registry"""
+
+    def inc(self, labels=(), amount=1):
+        pass
+
+    def set(self, labels, value):
+        pass
+
+    def observe(self, labels, value):
+        pass
+
+    def collect_from(self, function):
+        pass
+
+
+NULL_METRIC = NullMetric()
+
+
+class MetricsRegistry:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.metrics = {}
+
+    def get_metric(self, cls, name, description, label_names, **kwargs):
+        if not self.enabled:
+            return NULL_METRIC
+
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, description, label_names, **kwargs)
+        elif not isinstance(metric, cls) or metric.label_names != label_names:
+            raise ValueError(f"Metric {name} already exists with other labels")
+        return metric
+
+    def counter(self, name, description, label_names=()):
+        return self.get_metric(Counter, name, description, label_names)
+
+    def gauge(self, name, description, label_names=()):
+        return self.get_metric(Gauge, name, description, label_names)
+
+    def histogram(self, name, description, label_names=(), buckets=LATENCY_BUCKETS):
+        return self.get_metric(
+            Histogram, name, description, label_names, buckets=buckets
+        )
+
+    def snapshot(self):
+        """All the metrics and their current values, as a dict"""
+        snapshot = {}
+        for name, metric in sorted(self.metrics.items()):
+            label_names = metric.label_names
+            bucket_labels = label_names + ("le",)
+            samples = []
+            for suffix, labels, value in metric.samples():
+                names = bucket_labels if suffix == "_bucket" else label_names
+                samples.append(
+                    {
+                        "name": name + suffix,
+                        "labels": dict(zip(names, labels)),
+                        "value": value,
+                    }
+                )
+            snapshot[name] = {
+                "type": metric.kind,
+                "help": metric.description,
+                "samples": samples,
+            }
+        return snapshot
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """A snapshot of all the metrics in the Prometheus text format"""
+        lines = []
+        for name, family in self.snapshot().items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for sample in family["samples"]:
+                labels = ",".join(
+                    f'{key}="{escape(value)}"'
+                    for key, value in sample["labels"].items()
+                )
+                if labels:
+                    labels = "{" + labels + "}"
+                lines.append(f"{sample['name']}{labels} {sample['value']}")
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+DISABLED = MetricsRegistry(enabled=False)
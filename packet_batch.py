@@ -0,0 +1,327 @@
+"""
+Batches of IP packets.
+
+A PacketBatch holds the headers of many packets as NumPy arrays, one array
+per header field, with the payloads of all the packets one after another in
+a single buffer. Validating the packets, decreasing their TTL and updating
+their checksums then happens for the whole batch at once, instead of packet
+by packet.
+
+Operations that drop packets return a boolean mask of the packets to keep,
+which select() turns into a new, smaller batch.
+
+On the wire, a batch is a header of BATCH_MAGIC, the number of packets and
+the size of the payload buffer, followed by every header field array, the
+payload offsets and the payload buffer, all in network byte order, see
+PacketBatch.to_bytes().
+"""
+import ipaddress
+import struct
+
+import numpy
+
+from ip_packet import IPPacket
+
+# the "don't fragment" flag, as set by IPPacket
+DONT_FRAGMENT = 0b010 << 13
+
+# starts with a 5, so it can't be taken for an IPv4 packet
+BATCH_MAGIC = b"PKTB"
+BATCH_HEADER = struct.Struct("!4sIQ")  # magic, packet count, payload size
+# the arrays of a batch on the wire, in order, with their big-endian types
+WIRE_FIELDS = (
+    ("version", ">u1"),
+    ("ihl", ">u1"),
+    ("type_of_service", ">u1"),
+    ("total_length", ">u2"),
+    ("identification", ">u2"),
+    ("flags_fragment", ">u2"),
+    ("ttl", ">u1"),
+    ("protocol", ">u1"),
+    ("checksum", ">u2"),
+    ("source_addr", ">u4"),
+    ("destination_addr", ">u4"),
+)
+
+
+class PacketBatch:
+    def __init__(
+        self,
+        version,
+        ihl,
+        type_of_service,
+        total_length,
+        identification,
+        flags_fragment,
+        ttl,
+        protocol,
+        checksum,
+        source_addr,
+        destination_addr,
+        payloads,
+        payload_offsets,
+    ):
+        self.version = numpy.asarray(version, dtype=numpy.uint8)
+        self.ihl = numpy.asarray(ihl, dtype=numpy.uint8)
+        self.type_of_service = numpy.asarray(type_of_service, dtype=numpy.uint8)
+        self.total_length = numpy.asarray(total_length, dtype=numpy.uint16)
+        self.identification = numpy.asarray(identification, dtype=numpy.uint16)
+        self.flags_fragment = numpy.asarray(flags_fragment, dtype=numpy.uint16)
+        self.ttl = numpy.asarray(ttl, dtype=numpy.uint8)
+        self.protocol = numpy.asarray(protocol, dtype=numpy.uint8)
+        self.checksum = numpy.asarray(checksum, dtype=numpy.uint16)
+        self.source_addr = numpy.asarray(source_addr, dtype=numpy.uint32)
+        self.destination_addr = numpy.asarray(destination_addr, dtype=numpy.uint32)
+
+        # packet i has the payload between payload_offsets[i] and [i + 1]
+        self.payloads = numpy.asarray(payloads, dtype=numpy.uint8)
+        self.payload_offsets = numpy.asarray(payload_offsets, dtype=numpy.int64)
+
+    @classmethod
+    def create(
+        cls,
+        source_addr,
+        destination_addr,
+        payloads,
+        ttl=60,
+        ip_header_length=5,
+        protocol=6,
+    ):
+        """
+        Creates a batch of new packets with valid checksums. The addresses
+        are arrays of integers, the payloads a list of strings.
+        """
+        destination_addr = numpy.asarray(destination_addr, dtype=numpy.uint32)
+        size = len(destination_addr)
+        encoded = [payload.encode("utf-8") for payload in payloads]
+        lengths = numpy.fromiter((len(p) for p in encoded), numpy.int64, size)
+
+        batch = cls(
+            numpy.full(size, 4),
+            numpy.full(size, ip_header_length),
+            numpy.zeros(size),
+            ip_header_length * 4 + lengths,
+            numpy.zeros(size),
+            numpy.full(size, DONT_FRAGMENT),
+            numpy.broadcast_to(ttl, size),
+            numpy.full(size, protocol),
+            numpy.zeros(size),
+            numpy.broadcast_to(source_addr, size),
+            destination_addr,
+            numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8),
+            numpy.concatenate(([0], numpy.cumsum(lengths))),
+        )
+        batch.generate_new_checksums()
+        return batch
+
+    @classmethod
+    def from_packets(cls, packets):
+        encoded = [packet.get_payload().encode("utf-8") for packet in packets]
+        lengths = [len(payload) for payload in encoded]
+        return cls(
+            [packet.version for packet in packets],
+            [packet.hl for packet in packets],
+            [packet.type_of_service for packet in packets],
+            [packet.total_length for packet in packets],
+            [packet.identification for packet in packets],
+            [
+                (int(packet.fragment_flags, 2) << 13) | packet.fragment_offset
+                for packet in packets
+            ],
+            [packet.ttl for packet in packets],
+            [packet.protocol for packet in packets],
+            [packet.header_checksum for packet in packets],
+            [int(ipaddress.IPv4Address(p.source_addr)) for p in packets],
+            [int(ipaddress.IPv4Address(p.destination_addr)) for p in packets],
+            numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8),
+            numpy.concatenate(([0], numpy.cumsum(lengths, dtype=numpy.int64))),
+        )
+
+    def to_packets(self):
+        packets = []
+        for i in range(len(self)):
+            packet = IPPacket(
+                int(self.total_length[i]),
+                int(self.ihl[i]),
+                int(self.ttl[i]),
+                str(ipaddress.IPv4Address(int(self.source_addr[i]))),
+                str(ipaddress.IPv4Address(int(self.destination_addr[i]))),
+                self.get_payload(i),
+            )
+            packet.type_of_service = int(self.type_of_service[i])
+            packet.identification = int(self.identification[i])
+            packet.fragment_flags = format(int(self.flags_fragment[i]) >> 13, "03b")
+            packet.fragment_offset = int(self.flags_fragment[i]) & 0x1FFF
+            packet.protocol = int(self.protocol[i])
+            packet.generate_new_checksum()
+            packets.append(packet)
+        return packets
+
+    def to_bytes(self):
+        parts = [BATCH_HEADER.pack(BATCH_MAGIC, len(self), len(self.payloads))]
+        for name, dtype in WIRE_FIELDS:
+            parts.append(getattr(self, name).astype(dtype).tobytes())
+        parts.append(self.payload_offsets.astype(">u8").tobytes())
+        parts.append(self.payloads.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Reads a batch written by to_bytes(), raising a ValueError for
+        anything else.
+        """
+        if len(data) < BATCH_HEADER.size:
+            raise ValueError(f"Packet batch of {len(data)} bytes is too short")
+        magic, size, payload_size = BATCH_HEADER.unpack_from(data)
+        if magic != BATCH_MAGIC:
+            raise ValueError("Not a packet batch")
+
+        expected = (
+            BATCH_HEADER.size
+            + size * sum(numpy.dtype(dtype).itemsize for _, dtype in WIRE_FIELDS)
+            + (size + 1) * 8
+            + payload_size
+        )
+        if len(data) != expected:
+            raise ValueError(
+                f"Packet batch of {len(data)} bytes, expected {expected} bytes"
+            )
+
+        fields = []
+        offset = BATCH_HEADER.size
+        for dtype in [dtype for _, dtype in WIRE_FIELDS] + [">u8"]:
+            count = size + 1 if dtype == ">u8" else size
+            fields.append(numpy.frombuffer(data, dtype, count, offset))
+            offset += count * numpy.dtype(dtype).itemsize
+        payload_offsets = fields.pop()
+        if (
+            payload_offsets[0] != 0
+            or payload_offsets[-1] != payload_size
+            or numpy.any(numpy.diff(payload_offsets.astype(numpy.int64)) < 0)
+        ):
+            raise ValueError("Packet batch with invalid payload offsets")
+
+        return cls(
+            *fields,
+            numpy.frombuffer(data, numpy.uint8, payload_size, offset),
+            payload_offsets,
+        )
+
+    def __len__(self):
+        return len(self.destination_addr)
+
+    def get_payload(self, i):
+        start, end = self.payload_offsets[i], self.payload_offsets[i + 1]
+        return self.payloads[start:end].tobytes().decode("utf-8")
+
+    def select(self, mask):
+        """
+        A new batch with only the packets the mask is true for.
+        """
+        lengths = numpy.diff(self.payload_offsets)[mask]
+        starts = self.payload_offsets[:-1][mask]
+        offsets = numpy.concatenate(([0], numpy.cumsum(lengths)))
+        # index of every payload byte that is kept, in the old payload buffer
+        index = numpy.repeat(starts - offsets[:-1], lengths) + numpy.arange(
+            offsets[-1]
+        )
+
+        return PacketBatch(
+            self.version[mask],
+            self.ihl[mask],
+            self.type_of_service[mask],
+            self.total_length[mask],
+            self.identification[mask],
+            self.flags_fragment[mask],
+            self.ttl[mask],
+            self.protocol[mask],
+            self.checksum[mask],
+            self.source_addr[mask],
+            self.destination_addr[mask],
+            self.payloads[index],
+            offsets,
+        )
+
+    def header_words(self, with_checksum=True):
+        """
+        The 16 bit words of the headers (without options), one row per packet.
+        """
+        if with_checksum:
+            checksum = self.checksum
+        else:
+            checksum = numpy.zeros(len(self), dtype=numpy.uint16)
+
+        return numpy.stack(
+            [
+                (self.version.astype(numpy.uint32) << 12)
+                | (self.ihl.astype(numpy.uint32) << 8)
+                | self.type_of_service,
+                self.total_length,
+                self.identification,
+                self.flags_fragment,
+                (self.ttl.astype(numpy.uint32) << 8) | self.protocol,
+                checksum,
+                self.source_addr >> 16,
+                self.source_addr & 0xFFFF,
+                self.destination_addr >> 16,
+                self.destination_addr & 0xFFFF,
+            ],
+            axis=1,
+        ).astype(numpy.uint32)
+
+    @staticmethod
+    def ones_complement_sum(words):
+        total = words.sum(axis=1, dtype=numpy.uint32)
+        # fold the carries back in, twice is enough for up to 10 words
+        total = (total & 0xFFFF) + (total >> 16)
+        total = (total & 0xFFFF) + (total >> 16)
+        return total.astype(numpy.uint16)
+
+    def generate_new_checksums(self):
+        self.checksum = ~self.ones_complement_sum(self.header_words(False))
+        return self.checksum
+
+    def valid_checksums(self):
+        return self.ones_complement_sum(self.header_words()) == 0xFFFF
+
+    def validate(self):
+        """
+        The mask of the packets passing the header validation.
+        """
+        return (
+            (self.total_length >= 20)
+            & self.valid_checksums()
+            & (self.version == 4)
+            & (self.ihl >= 5)
+            & (self.total_length >= self.ihl.astype(numpy.uint16) * 4)
+        )
+
+    def decrease_ttl(self):
+        """
+        Decreases the TTL of all the packets, and returns the mask of the
+        packets that are still alive. The checksums are updated incrementally
+        (RFC 1624), as only the TTL/Protocol word changes.
+        """
+        alive = self.ttl > 1
+        old_words = (self.ttl.astype(numpy.uint32) << 8) | self.protocol
+        self.ttl = numpy.where(self.ttl > 0, self.ttl - 1, 0).astype(numpy.uint8)
+        new_words = (self.ttl.astype(numpy.uint32) << 8) | self.protocol
+
+        # HC' = ~(~HC + ~m + m')
+        words = numpy.stack(
+            [
+                ~self.checksum.astype(numpy.uint32) & 0xFFFF,
+                ~old_words & 0xFFFF,
+                new_words,
+            ],
+            axis=1,
+        )
+        self.checksum = ~self.ones_complement_sum(words)
+        return alive
+
+    def destination_mask(self, network):
+        """The mask of the packets with a destination inside the network"""
+        network = ipaddress.IPv4Network(network, strict=False)
+        netmask = numpy.uint32(int(network.netmask))
+        return (self.destination_addr & netmask) == int(network.network_address)
@@ -0,0 +1,120 @@
+"""
+Interned path attributes.
+
+Most routes share their path attributes with many others, in the same router
+and in all the other routers of the simulation. A PathAttributes is an
+immutable set of attributes, and creating one returns the existing instance
+if the same attributes already exist anywhere in the process. Routes then
+only hold a reference to the shared set, and two sets of attributes are the
+same exactly when they are the same object.
+
+Sets nothing refers to anymore are freed, the intern table only keeps weak
+references to them.
+
+ORIGIN, MED, LOC_PREF and WEIGHT go on the wire as 4 octet unsigned integers,
+so a set with any other value of them can't be created.
+"""
+import threading
+import weakref
+
+from as_path import ASPath
+
+# the attributes of a set, along with the path attribute name they come from
+FIELDS = (
+    ("origin", "ORIGIN"),
+    ("next_hop", "NEXT_HOP"),
+    ("med", "MED"),
+    ("loc_pref", "LOC_PREF"),
+    ("weight", "WEIGHT"),
+    ("trust_rate", "TRUST_RATE"),
+    ("as_path", "AS_PATH"),
+)
+
+MAX_UINT32 = 2**32 - 1
+
+_interned = weakref.WeakValueDictionary()
+# routers running in threads intern at the same time
+_intern_lock = threading.Lock()
+
+
+class PathAttributes:
+    __slots__ = (
+        "origin",
+        "next_hop",
+        "med",
+        "loc_pref",
+        "weight",
+        "trust_rate",
+        "as_path",
+        "path_length",
+        "hash",
+        "__weakref__",
+    )
+
+    def __new__(cls, origin, next_hop, med, loc_pref, weight, trust_rate, as_path):
+        values = (
+            unsigned_32("ORIGIN", origin),
+            next_hop,
+            unsigned_32("MED", med),
+            unsigned_32("LOC_PREF", loc_pref),
+            unsigned_32("WEIGHT", weight),
+            float(trust_rate),
+            ASPath.parse(as_path),
+        )
+
+        with _intern_lock:
+            attributes = _interned.get(values)
+            if attributes is not None:
+                return attributes
+
+            attributes = super().__new__(cls)
+            for (name, _), value in zip(FIELDS, values):
+                object.__setattr__(attributes, name, value)
+            object.__setattr__(attributes, "path_length", len(values[-1]))
+            object.__setattr__(attributes, "hash", hash(values))
+            _interned[values] = attributes
+            return attributes
+
+    @classmethod
+    def from_dict(cls, path_attr):
+        return cls(*(path_attr[key] for _, key in FIELDS))
+
+    def to_dict(self):
+        return {key: getattr(self, name) for name, key in FIELDS}
+
+    def replace(self, **changes):
+        """The interned set with the passed attributes changed"""
+        values = {name: getattr(self, name) for name, _ in FIELDS}
+        values.update(changes)
+        return PathAttributes(**values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("path attributes can't be changed")
+
+    def __hash__(self):
+        return self.hash
+
+    def __reduce__(self):
+        # unpickling interns the set again
+        return PathAttributes, tuple(getattr(self, name) for name, _ in FIELDS)
+
+    def __repr__(self):
+        return f"PathAttributes({self.to_dict()})"
+
+
+def unsigned_32(name, value):
+    """The value of the attribute as an integer, if it fits in 4 octets"""
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"{name} has to be an integer, not {value}")
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} has to be an integer, not {value!r}") from None
+    if not 0 <= number <= MAX_UINT32:
+        raise ValueError(f"{name} has to be between 0 and {MAX_UINT32}, not {number}")
+    return number
+
+
+def interned_count():
+    """Number of distinct path attribute sets currently alive"""
+    return len(_interned)
@@ -0,0 +1,192 @@
+"""
+Path-compressed binary trie for longest-prefix matching of IPv4 addresses.
+
+The prefixes are kept as a 32-bit integer along with their length. A node
+only exists where a prefix is stored or where two prefixes branch off, so a
+lookup follows at most 32 nodes no matter how many prefixes the trie holds,
+and usually a lot fewer.
+"""
+import ipaddress
+
+ADDRESS_BITS = 32
+
+
+def mask(address, length):
+    """The first length bits of the address, the rest set to 0"""
+    if length == 0:
+        return 0
+    return address & ~((1 << (ADDRESS_BITS - length)) - 1) & 0xFFFFFFFF
+
+
+def bit_at(address, position):
+    """The bit of the address at the position, counting from the left"""
+    return (address >> (ADDRESS_BITS - 1 - position)) & 1
+
+
+def common_length(a, b, limit):
+    """The number of leading bits the addresses share, up to limit"""
+    differing = (a ^ b) & 0xFFFFFFFF
+    if not differing:
+        return limit
+    return min(limit, ADDRESS_BITS - differing.bit_length())
+
+
+def parse_prefix(prefix):
+    """Turns a prefix such as "100.1.1.0/24" into the pair of address and length"""
+    network = ipaddress.IPv4Network(prefix, strict=False)
+    return int(network.network_address), network.prefixlen
+
+
+class Node:
+    __slots__ = ("prefix", "length", "value", "has_value", "children")
+
+    def __init__(self, prefix, length):
+        self.prefix = prefix
+        self.length = length
+        self.value = None
+        self.has_value = False
+        self.children = [None, None]
+
+    def set_value(self, value):
+        self.value = value
+        self.has_value = True
+
+
+class RadixTrie:
+    def __init__(self):
+        # the root stands for 0.0.0.0/0 and is never removed
+        self.root = Node(0, 0)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, prefix, length, value):
+        """
+        Stores the value for the prefix, replacing the value the prefix
+        already had.
+        """
+        prefix = mask(prefix, length)
+        node = self.root
+
+        while True:
+            if node.length == length:
+                if not node.has_value:
+                    self.size += 1
+                node.set_value(value)
+                return
+
+            bit = bit_at(prefix, node.length)
+            child = node.children[bit]
+
+            if child is None:
+                node.children[bit] = Node(prefix, length)
+                node.children[bit].set_value(value)
+                self.size += 1
+                return
+
+            common = common_length(prefix, child.prefix, min(length, child.length))
+            if common == child.length:
+                node = child
+                continue
+
+            # the new prefix branches off somewhere along the edge to the child
+            if common == length:
+                new = Node(prefix, length)
+                new.set_value(value)
+                new.children[bit_at(child.prefix, length)] = child
+            else:
+                new = Node(mask(prefix, common), common)
+                leaf = Node(prefix, length)
+                leaf.set_value(value)
+                new.children[bit_at(prefix, common)] = leaf
+                new.children[bit_at(child.prefix, common)] = child
+
+            node.children[bit] = new
+            self.size += 1
+            return
+
+    def find(self, prefix, length):
+        """The node holding exactly the prefix, None if there is none"""
+        prefix = mask(prefix, length)
+        node = self.root
+
+        while node is not None and node.length < length:
+            node = node.children[bit_at(prefix, node.length)]
+            if node is not None and mask(prefix, node.length) != node.prefix:
+                return None
+
+        if node is None or node.length != length or not node.has_value:
+            return None
+        return node
+
+    def get(self, prefix, length, default=None):
+        node = self.find(prefix, length)
+        return default if node is None else node.value
+
+    def delete(self, prefix, length):
+        """
+        Removes the prefix, along with the nodes that are no longer needed
+        for branching. Raises KeyError if the prefix is not stored.
+        """
+        prefix = mask(prefix, length)
+        parents = []
+        node = self.root
+
+        while node is not None and node.length < length:
+            bit = bit_at(prefix, node.length)
+            parents.append((node, bit))
+            node = node.children[bit]
+            if node is not None and mask(prefix, node.length) != node.prefix:
+                node = None
+
+        if node is None or node.length != length or not node.has_value:
+            raise KeyError((prefix, length))
+
+        node.value = None
+        node.has_value = False
+        self.size -= 1
+
+        # a node without a value is only kept while it has two children
+        while parents and not node.has_value:
+            parent, bit = parents.pop()
+            children = [child for child in node.children if child is not None]
+            if len(children) == 2:
+                break
+            parent.children[bit] = children[0] if children else None
+            node = parent
+
+    def lookup(self, address):
+        """
+        The value of the longest prefix matching the address, None if no
+        prefix matches.
+        """
+        node = self.root
+        best = None
+
+        while node is not None:
+            if node.length and mask(address, node.length) != node.prefix:
+                break
+            if node.has_value:
+                best = node.value
+            if node.length == ADDRESS_BITS:
+                break
+            node = node.children[bit_at(address, node.length)]
+
+        return best
+
+    def lookup_batch(self, addresses):
+        """The values of the longest prefixes matching each of the addresses"""
+        lookup = self.lookup
+        return [lookup(address) for address in addresses]
+
+    def items(self):
+        """Iterates over the triples of prefix, length and value, in order"""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.has_value:
+                yield node.prefix, node.length, node.value
+            for child in reversed(node.children):
+                if child is not None:
+                    stack.append(child)
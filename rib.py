@@ -0,0 +1,370 @@
+"""
+Routing information base of a router.
+
+The routes are stored column by column rather than as Python objects. The
+prefix and the trust rate of a route are kept in typed arrays, the prefixes
+being interned so the column only holds their number. The other attributes
+are held as a reference to an interned PathAttributes, shared with all the
+routes in the process that have the same attributes (see path_attributes.py).
+
+Every route gets a route id, which is its row in the columns. The id stays
+the same for as long as the route exists; removing a route puts its row on a
+free list, to be reused by the next route added.
+
+The prefixes holding at least one route are also kept in a radix trie, for
+the longest-prefix match of the destinations of packets, along with the best
+of their routes (the Loc-RIB). The best route of a prefix is only selected
+again when one of the routes of that prefix is added, changed or removed, so
+forwarding a packet does not run the decision process at all.
+
+Routes learned from a peer are also indexed by the pair of peer and prefix,
+which makes the table the Adj-RIB-In of all the peers. A peer announcing a
+prefix again replaces the route it announced before (implicit withdrawal),
+and withdrawing the prefix removes it.
+"""
+from array import array
+
+from as_path import ASPath
+from radix_trie import RadixTrie, parse_prefix
+
+# the columns of the table, in the order they are shown in
+COLUMNS = (
+    "NETWORK",
+    "NEXT_HOP",
+    "MED",
+    "LOC_PREF",
+    "WEIGHT",
+    "TRUST_RATE",
+    "AS_PATH",
+)
+# the columns taken from the path attributes of the route
+ATTRIBUTE_COLUMNS = {
+    "NEXT_HOP": "next_hop",
+    "MED": "med",
+    "LOC_PREF": "loc_pref",
+    "WEIGHT": "weight",
+    "AS_PATH": "as_path",
+}
+
+
+class InternTable:
+    """
+    Maps the values to small numbers and back. Values are never forgotten,
+    as there are only so many different prefixes, next hops and AS paths.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.numbers = {}
+
+    def intern(self, value):
+        number = self.numbers.get(value)
+        if number is None:
+            number = len(self.values)
+            self.numbers[value] = number
+            self.values.append(value)
+        return number
+
+    def lookup(self, value):
+        """The number of the value, None if it was never interned"""
+        return self.numbers.get(value)
+
+    def __getitem__(self, number):
+        return self.values[number]
+
+
+class RIB:
+    def __init__(self):
+        self.columns = {
+            "NETWORK": array("I"),
+            # the trust rate of the route as seen from this router, rather
+            # than the one in its path attributes
+            "TRUST_RATE": array("d"),
+        }
+        # the interned path attributes of every route
+        self.attributes = []
+        # the peer every route was learned from, -1 if none
+        self.peers = array("l")
+        self.interned = {"NETWORK": InternTable()}
+        # 1 for the rows holding a route, 0 for the free ones
+        self.live = bytearray()
+        self.free_rows = []
+        # route ids of every prefix, by the number of the prefix
+        self.prefix_routes = {}
+        # the numbers of the prefixes, by their address and length
+        self.trie = RadixTrie()
+        # best route id of every prefix, along with its preference key
+        self.best_routes = {}
+        self.best_keys = {}
+        # route id of every pair of peer and prefix number
+        self.peer_routes = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, route_id):
+        return (
+            isinstance(route_id, int)
+            and 0 <= route_id < len(self.live)
+            and self.live[route_id] == 1
+        )
+
+    def __iter__(self):
+        """Iterates over the route ids, in the order of their rows"""
+        for route_id, live in enumerate(self.live):
+            if live:
+                yield route_id
+
+    def add(self, network, attributes, trust_rate, peer=None):
+        """
+        Adds a route with the passed PathAttributes and returns its route id.
+        Use announce() instead for the routes learned from a peer.
+        """
+        network = self.interned["NETWORK"].intern(network)
+        peer_value = -1 if peer is None else peer
+
+        if self.free_rows:
+            route_id = self.free_rows.pop()
+            self.columns["NETWORK"][route_id] = network
+            self.columns["TRUST_RATE"][route_id] = trust_rate
+            self.attributes[route_id] = attributes
+            self.peers[route_id] = peer_value
+            self.live[route_id] = 1
+        else:
+            route_id = len(self.live)
+            self.columns["NETWORK"].append(network)
+            self.columns["TRUST_RATE"].append(trust_rate)
+            self.attributes.append(attributes)
+            self.peers.append(peer_value)
+            self.live.append(1)
+
+        self.add_prefix_route(network, route_id)
+        if peer is not None:
+            self.peer_routes[(peer, network)] = route_id
+        self.size += 1
+        return route_id
+
+    def peer_route(self, peer, network):
+        """The id of the route the peer announced for the prefix, if any"""
+        number = self.interned["NETWORK"].lookup(network)
+        return self.peer_routes.get((peer, number))
+
+    def announce(self, peer, network, attributes, trust_rate):
+        """
+        Stores the route the peer announced for the prefix, replacing the one
+        it announced before. Returns the route id, or None if the route was
+        already known as it is.
+        """
+        route_id = self.peer_route(peer, network)
+        if route_id is None:
+            return self.add(network, attributes, trust_rate, peer)
+
+        # interned attributes are the same only if they are the same object
+        if (
+            self.attributes[route_id] is attributes
+            and self.columns["TRUST_RATE"][route_id] == trust_rate
+        ):
+            return None
+
+        self.attributes[route_id] = attributes
+        self.columns["TRUST_RATE"][route_id] = trust_rate
+        self.update_best_route(self.columns["NETWORK"][route_id], route_id)
+        return route_id
+
+    def withdraw(self, peer, network):
+        """
+        Removes the route the peer announced for the prefix. Returns its
+        route id, or None if the peer had no route for the prefix.
+        """
+        route_id = self.peer_route(peer, network)
+        if route_id is not None:
+            self.remove(route_id)
+        return route_id
+
+    def drop_peer_route(self, network, route_id):
+        key = (self.peers[route_id], network)
+        if self.peer_routes.get(key) == route_id:
+            del self.peer_routes[key]
+
+    def add_prefix_route(self, network, route_id):
+        if network not in self.prefix_routes:
+            self.prefix_routes[network] = set()
+            prefix, length = parse_prefix(self.interned["NETWORK"][network])
+            self.trie.insert(prefix, length, network)
+        self.prefix_routes[network].add(route_id)
+        self.update_best_route(network, route_id)
+
+    def remove_prefix_route(self, network, route_id):
+        routes = self.prefix_routes[network]
+        routes.discard(route_id)
+        if not routes:
+            del self.prefix_routes[network]
+            del self.best_routes[network]
+            del self.best_keys[network]
+            self.trie.delete(*parse_prefix(self.interned["NETWORK"][network]))
+        elif self.best_routes[network] == route_id:
+            self.select_best_route(network)
+
+    def route_key(self, route_id):
+        """
+        The preference key of the route, the best route has the lowest one.
+        Preferences:
+        1. the path with the highest WEIGHT
+        2. the path with the highest LOC_PREF
+        3. the path with the lowest TRUST_RATE
+        4. the path with the shortest AS_PATH
+        5. the path with the lowest MED
+        6. the route added first
+        """
+        attributes = self.attributes[route_id]
+        return (
+            -attributes.weight,
+            -attributes.loc_pref,
+            self.columns["TRUST_RATE"][route_id],
+            attributes.path_length,
+            attributes.med,
+            route_id,
+        )
+
+    def select_best_route(self, network):
+        """Runs the decision process over all the routes of the prefix"""
+        key, route_id = min(
+            (self.route_key(route_id), route_id)
+            for route_id in self.prefix_routes[network]
+        )
+        self.best_routes[network] = route_id
+        self.best_keys[network] = key
+
+    def update_best_route(self, network, route_id):
+        """
+        Updates the best route of the prefix, after the route was added or
+        its attributes were changed.
+        """
+        if self.best_routes.get(network) == route_id:
+            # the best route might have gotten worse than the others
+            self.select_best_route(network)
+            return
+
+        key = self.route_key(route_id)
+        if network not in self.best_keys or key < self.best_keys[network]:
+            self.best_routes[network] = route_id
+            self.best_keys[network] = key
+
+    def best_route(self, network):
+        """The id of the best route for the prefix, None if there is none"""
+        number = self.interned["NETWORK"].lookup(network)
+        return self.best_routes.get(number)
+
+    def remove(self, route_id):
+        if route_id not in self:
+            raise KeyError(route_id)
+
+        network = self.columns["NETWORK"][route_id]
+        self.remove_prefix_route(network, route_id)
+        self.drop_peer_route(network, route_id)
+        self.live[route_id] = 0
+        self.free_rows.append(route_id)
+        self.size -= 1
+
+    def get(self, route_id, column):
+        if route_id not in self:
+            raise KeyError(route_id)
+
+        if column in ATTRIBUTE_COLUMNS:
+            return getattr(self.attributes[route_id], ATTRIBUTE_COLUMNS[column])
+
+        value = self.columns[column][route_id]
+        if column in self.interned:
+            return self.interned[column][value]
+        return value
+
+    def get_attributes(self, route_id):
+        if route_id not in self:
+            raise KeyError(route_id)
+        return self.attributes[route_id]
+
+    def set(self, route_id, column, value):
+        if route_id not in self:
+            raise KeyError(route_id)
+
+        if column == "NETWORK":
+            # move the route over to the routes of the new prefix
+            self.remove_prefix_route(self.columns[column][route_id], route_id)
+            self.drop_peer_route(self.columns[column][route_id], route_id)
+            value = self.interned[column].intern(value)
+            self.add_prefix_route(value, route_id)
+            if self.peers[route_id] >= 0:
+                self.peer_routes[(self.peers[route_id], value)] = route_id
+            self.columns[column][route_id] = value
+            return
+
+        if column in ATTRIBUTE_COLUMNS:
+            # the attributes are shared, so the route gets its own changed set
+            self.attributes[route_id] = self.attributes[route_id].replace(
+                **{ATTRIBUTE_COLUMNS[column]: value}
+            )
+        else:
+            self.columns[column][route_id] = float(value)
+
+        self.update_best_route(self.columns["NETWORK"][route_id], route_id)
+
+    def route(self, route_id):
+        """All the values of the route, as a dict keyed by the column"""
+        return {column: self.get(route_id, column) for column in COLUMNS}
+
+    def items(self):
+        """Iterates over the pairs of route id and route"""
+        for route_id in self:
+            yield route_id, self.route(route_id)
+
+    def networks(self):
+        """The prefixes the table holds at least one route for"""
+        return [self.interned["NETWORK"][n] for n in self.prefix_routes]
+
+    def routes_for(self, network):
+        """The ids of the routes for the prefix, in the order of their rows"""
+        number = self.interned["NETWORK"].lookup(network)
+        if number is None:
+            return []
+        return sorted(self.prefix_routes.get(number, ()))
+
+    def longest_match(self, address):
+        """
+        The longest prefix holding a route for the address, which is passed
+        as an integer. None if there is no such prefix.
+        """
+        network = self.trie.lookup(address)
+        if network is None:
+            return None
+        return self.interned["NETWORK"][network]
+
+    def longest_matches(self, addresses):
+        """The longest prefixes holding a route for each of the addresses"""
+        networks = self.interned["NETWORK"]
+        return [
+            None if network is None else networks[network]
+            for network in self.trie.lookup_batch(addresses)
+        ]
+
+    def routes_with_path(self, as_path):
+        """The ids of the routes with the AS path, in the order of their rows"""
+        as_path = ASPath.parse(as_path)
+        return [
+            route_id
+            for route_id, attributes in enumerate(self.attributes)
+            if self.live[route_id] and attributes.as_path is as_path
+        ]
+
+    def to_dict(self):
+        """
+        The table as a dict of columns, along with the route ids of the rows,
+        as expected by pandas.DataFrame.
+        """
+        route_ids = list(self)
+        table = {
+            column: [self.get(route_id, column) for route_id in route_ids]
+            for column in COLUMNS
+        }
+        table["AS_PATH"] = [str(as_path) for as_path in table["AS_PATH"]]
+        return table, route_ids
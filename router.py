@@ -15,25 +15,36 @@ it should be done by looking into the RFCs related to BGP and based on what exis
 in the headers in binary format.
 
 4- should you have any question feel free to ask me anytime.
+
+The routers can also run on a single asyncio event loop instead of a thread
+each, in which case all the message scheduling and timers become tasks on that
+loop. How the messages get to the peers is up to the transport of the router,
+see transport.py.
+
+Forwarding IP packets never touches the routing table itself, only the FIB
+snapshot compiled from it, see fib.py.
 """
 
+import asyncio
+import collections
 import ipaddress
 import logging
 import os
-import pickle
 import random
 import sched
-import select
-import socket
 import threading
-from time import sleep
+import time
 
+import numpy
 import pandas
 
 import states
+from adj_rib_out import AdjRibOut
 from events import Event
+from fib import FIB
+from metrics import DISABLED as NO_METRICS
+from packet_batch import PacketBatch
 from messages import (
-    UpdateMessage,
     KeepAliveMessage,
     OpenMessage,
     FiniteStateMachineError,
@@ -41,10 +52,16 @@ from messages import (
     VotingMessage,
     TrustRateMessage,
 )
+from path_attributes import PathAttributes
+from rib import RIB
 from state_machine import BGPStateMachine
+from transport import AsyncTcpTransport, TcpTransport
+from timers import TimingWheel, thread_call_later
+from tracing import DISABLED as NO_TRACING
 
-BUFFER_SIZE = 1024  # Normally 1024
 S_PRINT_LOCK = threading.Lock()
+# seconds a router waits for more routing table changes before rebuilding its FIB
+FIB_REBUILD_DELAY = 0.1
 
 if os.environ.get("DEBUG_ON"):
     logging.basicConfig(level=logging.DEBUG)
@@ -60,103 +77,223 @@ def s_print(*args, **kwargs):
         print(*args, **kwargs)
 
 
-def get_random_trust_value():
+def get_random_trust_value(r=None):
     """
     Generate random values from the interval [0.45, 0.55]
     """
-    r = random.Random()
+    if r is None:
+        r = random.Random()
     return r.randrange(45, 55) / 100
 
 
 class Router:
-    def __init__(self, name, ip, router_number, discovered_paths):
+    def __init__(
+        self,
+        name,
+        ip,
+        router_number,
+        discovered_paths,
+        loop=None,
+        transport=None,
+        seed=None,
+        timers=None,
+        mrai=0,
+        tracker=None,
+        metrics=None,
+        tracer=None,
+    ):
         self.name = name
+        self.router_number = router_number
         self.ip = ip
+        # the asyncio event loop or event engine the router runs on, if not
+        # running in a thread
+        self.loop = loop
+        self.random = random.Random(seed)
 
         # setup placeholders since multithreading is breaking us and no locks were properly implemented...
         self.bgp_setup_complete = False
         self.voting_setup_complete = False
         self.advertise_setup_complete = False
-
-        self.sm = BGPStateMachine(f"SM-{name}", 5, discovered_paths)
+        # the routers tell the convergence tracker about their progress
+        self.tracker = tracker
+        self.metrics = metrics if metrics is not None else NO_METRICS
+        self.tracer = tracer if tracer is not None else NO_TRACING
+
+        # the session timers run on a timing wheel, normally shared by all routers
+        if timers is None:
+            timers = TimingWheel(
+                thread_call_later if loop is None else loop.call_later
+            )
+        self.sm = BGPStateMachine(
+            f"SM-{name}",
+            5,
+            discovered_paths,
+            timers,
+            self.dispatch_timer_event,
+            self.record_transition
+            if self.metrics.enabled or self.tracer.enabled
+            else None,
+        )
         self.message_scheduler = sched.scheduler()
 
         self.paths = discovered_paths
 
         self.updates_received = 0
+        # the BGP messages sent, by message type
+        self.messages_sent = collections.Counter()
+        self.packets_delivered = 0
+        self.packets_dropped = 0
 
         self.trust_values = {peer: 0 for peer in discovered_paths}
         self.messages_exchanged = {peer: 0 for peer in discovered_paths}
         self.vote_values = {peer: [] for peer in discovered_paths}
         self.vote_complete = {peer: False for peer in discovered_paths}
 
-        self.path_table = {
-            "NETWORK": [],
-            "NEXT_HOP": [],
-            "MED": [],
-            "LOC_PREF": [],
-            "WEIGHT": [],
-            "TRUST_RATE": [],
-            "AS_PATH": [],
-        }
+        self.path_table = RIB()
+        # the data plane only reads the FIB, which is rebuilt from the table
+        self.fib = FIB()
+        self.fib_rebuild_pending = False
         self.advetised_prefixes = set()
+        # UPDATE messages are packed and rate limited per peer
+        self.adj_rib_out = AdjRibOut(
+            self.name, self.bgp_send, self.schedule, mrai, tracker
+        )
 
         self.stop_listening = threading.Event()
 
-        # BGP receiving and listening sockets
+        # BGP and data plane transport, TCP sockets unless told otherwise
+        if transport is None and loop is None:
+            transport = TcpTransport(f"R{self.name}", router_number)
+        elif transport is None:
+            transport = AsyncTcpTransport(f"R{self.name}", router_number, loop)
+        self.transport = transport
+
+        self.register_metrics()
+
+    def register_metrics(self):
         """
-        This is ugly... port range will for now always be the router num
-        multiplied by 4 (since we need 4 ports), in the range of:
-            port: bgp_listener
-            port + 1: bgp_speaker
-            port + 2: data_listener
-            port + 3: data_speaker
+        Sets up the metrics of the router. The values the router keeps track
+        of anyway are only read when a snapshot of the metrics is taken.
         """
-        base_num = 2000 + 4 * router_number
-        self.ports = [base_num, base_num + 1, base_num + 2, base_num + 3]
-
-        self.listener = RouterListener(f"R{self.name}", self.ports[0], self.ports[2])
-        self.speaker = RouterSpeaker(f"R{self.name}", self.ports[1], self.ports[3])
+        metrics = self.metrics
+        labels = (self.name,)
+        self.messages_received_metric = metrics.counter(
+            "bgp_messages_received_total",
+            "BGP messages received, by message type.",
+            ("router", "type"),
+        )
+        self.bgp_latency_metric = metrics.histogram(
+            "bgp_message_handling_seconds",
+            "Time spent handling a BGP message.",
+            ("router",),
+        )
+        self.data_latency_metric = metrics.histogram(
+            "data_handling_seconds",
+            "Time spent handling an IP packet or a batch of them.",
+            ("router",),
+        )
+        self.transitions_metric = metrics.counter(
+            "bgp_fsm_transitions_total",
+            "State changes of the BGP sessions, by peer.",
+            ("router", "peer", "from_state", "to_state"),
+        )
+        metrics.counter(
+            "bgp_messages_sent_total",
+            "BGP messages sent, by message type.",
+            ("router", "type"),
+        ).collect_from(
+            lambda: {
+                (self.name, kind): count for kind, count in self.messages_sent.items()
+            }
+        )
+        metrics.counter(
+            "bgp_updates_sent_total", "UPDATE messages sent.", ("router",)
+        ).collect_from(lambda: {labels: self.adj_rib_out.updates_sent})
+        metrics.gauge("rib_routes", "Routes in the RIB.", ("router",)).collect_from(
+            lambda: {labels: len(self.path_table)}
+        )
+        metrics.gauge("fib_prefixes", "Prefixes in the FIB.", ("router",)).collect_from(
+            lambda: {labels: len(self.fib)}
+        )
+        metrics.counter(
+            "packets_delivered_total", "IP packets delivered locally.", ("router",)
+        ).collect_from(lambda: {labels: self.packets_delivered})
+        metrics.counter(
+            "packets_dropped_total",
+            "IP packets dropped, as invalid, expired or without a route.",
+            ("router",),
+        ).collect_from(lambda: {labels: self.packets_dropped})
+
+    def record_transition(self, peer, old_state, new_state):
+        old_name, new_name = type(old_state).__name__, type(new_state).__name__
+        self.transitions_metric.inc((self.name, str(peer), old_name, new_name))
+        self.tracer.instant(
+            f"{old_name} -> {new_name}", "fsm", f"router {self.name}", {"peer": peer}
+        )
 
     def start(self, connections=50):
-        # start listening
-        self.listener.listen_bgp_socket.listen(connections)
-        self.listener.listen_data_socket.listen(connections)
-
-        read_list = [self.listener.listen_bgp_socket, self.listener.listen_data_socket]
+        self.transport.open(connections)
 
         # start the while loop
         while not self.stop_listening.is_set():
-            readable, writeable, errors = select.select(read_list, [], [], 0.5)
-            for r in readable:
-                if r is self.listener.listen_bgp_socket:
-                    (
-                        bgp_client_socket,
-                        bgp_client_addr,
-                    ) = self.listener.listen_bgp_socket.accept()
-                    # extract the data
-                    pickled_data = bgp_client_socket.recv(BUFFER_SIZE)
-                    message = pickle.loads(pickled_data)
-
-                    # handle the message based on internal state
-                    self.handle_bgp_data(message)
-                    bgp_client_socket.close()
-
-                if r is self.listener.listen_data_socket:
-                    (
-                        data_client_socket,
-                        data_client_addr,
-                    ) = self.listener.listen_data_socket.accept()
-                    # extract the data
-                    pickled_data = data_client_socket.recv(BUFFER_SIZE)
-                    message = pickle.loads(pickled_data)
+            # send anything that is due, and wake up in time for the next one
+            next_deadline = self.message_scheduler.run(blocking=False)
+            timeout = 0.5 if next_deadline is None else min(next_deadline, 0.5)
+            self.transport.poll(self, timeout)
+
+        self.transport.close()
 
-                    # handle the message based on internal state
-                    self.handle_data(message)
-                    data_client_socket.close()
+    async def start_async(self, connections=50):
+        """
+        Starts the listeners of the router as tasks on its event loop.
+        """
+        await self.transport.serve(self, connections)
 
     def stop(self):
-        self.stop_listening.set()
+        self.sm.stop_timers()
+        if self.loop is None:
+            self.stop_listening.set()
+            return
+
+        self.transport.close()
+
+    def schedule(self, delay, action, argument=()):
+        """
+        Runs the action after the passed delay in seconds, without blocking the
+        router in the meantime.
+        """
+        if self.tracer.enabled:
+            action = self.tracer.traced(
+                action,
+                getattr(action, "__name__", "action"),
+                "scheduled",
+                f"router {self.name}",
+                {"delay": delay},
+            )
+
+        if self.loop is not None:
+            try:
+                running_loop = asyncio.get_running_loop()
+            except RuntimeError:
+                running_loop = None
+
+            if running_loop is self.loop or not isinstance(
+                self.loop, asyncio.AbstractEventLoop
+            ):
+                self.loop.call_later(delay, action, *argument)
+            else:
+                # scheduling from outside the thread of the event loop
+                self.loop.call_soon_threadsafe(
+                    self.loop.call_later, delay, action, *argument
+                )
+            return
+
+        # the listener loop runs the scheduled actions once they are due
+        self.message_scheduler.enter(delay, 1, action, argument)
+
+    def dispatch_timer_event(self, switch_state, argument):
+        # timers expire on the timing wheel, the state switch happens on the router
+        self.schedule(0, switch_state, argument)
 
     def update_voting_value(self, peer, num_of_2nd_neighbours, voted_trust_value=None):
         if voted_trust_value:
@@ -172,6 +309,8 @@ class Router:
                 f"Router {self.name} vote value table: {self.vote_values}, number of 2nd neighbours: {num_of_2nd_neighbours}"
             )
             self.voting_setup_complete = True
+            if self.tracker is not None:
+                self.tracker.router_done("voting", self.name)
 
         # if we have all the votes from the 2nd neighbours, update the new
         # trust value
@@ -201,154 +340,153 @@ class Router:
         return 1 / (0.4 * self.trust_values[peer]) + (0.6 * votes_mean)
 
     def distribute_trust_values(self, peer_list):
+        delay = 0
         for i in peer_list:
             # tell the other peers what is your trust value of chosen peer
             peers_to_distribute = list(peer_list)
             peers_to_distribute.remove(i)
             # get the trust value of the chosen peer
-            trust_value = self.path_table["TRUST_RATE"][
-                self.path_table["AS_PATH"].index(str(i))
-            ]
+            trust_value = self.path_table.get(
+                self.path_table.routes_with_path(str(i))[0], "TRUST_RATE"
+            )
             for peer in peers_to_distribute:
                 # send all other peers the trust value and AS path of the chosen peer
-                self.bgp_send(
-                    peer, TrustRateMessage(self.name, trust_value, f"{self.name} {i}")
+                self.schedule(
+                    delay,
+                    self.bgp_send,
+                    (
+                        peer,
+                        TrustRateMessage(self.name, trust_value, f"{self.name} {i}"),
+                    ),
                 )
-                sleep(5)
+                delay += 5
 
     def get_routing_table_size(self):
-        return len(self.path_table["MED"])
+        return len(self.path_table)
+
+    def has_table_entry(self, row):
+        return row in self.path_table
 
     def update_routing_table(self, data):
-        pa = data.get_path_attr()
-        nlri = data.get_nlri()
-
-        for i in nlri:
-            if self.name in pa["AS_PATH"]:
-                return False
-
-            self.path_table["NETWORK"].append(i)
-            self.path_table["NEXT_HOP"].append(pa["NEXT_HOP"])
-            self.path_table["MED"].append(pa["MED"])
-            self.path_table["LOC_PREF"].append(pa["LOC_PREF"])
-            self.path_table["WEIGHT"].append(pa["WEIGHT"])
-            self.path_table["AS_PATH"].append(pa["AS_PATH"])
-
-            # update the trust rate value
-            if len(pa["AS_PATH"].split()) > 1:
-                self.path_table["TRUST_RATE"].append(
-                    pa["TRUST_RATE"]
-                    + self.get_trust_rate(int(pa["AS_PATH"].split()[0]))
-                )
+        """
+        Applies the UPDATE message of a peer to the routing table. A prefix
+        announced again replaces the route the peer announced before, and a
+        withdrawn prefix removes it.
+
+        Returns whether any route was added, changed or removed.
+        """
+        peer = int(data.get_sender())
+        nlri = data.get_nlri() or []
+        withdrawn = list(data.get_withdrawn_routes())
+        pa = data.get_path_attributes() if nlri else None
+
+        if nlri and self.router_number in pa.as_path:
+            # the path goes through this router, so the peer no longer has a
+            # usable route for the prefixes
+            withdrawn += nlri
+            nlri = []
+
+        route_ids = []
+        if nlri:
+            # the trust rate value of the path, as seen from this router
+            if pa.path_length > 1:
+                trust_rate = pa.trust_rate + self.get_trust_rate(pa.as_path.first)
             else:
-                self.path_table["TRUST_RATE"].append(
-                    self.get_trust_rate(int(pa["AS_PATH"]))
-                )
+                trust_rate = self.get_trust_rate(pa.as_path.first)
 
-        return True
+            for i in nlri:
+                route_id = self.path_table.announce(peer, i, pa, trust_rate)
+                if route_id is not None:
+                    route_ids.append(route_id)
+
+        removed = [
+            prefix
+            for prefix in withdrawn
+            if self.path_table.withdraw(peer, prefix) is not None
+        ]
+
+        if route_ids or removed:
+            self.request_fib_rebuild()
+            return True
+        return False
 
     def customise_routing_table(self, row, choice, value):
+        prefix = self.path_table.get(row, "NETWORK")
+        previous = {prefix: self.export_route(prefix)}
         for c in choice:
             if c == "m":
-                self.path_table["MED"][row] = value
+                self.path_table.set(row, "MED", value)
             if c == "l":
-                self.path_table["LOC_PREF"][row] = value
+                self.path_table.set(row, "LOC_PREF", value)
             if c == "w":
-                self.path_table["WEIGHT"][row] = value
+                self.path_table.set(row, "WEIGHT", value)
             if c == "t":
-                self.path_table["TRUST_RATE"][row] = int(value)
+                self.path_table.set(row, "TRUST_RATE", int(value))
             # self.print_routing_table()
+        self.request_fib_rebuild()
+        self.export_changes(previous)
 
     def print_routing_table(self):
-        df = pandas.DataFrame(self.path_table)
+        table, route_ids = self.path_table.to_dict()
+        df = pandas.DataFrame(table, index=route_ids)
         s_print(
             f"Routing table for router {self.name}: \n"
             f"{df.sort_values(by='NETWORK').to_string()} \n"
         )
 
     def remove_table_entry(self, row):
-        del self.path_table["NETWORK"][row]
-        del self.path_table["NEXT_HOP"][row]
-        del self.path_table["MED"][row]
-        del self.path_table["LOC_PREF"][row]
-        del self.path_table["WEIGHT"][row]
-        del self.path_table["TRUST_RATE"][row]
-        del self.path_table["AS_PATH"][row]
+        prefix = self.path_table.get(row, "NETWORK")
+        previous = {prefix: self.export_route(prefix)}
+        self.path_table.remove(row)
+        self.request_fib_rebuild()
+        self.export_changes(previous)
 
-    def determine_next_hop(self, ip_packet):
+    def request_fib_rebuild(self):
         """
-        Figures out which is the best path and returns the next hop ip address.
+        Rebuilds the FIB once the routing table has not changed for a while,
+        so a burst of changes only results in a single rebuild.
         """
-        # get all stored networks
-        netw_addresses = list(set(self.path_table["NETWORK"]))
-        # get the longest address match for the ip packet destination
-        common_bits_list = []
-        for addr in netw_addresses:
-            common_bits_list.append(
-                int(ipaddress.IPv4Address(ip_packet.get_destination_addr()))
-                ^ int(ipaddress.ip_network(addr).network_address)
-            )
-        # as far as I can see, we can really only XOR easily in Python, so let's
-        # XOR the addresses and the smallest value is the best match
-        logger.debug(f"Common bits list for router {self.name}: {common_bits_list}")
-        longest_addr_match = netw_addresses[
-            common_bits_list.index(min(common_bits_list))
-        ]
-
-        # find all paths that lead to that destination
-        possible_path_indexes = []
-        for index, addr in enumerate(self.path_table["NETWORK"]):
-            if addr != longest_addr_match:
-                continue
-            possible_path_indexes.append(index)
+        if self.fib_rebuild_pending:
+            return
 
-        # run the checks to find the best path
-        best_path_index = self.find_best_path(possible_path_indexes)
-        s_print(
-            f"Found best possible path of: {self.path_table['AS_PATH'][best_path_index]}"
+        self.fib_rebuild_pending = True
+        # packets are only forwarded along the new routes once it ran
+        if self.tracker is not None:
+            self.tracker.pending_changed(1)
+        self.schedule(FIB_REBUILD_DELAY, self.rebuild_fib)
+
+    def rebuild_fib(self):
+        self.fib_rebuild_pending = False
+        # swapping in the new snapshot is a single assignment, a lookup that
+        # is already running keeps using the previous one
+        self.fib = FIB.from_rib(self.path_table, self.fib.version + 1)
+        logger.debug(
+            f"Router {self.name} rebuilt its FIB, version {self.fib.version} "
+            f"with {len(self.fib)} prefixes"
         )
+        if self.tracker is not None:
+            self.tracker.pending_changed(-1)
 
-        # return the next hop value for the best found path
-        return self.path_table["AS_PATH"][best_path_index].split()[0]
-
-    def find_best_path(self, possible_path_indexes):
+    def determine_next_hop(self, ip_packet):
         """
-        Preferences:
-        1. the path with the highest WEIGHT
-        2. the path with the highest LOC_PREF
-        3. the path with the lowest TRUST_RATE
-        4. the path with the shortest AS_PATH
-        5. the path with the lowest MED
+        Figures out which is the best path and returns the next hop ip address,
+        or None if there is no route to the destination.
         """
-        # compare the entries
-        res = []
-        for i in possible_path_indexes:
-            if not res:
-                res = i
-
-            if self.path_table["WEIGHT"][res] < self.path_table["WEIGHT"][i]:
-                res = i
-                continue
-
-            if self.path_table["LOC_PREF"][res] < self.path_table["LOC_PREF"][i]:
-                res = i
-                continue
-
-            if self.path_table["TRUST_RATE"][res] > self.path_table["TRUST_RATE"][i]:
-                res = i
-                continue
-
-            if len(self.path_table["AS_PATH"][res]) > len(
-                self.path_table["AS_PATH"][i]
-            ):
-                res = i
-                continue
-
-            if self.path_table["MED"][res] > self.path_table["MED"][i]:
-                res = i
-                continue
+        # the FIB maps the longest address match straight to its best path
+        entry = self.fib.lookup(
+            int(ipaddress.IPv4Address(ip_packet.get_destination_addr()))
+        )
+        if entry is None:
+            logger.debug(
+                f"Router {self.name} has no route to {ip_packet.get_destination_addr()}"
+            )
+            return None
 
-        return res
+        # return the next hop value for the best found path
+        next_hop_peer, best_path = entry
+        # formatted lazily, this runs for every forwarded packet
+        logger.debug("Found best possible path of: %s", best_path)
+        return next_hop_peer
 
     def check_if_local_delivery(self, ip_packet):
         # Check the destination address, if it matches, you're done
@@ -374,17 +512,59 @@ class Router:
         """
         Advertise the passed prefix.
         """
+        if isinstance(path_attr, dict):
+            path_attr = PathAttributes.from_dict(path_attr)
         for r in self.paths:
-            # send the UPDATE message
-            self.bgp_send(
-                r,
-                UpdateMessage(
-                    self.name,
-                    total_pa_len=len(path_attr.keys()),
-                    total_pa=path_attr,
-                    nlri=ip_prefix,
-                ),
-            )
+            # queue the prefix for the next UPDATE message to the peer
+            self.adj_rib_out.advertise(r, path_attr, ip_prefix)
+
+    def export_route(self, prefix):
+        """
+        The path attributes this router advertises for the prefix, which are
+        those of its best route, or None if it has no route for the prefix.
+        """
+        table = self.path_table
+        route_id = table.best_route(prefix)
+        if route_id is None:
+            return None
+
+        attributes = table.get_attributes(route_id)
+        return attributes.replace(
+            origin=attributes.as_path.origin,
+            next_hop=self.ip,
+            trust_rate=table.get(route_id, "TRUST_RATE"),
+            as_path=attributes.as_path.prepend(self.router_number),
+        )
+
+    def export_changes(self, previous):
+        """
+        Tells the peers about the prefixes whose best route changed, given
+        what export_route() returned for the prefixes before the change. A
+        peer already on the AS path of the new best route gets a withdrawal
+        instead, if it got the previous one.
+        """
+        for prefix, old_path_attr in previous.items():
+            path_attr = self.export_route(prefix)
+            # interned, so an unchanged route gives the very same object
+            if path_attr is old_path_attr:
+                continue
+
+            for peer in self.paths:
+                if path_attr is not None and (
+                    peer not in path_attr.as_path
+                ):
+                    self.adj_rib_out.advertise(peer, path_attr, [prefix])
+                elif old_path_attr is not None and (
+                    peer not in old_path_attr.as_path
+                ):
+                    self.adj_rib_out.withdraw(peer, [prefix])
+
+    def withdraw_ip_prefix(self, ip_prefix):
+        """
+        Withdraw the passed prefix from all the peers.
+        """
+        for r in self.paths:
+            self.adj_rib_out.withdraw(r, ip_prefix)
 
     def start_voting(self, peer_list):
         logger.debug(f"Router {self.name} wants to get votes for {peer_list}")
@@ -395,22 +575,36 @@ class Router:
             self.bgp_send(peer, VotingMessage(self.name, self.name, 0, peer))
 
     def bgp_send(self, peer_to_send, data):
-        l_bgp_port = 2000 + 4 * int(peer_to_send)
-        self.speaker.bgp_send_message(l_bgp_port, data)
+        self.messages_sent[data.get_message_type().name] += 1
+        self.transport.bgp_send(peer_to_send, data)
 
     def data_send(self, peer_to_send, data):
-        l_data_port = 2000 + 4 * int(peer_to_send) + 2
-        self.speaker.send_data(l_data_port, data)
+        self.transport.data_send(peer_to_send, data)
 
     def handle_data(self, ip_packet):
+        if not self.metrics.enabled:
+            self.process_data(ip_packet)
+            return
+
+        start = time.perf_counter()
+        self.process_data(ip_packet)
+        self.data_latency_metric.observe((self.name,), time.perf_counter() - start)
+
+    def process_data(self, ip_packet):
+        if isinstance(ip_packet, PacketBatch):
+            self.handle_data_batch(ip_packet)
+            return
+
         logger.debug(f"Router {self.name} received an IP packet!")
         # validate the packet
         if not ip_packet.validate():
             logger.debug(f"IP packet not valid at router {self.name}!")
+            self.packets_dropped += 1
             return
 
         # check if the packet is for us
         if self.check_if_local_delivery(ip_packet):
+            self.packets_delivered += 1
             s_print(f"IP packet found its home at AS {self.name}")
             s_print(
                 f"Packet destination addr: {ip_packet.get_destination_addr()}\nContents:\n\t{ip_packet.get_payload()}"
@@ -419,16 +613,97 @@ class Router:
 
         # at this point, find the next hop
         next_hop_peer = self.determine_next_hop(ip_packet)
-        if not ip_packet.decrease_ttl():
+        if next_hop_peer is None or not ip_packet.decrease_ttl():
             logger.debug(f"Router {self.name} dropping an IP packet")
+            self.packets_dropped += 1
             return
 
-        ip_packet.generate_new_checksum()
+        self.schedule(0.2, self.data_send, (next_hop_peer, ip_packet))
 
-        self.message_scheduler.enter(0.2, 1, self.data_send, (next_hop_peer, ip_packet))
-        self.message_scheduler.run()
+    def handle_data_batch(self, batch):
+        """
+        Same as handle_data, for a whole batch of IP packets at once. The
+        packets that are not delivered locally are forwarded as one batch per
+        next hop peer.
+        """
+        logger.debug(f"Router {self.name} received a batch of {len(batch)} packets!")
+        valid = batch.validate()
+        if not valid.all():
+            logger.debug(
+                f"{len(batch) - valid.sum()} IP packets not valid at router {self.name}!"
+            )
+            self.packets_dropped += int(len(batch) - valid.sum())
+            batch = batch.select(valid)
+
+        # check which packets are for us
+        local = batch.destination_addr == int(ipaddress.IPv4Address(self.ip))
+        for addr in self.advetised_prefixes:
+            local |= batch.destination_mask(addr)
+        if local.any():
+            self.packets_delivered += int(local.sum())
+            s_print(f"{local.sum()} IP packets found their home at AS {self.name}")
+            batch = batch.select(~local)
+
+        # at this point, find the next hops, -1 for the packets without a route
+        fib = self.fib
+        next_hop_peers = numpy.array(
+            [
+                -1 if entry is None else entry[0]
+                for entry in fib.lookup_batch(batch.destination_addr.tolist())
+            ],
+            dtype=numpy.int64,
+        )
+        alive = batch.decrease_ttl() & (next_hop_peers >= 0)
+        if not alive.all():
+            logger.debug(
+                f"Router {self.name} dropping {len(batch) - alive.sum()} IP packets"
+            )
+            self.packets_dropped += int(len(batch) - alive.sum())
+
+        for peer in numpy.unique(next_hop_peers[alive]):
+            self.schedule(
+                0.2,
+                self.data_send,
+                (int(peer), batch.select(alive & (next_hop_peers == peer))),
+            )
 
     def handle_bgp_data(self, bgp_message):
+        try:
+            if not self.metrics.enabled and not self.tracer.enabled:
+                self.process_bgp_data(bgp_message)
+                return
+
+            kind = bgp_message.get_message_type().name
+            self.messages_received_metric.inc((self.name, kind))
+            start = time.perf_counter()
+            try:
+                self.process_bgp_data(bgp_message)
+            finally:
+                end = time.perf_counter()
+                self.bgp_latency_metric.observe((self.name,), end - start)
+                self.tracer.complete(
+                    kind,
+                    "bgp",
+                    f"router {self.name}",
+                    start,
+                    end,
+                    {"peer": bgp_message.get_sender()},
+                )
+        finally:
+            # only now, as handling an UPDATE might have queued more of them,
+            # and even if handling it failed
+            if (
+                self.tracker is not None
+                and bgp_message.get_message_type() == Message.UPDATE
+            ):
+                self.tracker.update_handled()
+
+    def updates_dropped(self, count):
+        """Called by the transport with the UPDATE messages it dropped"""
+        if self.tracker is not None and count:
+            self.tracker.update_dropped(count)
+
+    def process_bgp_data(self, bgp_message):
         """
         Handles and qualifies the received message from a BGP speaker.
         """
@@ -454,21 +729,19 @@ class Router:
                 )  # is now in Active state
 
                 # generate the initial random trust value for our peer
-                self.trust_values[peer] = get_random_trust_value()
+                self.trust_values[peer] = get_random_trust_value(self.random)
 
                 # schedule the speaker to send an open message to the peer
-                self.message_scheduler.enter(
-                    0.2, 1, self.bgp_send, (peer, OpenMessage(self.name, self.ip))
+                self.schedule(
+                    0.2, self.bgp_send, (peer, OpenMessage(self.name, self.ip))
                 )
-                self.message_scheduler.run()
                 return
 
         if bgp_message.get_message_type() == Message.OPEN:
             if isinstance(self.sm.get_state(peer), states.ActiveState):
-                self.message_scheduler.enter(
-                    0.2, 1, self.bgp_send, (peer, OpenMessage(self.name, self.ip))
+                self.schedule(
+                    0.2, self.bgp_send, (peer, OpenMessage(self.name, self.ip))
                 )
-                self.message_scheduler.run()
                 self.sm.switch_state(
                     peer, Event("TcpConnectionConfirmed")
                 )  # is now in OpenSent state
@@ -479,38 +752,27 @@ class Router:
                     peer, Event("BGPOpen")
                 )  # is now in OpenConfirm state
                 bgp_message.verify()
-                self.message_scheduler.enter(
-                    0.2, 1, self.bgp_send, (peer, KeepAliveMessage(self.name))
-                )
-                self.message_scheduler.run()
+                self.schedule(0.2, self.bgp_send, (peer, KeepAliveMessage(self.name)))
                 return
 
         if bgp_message.get_message_type() == Message.UPDATE:
             logger.debug(f"Router {self.name} received an UPDATE message from {peer}")
             if isinstance(self.sm.get_state(peer), states.EstablishedState):
+                self.sm.switch_state(peer, Event("UpdateMsg"))  # restarts HoldTimer
                 # we got an update message, time to update routing table
-                propagate = self.update_routing_table(bgp_message)
-
-                if not propagate:
-                    self.updates_received += 1
-                    if self.updates_received >= len(self.paths):
-                        self.advertise_setup_complete = True
-                    return
-
-                # construct new update values
-                new_path_attr = bgp_message.get_path_attr()
-                new_path_attr["NEXT_HOP"] = self.ip
-                # the entry we just completed is the last one
-                new_path_attr["TRUST_RATE"] = self.path_table["TRUST_RATE"][-1]
-                new_path_attr["AS_PATH"] = f"{self.name} " + new_path_attr["AS_PATH"]
-                # send new update message
-                self.message_scheduler.enter(
-                    0,
-                    1,
-                    self.advertise_ip_prefix,
-                    (new_path_attr, bgp_message.get_nlri()),
+                prefixes = (bgp_message.get_nlri() or []) + list(
+                    bgp_message.get_withdrawn_routes()
                 )
-                self.message_scheduler.run()
+                previous = {prefix: self.export_route(prefix) for prefix in prefixes}
+                if self.update_routing_table(bgp_message):
+                    # only changes of the best routes are passed on
+                    self.export_changes(previous)
+
+                self.updates_received += 1
+                if self.updates_received >= len(self.paths):
+                    self.advertise_setup_complete = True
+                    if self.tracker is not None:
+                        self.tracker.router_done("advertised", self.name)
                 return
 
         if bgp_message.get_message_type() == Message.NOTIFICATION:
@@ -522,23 +784,20 @@ class Router:
                 self.sm.switch_state(
                     peer, Event("KeepAliveMsg")
                 )  # is now in Established state
+                if self.tracker is not None:
+                    self.tracker.session_established(self.name, peer)
                 logger.debug(
                     f"Router {self.name} is now in state {self.sm.get_state(peer)}"
                     f" with peer {peer}"
                 )
-                self.message_scheduler.enter(
-                    10, 1, self.bgp_send, (peer, KeepAliveMessage(self.name))
-                )
-                self.message_scheduler.run()
+                self.schedule(10, self.bgp_send, (peer, KeepAliveMessage(self.name)))
                 return
 
             if isinstance(self.sm.get_state(peer), states.EstablishedState):
+                self.sm.switch_state(peer, Event("KeepAliveMsg"))  # restarts HoldTimer
                 self.bgp_setup_complete = True
 
-                self.message_scheduler.enter(
-                    15, 1, self.bgp_send, (peer, KeepAliveMessage(self.name))
-                )
-                self.message_scheduler.run()
+                self.schedule(15, self.bgp_send, (peer, KeepAliveMessage(self.name)))
                 return
 
         if bgp_message.get_message_type() == Message.VOTING:
@@ -557,12 +816,12 @@ class Router:
                 bgp_message.set_num_of_2nd_neighbours(len(second_neighbours))
                 if not second_neighbours:
                     bgp_message.set_to_answer()
-                    self.message_scheduler.enter(0.2, 1, self.bgp_send, (bgp_message.get_origin(), bgp_message))
-                    self.message_scheduler.run()
+                    self.schedule(
+                        0.2, self.bgp_send, (bgp_message.get_origin(), bgp_message)
+                    )
 
                 for p in second_neighbours:
-                    self.message_scheduler.enter(0.2, 1, self.bgp_send, (p, bgp_message))
-                    self.message_scheduler.run()
+                    self.schedule(0.2, self.bgp_send, (p, bgp_message))
                 return
 
             # case 2: the message is at a 2nd neighbour
@@ -585,16 +844,11 @@ class Router:
                 new_vote_msg.set_num_of_2nd_neighbours(
                     bgp_message.get_num_of_2nd_neighbours()
                 )
-                self.message_scheduler.enter(
+                self.schedule(
                     0.2,
-                    1,
                     self.bgp_send,
-                    (
-                        bgp_message.get_peer_to_vote_for(),
-                        new_vote_msg,
-                    ),
+                    (bgp_message.get_peer_to_vote_for(), new_vote_msg),
                 )
-                self.message_scheduler.run()
                 return
 
             # case 3: the message is to be forwarded back to origin
@@ -604,10 +858,9 @@ class Router:
                     f" from router {self.name}"
                 )
                 bgp_message.set_router_num(self.name)
-                self.message_scheduler.enter(
-                    0.2, 1, self.bgp_send, (bgp_message.get_origin(), bgp_message)
+                self.schedule(
+                    0.2, self.bgp_send, (bgp_message.get_origin(), bgp_message)
                 )
-                self.message_scheduler.run()
                 return
 
             # case 4: the message is back to the original sender
@@ -634,10 +887,7 @@ class Router:
                 self.trust_values[peer] += 0.1
 
             self.messages_exchanged[peer] -= 20
-            self.message_scheduler.enter(
-                15, 1, self.bgp_send, (peer, TrustRateMessage(self.name))
-            )
-            self.message_scheduler.run()
+            self.schedule(15, self.bgp_send, (peer, TrustRateMessage(self.name)))
             return
 
             # check if we are already contained in the AS path
@@ -678,49 +928,3 @@ class Router:
 
         self.sm.switch_state(peer, Event("ManualStop"))
         logger.error("Something went wrong. Going back to Idle state!")
-
-
-class RouterListener:
-    def __init__(self, name, bgp_port, data_port):
-        self.name = name
-        self.bgp_port = bgp_port
-        self.data_port = data_port
-
-        # Control and Data plane listener
-        self.listen_bgp_socket = socket.create_server((socket.gethostname(), bgp_port))
-        self.listen_data_socket = socket.create_server(
-            (socket.gethostname(), data_port)
-        )
-
-
-class RouterSpeaker:
-    def __init__(self, name, bgp_port, data_port):
-        self.name = name
-        self.bgp_port = bgp_port
-        self.data_port = data_port
-
-        # BGP control and data plane speaker
-        self.speaker_bgp_socket = None
-        self.speaker_data_socket = None
-
-    def _bgp_connect(self, listener_port):
-        self.speaker_bgp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.speaker_bgp_socket.connect((socket.gethostname(), listener_port))
-
-    def bgp_send_message(self, l_port, data):
-        self._bgp_connect(l_port)
-        s = self.speaker_bgp_socket.send(
-            pickle.dumps(data),
-        )
-        self.speaker_bgp_socket.close()
-
-    def _data_connect(self, listener_port):
-        self.speaker_data_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.speaker_data_socket.connect((socket.gethostname(), listener_port))
-
-    def send_data(self, l_port, data):
-        self._data_connect(l_port)
-        s = self.speaker_data_socket.send(
-            pickle.dumps(data),
-        )
-        self.speaker_data_socket.close()
@@ -0,0 +1,282 @@
+"""
+Headless simulations described by scenario files.
+
+A scenario file holds everything the interactive prompts would otherwise ask
+for: how the simulation runs, the topology, and a timeline of the commands to
+run once the setup is done. It can be written in JSON, TOML, or YAML if
+PyYAML is installed. For example, in JSON:
+
+    {
+        "seed": 1,
+        "discrete_event": true,
+        "mrai": 5,
+        "run_time": 60,
+        "topology": {"model": "barabasi-albert", "size": 100, "m": 2},
+        "events": [
+            {"at": 0, "action": "advertise", "router": 3,
+             "prefix": "10.3.0.0/24", "med": 10},
+            {"at": 10, "action": "customise", "router": 5,
+             "prefix": "100.3.3.0/24", "peer": 3, "loc_pref": 200},
+            {"at": 20, "action": "remove", "router": 5, "prefix": "100.3.3.0/24"},
+            {"at": 30, "action": "withdraw", "router": 3, "prefix": "10.3.0.0/24"},
+            {"at": 40, "action": "packet", "router": 1, "source": "50.1.0.1",
+             "destination": "10.3.0.5", "payload": "hello", "count": 100}
+        ]
+    }
+
+The topology is either explicit routes ({"routes": {"AS1": [2, 3], ...}}),
+the interactive random model ({"model": "random", "size": 10}), one of the
+models of topology.py with their parameters, or a CAIDA file ({"model":
+"caida", "path": ..., "sample": 1000}).
+
+The event times are in seconds since the setup was done. The actions match
+the interactive commands, but routes are picked by prefix, and by the peer
+they were learned from if passed, instead of by table row, as rows differ
+from one run to the other. Without a peer, the best route of the prefix is
+picked. The simulation runs for run_time seconds, or until the last event.
+
+Once done, the results of the run are written out as JSON.
+"""
+import ipaddress
+import json
+import logging
+import os
+import sys
+import time
+
+try:
+    import tomllib
+except ImportError:
+    import tomli as tomllib
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+import caida
+import topology
+from ip_packet import IPPacket
+from packet_batch import PacketBatch
+from simulation import generate_routing_paths
+
+logger = logging.getLogger("BGP")
+
+ACTIONS = ("advertise", "customise", "remove", "withdraw", "packet")
+# the columns customise can change, with the choice letter of the router
+CUSTOMISABLE = {"med": "m", "loc_pref": "l", "weight": "w", "trust_rate": "t"}
+
+
+def load_scenario(path, results_path=None):
+    """Reads the scenario file, the format being picked by its extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        with open(path) as file:
+            data = json.load(file)
+    elif extension == ".toml":
+        with open(path, "rb") as file:
+            data = tomllib.load(file)
+    elif extension in (".yaml", ".yml"):
+        if yaml is None:
+            raise ValueError("YAML scenarios need PyYAML to be installed")
+        with open(path) as file:
+            data = yaml.safe_load(file)
+    else:
+        raise ValueError(f"Unknown scenario format {extension}")
+
+    return Scenario(data, os.path.basename(path), results_path)
+
+
+class Scenario:
+    def __init__(self, data, name="scenario", results_path=None):
+        """
+        The results are written to results_path, or printed out if None.
+        """
+        self.name = name
+        self.results_path = results_path
+        self.seed = data.get("seed")
+        self.discrete_event = data.get("discrete_event", True)
+        self.asynchronous = data.get("asyncio", False)
+        self.transport = data.get("transport", "queue")
+        self.mrai = data.get("mrai", 0)
+        self.run_time = data.get("run_time", 0)
+        self.metrics = data.get("metrics", False)
+        self.topology = data.get("topology", {"model": "random", "size": 10})
+
+        self.events = sorted(data.get("events", []), key=lambda e: e.get("at", 0))
+        for event in self.events:
+            if event.get("action") not in ACTIONS:
+                raise ValueError(f"Unknown scenario action in {event}")
+            if "router" not in event:
+                raise ValueError(f"No router given for {event}")
+
+        self.outcomes = []
+
+    def build_routes(self):
+        """The topology of the scenario, in the form setup_simulation expects"""
+        settings = dict(self.topology)
+        if "routes" in settings:
+            return {name: set(peers) for name, peers in settings["routes"].items()}
+
+        model = settings.pop("model", "random")
+        if model == "caida":
+            return caida.load_routes(
+                settings["path"],
+                settings.get("sample"),
+                self.seed,
+                settings.get("remap", True),
+            )
+
+        size = settings.pop("size")
+        if model == "random":
+            as_paths = {f"AS{i + 1}": set() for i in range(size)}
+            return generate_routing_paths(size, as_paths)
+        if model not in topology.GENERATORS:
+            raise ValueError(f"Unknown topology model {model}")
+        return topology.GENERATORS[model](size, seed=self.seed, **settings).to_routes()
+
+    def run(self, router_dict, engine=None, tracker=None, metrics=None):
+        """
+        Runs the events on the routers, which are all set up by now, and
+        writes out the results, along with the phases of the convergence
+        tracker and a snapshot of the metrics if passed.
+        """
+        end = max([self.run_time] + [event.get("at", 0) for event in self.events])
+        if engine is not None:
+            setup_time = engine.now
+            for event in self.events:
+                engine.call_later(event.get("at", 0), self.apply, router_dict, event)
+            engine.run(until=setup_time + end)
+            end_time = engine.now
+        else:
+            setup_time = time.monotonic()
+            for event in self.events:
+                delay = setup_time + event.get("at", 0) - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                self.apply(router_dict, event)
+            time.sleep(max(0, setup_time + end - time.monotonic()))
+            end_time = time.monotonic()
+
+        results = self.results(router_dict, engine, end_time - setup_time)
+        if tracker is not None:
+            results["convergence"] = tracker.results()
+        if metrics is not None:
+            results["metrics"] = metrics.snapshot()
+        if self.results_path is None:
+            json.dump(results, sys.stdout, indent=2)
+            print()
+        else:
+            with open(self.results_path, "w") as file:
+                json.dump(results, file, indent=2)
+        return results
+
+    def apply(self, router_dict, event):
+        action = event["action"]
+        router = router_dict.get(str(event["router"]))
+        outcome = {
+            "at": event.get("at", 0),
+            "action": action,
+            "router": event["router"],
+        }
+        self.outcomes.append(outcome)
+        if router is None:
+            outcome["error"] = "unknown router"
+            return
+
+        logger.info(f"Scenario running {action} on router {router.name}")
+        try:
+            self.run_action(router, action, event)
+        except ValueError as e:
+            logger.error(f"Scenario event {event} failed: {e}")
+            outcome["error"] = str(e)
+            return
+        outcome["applied"] = True
+
+    def run_action(self, router, action, event):
+        if action == "advertise":
+            path_attr = {
+                "ORIGIN": router.router_number,
+                "NEXT_HOP": router.ip,
+                "MED": event.get("med", 0),
+                "LOC_PREF": event.get("loc_pref", 0),
+                "WEIGHT": event.get("weight", 0),
+                "TRUST_RATE": event.get("trust_rate", 0),
+                "AS_PATH": str(router.router_number),
+            }
+            # advertising checks the path attributes first
+            router.advertise_ip_prefix(path_attr, [event["prefix"]])
+            router.add_advertised_ip_prefix([event["prefix"]])
+        elif action == "withdraw":
+            router.advetised_prefixes.discard(event["prefix"])
+            router.withdraw_ip_prefix([event["prefix"]])
+        elif action == "packet":
+            self.inject_packets(router, event)
+        else:
+            row = self.find_route(router, event)
+            if row is None:
+                raise ValueError("no such route")
+            if action == "customise":
+                for column, choice in CUSTOMISABLE.items():
+                    if column in event:
+                        router.customise_routing_table(row, [choice], event[column])
+            else:
+                router.remove_table_entry(row)
+
+    @staticmethod
+    def find_route(router, event):
+        """The row of the route the event is about, None if there is none"""
+        table = router.path_table
+        if "peer" in event:
+            return table.peer_route(int(event["peer"]), event["prefix"])
+        return table.best_route(event["prefix"])
+
+    @staticmethod
+    def inject_packets(router, event):
+        count = event.get("count", 1)
+        source = event.get("source", router.ip)
+        payload = event.get("payload", "")
+        if count == 1:
+            packet = IPPacket(24, 5, 60, source, event["destination"], payload)
+        else:
+            packet = PacketBatch.create(
+                int(ipaddress.IPv4Address(source)),
+                [int(ipaddress.IPv4Address(event["destination"]))] * count,
+                [payload] * count,
+            )
+        # the same way the interactive command sends it
+        router.data_send(router.router_number, packet)
+
+    def results(self, router_dict, engine, duration):
+        routers = {
+            name: {
+                "routes": len(router.path_table),
+                "prefixes": len(router.fib),
+                "updates_sent": router.adj_rib_out.updates_sent,
+                "updates_received": router.updates_received,
+                "packets_delivered": router.packets_delivered,
+                "packets_dropped": router.packets_dropped,
+            }
+            for name, router in router_dict.items()
+        }
+        totals = {
+            key: sum(router[key] for router in routers.values())
+            for key in (
+                "routes",
+                "updates_sent",
+                "packets_delivered",
+                "packets_dropped",
+            )
+        }
+        return {
+            "scenario": self.name,
+            "seed": self.seed,
+            "discrete_event": engine is not None,
+            "setup_time": engine.now - duration if engine is not None else None,
+            "duration": duration,
+            "events_run": engine.events_run if engine is not None else None,
+            "ases": len(router_dict),
+            "totals": totals,
+            "events": self.outcomes,
+            "routers": routers,
+        }
@@ -2,20 +2,36 @@
 Handle the processing of the simulations after the environment
 has been set up.
 """
+import asyncio
 import logging
 import random
 import sys
+import time
 from collections import defaultdict
 from pprint import pprint
 from threading import Thread
-from time import sleep
 
+from convergence import ConvergenceTracker
 from ip_packet import IPPacket
 from messages import BGPMessage
 from router import Router, s_print
+from timers import TimingWheel, thread_call_later
+from topology import as_prefix, router_ip
+from tracing import DISABLED as NO_TRACING
+from transport import (
+    QueueNetwork,
+    QueueTransport,
+    SimulatedNetwork,
+    SimulatedTransport,
+)
 
 logger = logging.getLogger("BGP")
 
+# virtual seconds the event engine runs for after each user command
+COMMAND_SETTLE_TIME = 30
+# RFC 4271 jitter, the ConnectRetry and Keepalive timers are reduced by up to 25%
+TIMER_JITTER = 0.25
+
 
 def generate_routing_paths(as_num, as_paths):
     """
@@ -142,7 +158,7 @@ def setup_as(as_num):
     return as_paths
 
 
-def user_customisations(router_dict, router_paths):
+def user_customisations(router_dict, router_paths, engine=None, metrics=None):
     """
     Polls the user for any specific table changes they might want.
     """
@@ -153,13 +169,19 @@ def user_customisations(router_dict, router_paths):
         "To customise a table of a specific router, write c <AS number>\n"
         "To remove a specific table entry, write d <AS number>\n"
         "To craft an IP packet and send it to an initial router, write ip <AS number>\n"
+        "To see the metrics of the routers, write m, or m <file> to save them\n"
         "To have the commands printed again, write h\n"
         "To exit the customisation, write q"
     )
     print(help_message)
 
     while customisation_loop:
-        action = input().upper()
+        if engine is not None:
+            # let the simulation catch up with the previous command
+            engine.run(until=engine.now + COMMAND_SETTLE_TIME)
+
+        command = input()
+        action = command.upper()
         action_list = action.split()
 
         if "H" in action_list:
@@ -170,6 +192,15 @@ def user_customisations(router_dict, router_paths):
             customisation_loop = False
             continue
 
+        if action_list and action_list[0] == "M":
+            if metrics is None:
+                print("Metrics are not enabled, run with --metrics")
+            elif len(action_list) == 1:
+                print(metrics.to_prometheus())
+            else:
+                write_metrics(metrics, command.split()[1])
+            continue
+
         if len(action_list) != 2:
             print("Badly formed input. Aborting...")
             continue
@@ -216,12 +247,13 @@ def user_customisations(router_dict, router_paths):
                         "TRUST_RATE": custom_prefix[4],
                         "AS_PATH": str(router_num),
                     }
-                    router_dict[str(router_num)].add_advertised_ip_prefix(ip_prefix)
+                    # advertising checks the path attributes first
                     router_dict[str(router_num)].advertise_ip_prefix(
                         path_attr, ip_prefix
                     )
-            except ValueError:
-                print("AS number not valid. Aborting...")
+                    router_dict[str(router_num)].add_advertised_ip_prefix(ip_prefix)
+            except ValueError as e:
+                print(f"Invalid value, {e}. Aborting...")
 
         if "C" in action.split():
             # print and customise the routing table for router X
@@ -234,7 +266,7 @@ def user_customisations(router_dict, router_paths):
                 router = router_dict[str(router_num)]
                 router.print_routing_table()
                 row = int(input("Which row would you like to customise?"))
-                if row < 0 or row > router.get_routing_table_size():
+                if not router.has_table_entry(row):
                     print("Incorrect row value chosen. Aborting...")
                     continue
 
@@ -249,8 +281,8 @@ def user_customisations(router_dict, router_paths):
 
                 actual_value = input("\nWhat would you like your new value to be?\n")
                 router.customise_routing_table(row, choice_value, actual_value)
-            except ValueError:
-                print("AS number not valid. Aborting...")
+            except ValueError as e:
+                print(f"Invalid value, {e}. Aborting...")
             continue
 
         if "D" in action.split():
@@ -264,7 +296,7 @@ def user_customisations(router_dict, router_paths):
                 router = router_dict[str(router_num)]
                 router.print_routing_table()
                 row = int(input("Which row would you like to delete?"))
-                if row < 0 or row > router.get_routing_table_size():
+                if not router.has_table_entry(row):
                     print("Incorrect row value chosen. Aborting...")
                     continue
 
@@ -299,28 +331,118 @@ def user_customisations(router_dict, router_paths):
             continue
 
 
-def setup_simulation(routes):
+def write_metrics(metrics, path):
+    """
+    Writes a snapshot of the metrics to the file, as JSON if it ends in .json
+    and in the Prometheus text format otherwise.
+    """
+    with open(path, "w") as file:
+        if path.endswith(".json"):
+            file.write(metrics.to_json())
+        else:
+            file.write(metrics.to_prometheus())
+
+
+def setup_simulation(
+    routes,
+    asynchronous=False,
+    transport="tcp",
+    engine=None,
+    run_time=0,
+    mrai=0,
+    scenario=None,
+    metrics=None,
+    tracer=None,
+):
     """
     Handles the simulation process and the creation of necessary objects.
+
+    The transport is either "tcp", connecting the routers through sockets, or
+    "queue", which keeps all messages in-memory. If an event engine is passed,
+    the routers run as a discrete-event simulation on its virtual clock
+    instead, which runs for run_time seconds once all the setup is done.
+
+    The routers send UPDATE messages to each peer at most once every mrai
+    seconds.
+
+    If a scenario is passed, it runs instead of polling the user for commands.
+    The routers record their metrics into the metrics registry, and their
+    timeline into the tracer, if passed.
     """
+    tracer = tracer if tracer is not None else NO_TRACING
     router_dict = {}
+    # when running asynchronously, all routers share a single event loop
+    loop = asyncio.new_event_loop() if asynchronous else None
+    network = QueueNetwork(loop) if transport == "queue" else None
+    if engine is not None:
+        loop = engine
+        network = SimulatedNetwork(engine)
+
+    # a single timing wheel runs the session timers of all the routers
+    if loop is None:
+        timers = TimingWheel(thread_call_later, jitter=TIMER_JITTER)
+    elif engine is not None:
+        timers = TimingWheel(
+            engine.call_later,
+            jitter=TIMER_JITTER,
+            rng=random.Random(engine.random.getrandbits(64)),
+        )
+    else:
+        timers = TimingWheel(loop.call_later, jitter=TIMER_JITTER)
+
+    # the routers report their progress through the setup to the tracker, on
+    # the virtual clock of the engine if there is one
+    tracker = ConvergenceTracker(
+        len(routes),
+        sum(len(paths) for paths in routes.values()),
+        time.monotonic if engine is None else engine.time,
+    )
 
     s_print(f"Generated network topology for the simulation:")
     pprint(routes)
 
     for as_choice, paths in routes.items():
         router_num = as_choice.strip("AS")
+        router_transport = None
+        seed = None
+        if engine is not None:
+            router_transport = SimulatedTransport(f"R{router_num}", router_num, network)
+            seed = engine.random.getrandbits(64)
+        elif network is not None:
+            router_transport = QueueTransport(f"R{router_num}", router_num, network)
         router_dict[router_num] = Router(
-            router_num, f"50.{router_num}.0.1", int(router_num), paths
+            router_num,
+            router_ip(int(router_num)),
+            int(router_num),
+            paths,
+            loop,
+            router_transport,
+            seed,
+            timers,
+            mrai,
+            tracker,
+            metrics,
+            tracer,
         )
 
     # start the control and data plane listener that will run as long as the
     # main program is running, unless if we explicitly end them
-    s_print("Starting listener threads...")
-    listener_threads = start_listeners(router_dict)
+    if engine is not None:
+        s_print("Starting simulated routers...")
+        listener_threads = []
+        for r_obj in router_dict.values():
+            engine.create_task(r_obj.start_async())
+        engine.run(until=engine.now)
+    elif asynchronous:
+        s_print("Starting listener tasks...")
+        listener_threads = start_async_listeners(router_dict, loop)
+    else:
+        s_print("Starting listener threads...")
+        listener_threads = start_listeners(router_dict)
 
     # Set up the TCP connections for each router based on their routes
     s_print("Setting up TCP connections and pushing routers into Established mode...")
+    phase_start = time.perf_counter()
     router_paths = {name.strip("AS"): paths for name, paths in routes.items()}
     for r_name, r_obj in router_dict.items():
         # sets up the initial connection and does all the necessary BGP exchanges to
@@ -329,21 +451,24 @@ def setup_simulation(routes):
             logger.info(f"Setting up TCP connection with router {peer}...")
             r_obj.bgp_send(peer, BGPMessage(r_obj.name))
 
-    # Waiting for all the BGP setup to complete
-    while not all([r_obj.bgp_setup_complete for r_obj in router_dict.values()]):
-        sleep(1)
+    # Waiting for all the sessions to be Established
+    if not tracker.wait("established", engine):
+        s_print("The established phase did not complete, carrying on regardless")
+    tracer.complete("established", "phase", "setup", phase_start, time.perf_counter())
 
     # We now generate the initial trust and voting values for our neighbours
     # and add them into their respective tables
     s_print(f"Starting the initial trust and voting process for all nodes...")
+    phase_start = time.perf_counter()
     for r_name, r_obj in router_dict.items():
         r_obj.setup_complete = False
         logger.info(f"Router {r_name} is starting the voting procedures...")
         r_obj.start_voting(router_paths[r_name])
 
     # Waiting for all the voting setup to complete
-    while not all([r_obj.voting_setup_complete for r_obj in router_dict.values()]):
-        sleep(1)
+    if not tracker.wait("voting", engine):
+        s_print("The voting phase did not complete, carrying on regardless")
+    tracer.complete("voting", "phase", "setup", phase_start, time.perf_counter())
 
     # so now we have working routers that have all their dedicated routes connected
     # and are in Established state within the BGP protocol. We now want to have each
@@ -353,8 +478,9 @@ def setup_simulation(routes):
     # If a user wants to add additional prefixes to a router, enable them to do so
     # after we've set up the default state
     s_print(f"Starting advertising default IP prefixes...")
+    phase_start = time.perf_counter()
     for r_name, r_obj in router_dict.items():
-        ip_prefix = [f"100.{r_name}.{r_name}.0/24"]
+        ip_prefix = [as_prefix(int(r_name))]
         path_attr = {
             "ORIGIN": r_name,
             "NEXT_HOP": r_obj.ip,
@@ -376,12 +502,36 @@ def setup_simulation(routes):
     #     )
     #     r_obj.distribute_trust_values(router_paths[r_name])
 
-    # Waiting for all the UPDATE setup to complete
-    while not all([r_obj.advertise_setup_complete for r_obj in router_dict.values()]):
-        sleep(1)
+    # Waiting for all the UPDATE setup to complete, and for the routes to settle
+    if not tracker.wait("advertised", engine):
+        s_print("The advertised phase did not complete, carrying on regardless")
+    tracer.complete("advertised", "phase", "setup", phase_start, time.perf_counter())
+    phase_start = time.perf_counter()
+    converged = tracker.wait_for_convergence(engine)
+    tracer.complete("converged", "phase", "setup", phase_start, time.perf_counter())
+    if converged:
+        s_print(f"Converged after {tracker.phase_times['converged']:.2f} seconds")
+    else:
+        s_print(
+            f"Did not converge, {tracker.in_flight} UPDATE messages are still in "
+            f"flight and {tracker.pending} Adj-RIB-Out flushes or FIB rebuilds "
+            "are pending"
+        )
+
+    if engine is not None:
+        s_print(f"Setup done after {engine.now:.2f} simulated seconds")
+        if run_time:
+            engine.run(until=engine.now + run_time)
+            s_print(
+                f"Simulated {run_time} more seconds, {engine.events_run} events "
+                f"were run in total"
+            )
 
-    # any user customisation is possible here
-    user_customisations(router_dict, router_paths)
+    if scenario is not None:
+        scenario.run(router_dict, engine, tracker, metrics)
+    else:
+        # any user customisation is possible here
+        user_customisations(router_dict, router_paths, engine, metrics)
     sys.exit()
 
 
@@ -399,6 +549,21 @@ def start_listeners(router_list):
     return thread_list
 
 
+def start_async_listeners(router_list, loop):
+    """
+    Starts BGP listeners as tasks of a single event loop, which runs in one
+    background thread.
+    """
+    t = Thread(target=loop.run_forever)
+    t.daemon = True
+    t.start()
+
+    for r_name, r_obj in router_list.items():
+        asyncio.run_coroutine_threadsafe(r_obj.start_async(), loop).result()
+
+    return [t]
+
+
 def stop_listeners(task_list, router_list):
     """
     Stops BGP listeners and the background threads.
@@ -7,46 +7,105 @@ according to the BGP protocol.
 """
 import logging
 
+from events import Event
 from states import IdleState, EstablishedState
 
-from timers import (
-    decrease_connect_retry_timer,
-    decrease_hold_timer,
-    decrease_keepalive_timer,
-)
-
 logger = logging.getLogger("BGP")
 
 
+class PeerSession:
+    """
+    The session variables the states work with, kept separately for every
+    peer. Setting one of the timers to a number of seconds (re)starts it on the
+    timing wheel, while setting it to 0 stops it.
+    """
+
+    def __init__(self, sm, peer):
+        self.sm = sm
+        self.peer = peer
+
+        self.connect_retry_counter = 0
+        self.connect_retry_time = sm.connect_retry_time
+        self.hold_time = 0
+        self.keepalive_time = 0
+
+    def _set_timer(self, name, value, jittered=False):
+        if not value:
+            self.sm.timers.stop((self, name))
+            return
+
+        self.sm.timers.start(
+            (self, name),
+            value,
+            lambda: self.sm.timer_expired(self.peer, name),
+            jittered,
+        )
+
+    @property
+    def connect_retry_timer(self):
+        return self.sm.timers.remaining((self, "ConnectRetryTimer_Expires"))
+
+    @connect_retry_timer.setter
+    def connect_retry_timer(self, value):
+        self._set_timer("ConnectRetryTimer_Expires", value, jittered=True)
+
+    @property
+    def hold_timer(self):
+        return self.sm.timers.remaining((self, "HoldTimer_Expires"))
+
+    @hold_timer.setter
+    def hold_timer(self, value):
+        self._set_timer("HoldTimer_Expires", value)
+
+    @property
+    def keepalive_timer(self):
+        return self.sm.timers.remaining((self, "KeepaliveTimer_Expires"))
+
+    @keepalive_timer.setter
+    def keepalive_timer(self, value):
+        self._set_timer("KeepaliveTimer_Expires", value, jittered=True)
+
+    def stop_timers(self):
+        self.connect_retry_timer = 0
+        self.hold_timer = 0
+        self.keepalive_timer = 0
+
+
 class BGPStateMachine:
     """
     I was under the impression each router would need its own state machine
     that isn't necessarily connected to a peer. With this, we can't just
     create a router and assign an SM to it.
+
+    The timers run on the passed timing wheel, which can be shared between
+    all the state machines. Expired timers are handed to dispatch, which runs
+    the state switch in the context of the router.
     """
 
-    def __init__(self, local_id, local_hold_time, peer_ip):
-        """Class constructor"""
+    def __init__(
+        self,
+        local_id,
+        local_hold_time,
+        peer_ip,
+        timers,
+        dispatch=None,
+        on_transition=None,
+    ):
+        """
+        on_transition(peer, old_state, new_state) is called whenever the
+        session with a peer changes state.
+        """
 
         self.states = {}
         self.peer_ip = peer_ip
 
-        for i in self.peer_ip:
-            self.states[i] = IdleState()
+        self.timers = timers
+        self.dispatch = dispatch
+        self.on_transition = on_transition
 
         self.event_queue = []
         self.event_serial_number = 0
 
-        self.connect_retry_counter = 0
-        self.connect_retry_timer = 0
-        self.connect_retry_time = 5
-
-        self.hold_timer = 0
-        self.hold_time = 0
-
-        self.keepalive_timer = 0
-        self.keepalive_time = 0
-
         self.connect_retry_time = 5
 
         self.local_id = local_id
@@ -55,8 +114,36 @@ class BGPStateMachine:
         self.peer_port = 0
         self.peer_id = None
 
+        self.sessions = {}
+        for i in self.peer_ip:
+            self.states[i] = IdleState()
+            self.sessions[i] = PeerSession(self, i)
+
+    def timer_expired(self, peer, name):
+        event = Event(name)
+        self.event_serial_number += 1
+        event.set_serial_num(self.event_serial_number)
+        logger.debug(f"{self.local_id}: {name} for peer {peer}")
+
+        if self.dispatch is None:
+            self.switch_state(peer, event)
+        else:
+            self.dispatch(self.switch_state, (peer, event))
+
     def switch_state(self, peer, event):
-        self.states[peer] = self.states[peer].on_event(self, event)
+        old_state = self.states[peer]
+        self.states[peer] = old_state.on_event(self.sessions[peer], event)
+        if self.on_transition is not None and type(self.states[peer]) is not type(
+            old_state
+        ):
+            self.on_transition(peer, old_state, self.states[peer])
+        if isinstance(self.states[peer], IdleState):
+            # nothing is running for a peer in the Idle state
+            self.sessions[peer].stop_timers()
+
+    def stop_timers(self):
+        for session in self.sessions.values():
+            session.stop_timers()
 
     def get_state(self, peer):
         try:
@@ -123,6 +123,10 @@ class EstablishedState(State):
             # Restart KeepaliveTimer
             cls.keepalive_timer = cls.keepalive_time
             return self
+        if event.get_name() in {"KeepAliveMsg", "UpdateMsg"}:
+            # Restart the HoldTimer
+            cls.hold_timer = cls.hold_time
+            return self
 
         # Increment the ConnectRetryCounter by 1
         cls.connect_retry_counter += 1
@@ -0,0 +1,46 @@
+import pickle
+
+import pytest
+
+from as_path import MEMBERSHIP_BITS, ASPath
+
+
+def test_parse_and_iterate():
+    path = ASPath.parse("3 2 1")
+    assert list(path) == [3, 2, 1]
+    assert len(path) == 3
+    assert path.origin == 1
+    assert str(path) == "3 2 1"
+    assert ASPath.parse([3, 2, 1]) is path
+    assert ASPath.parse(path) is path
+    assert ASPath.parse(7) is ASPath(7)
+
+    with pytest.raises(ValueError):
+        ASPath.parse("")
+
+
+def test_prepend_shares_the_rest():
+    path = ASPath.parse("2 1")
+    longer = path.prepend(3)
+    assert longer.rest is path
+    assert list(longer) == [3, 2, 1]
+    assert len(longer) == 3
+    assert longer.origin == 1
+    assert longer is ASPath.parse("3 2 1")
+
+
+def test_membership():
+    path = ASPath.parse("3 2 1")
+    assert 2 in path
+    assert "3" in path
+    assert 4 not in path
+
+    # an AS sharing the membership bit of one on the path isn't on it
+    assert 1 + MEMBERSHIP_BITS not in path
+    assert 1 + MEMBERSHIP_BITS in path.prepend(1 + MEMBERSHIP_BITS)
+
+
+def test_equal_paths_are_the_same_object():
+    assert ASPath.parse("5 4") is ASPath.from_numbers([5, 4])
+    assert hash(ASPath.parse("5 4")) != hash(ASPath.parse("4 5"))
+    assert pickle.loads(pickle.dumps(ASPath.parse("5 4"))) is ASPath.parse("5 4")
@@ -0,0 +1,59 @@
+from ip_packet import IPPacket, IPPacketView
+
+
+def full_checksum(packet):
+    """The checksum of the header, summed over all of it again"""
+    header = packet.get_header_bytes(False)
+    total = sum(int.from_bytes(header[i : i + 2], "big") for i in range(0, 20, 2))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def make_packet(ttl=64, payload="hello"):
+    return IPPacket(20 + len(payload), 5, ttl, "10.0.0.1", "192.168.7.9", payload)
+
+
+def test_new_packet_has_a_valid_checksum():
+    packet = make_packet()
+    assert packet.header_checksum == full_checksum(packet)
+    assert packet.validate()
+
+
+def test_decrease_ttl_updates_the_checksum():
+    packet = make_packet(ttl=64)
+    for ttl in range(63, 0, -1):
+        assert packet.decrease_ttl()
+        assert packet.ttl == ttl
+        assert packet.header_checksum == full_checksum(packet)
+        assert packet.validate()
+
+    assert not packet.decrease_ttl()
+    assert packet.ttl == 0
+    assert packet.header_checksum == full_checksum(packet)
+
+
+def test_corrupted_header_is_invalid():
+    packet = make_packet()
+    packet.header_checksum ^= 1
+    assert not packet.validate()
+
+
+def test_wire_format_round_trip():
+    packet = make_packet(ttl=9, payload="payload ü")
+    data = packet.to_bytes()
+    decoded = IPPacket.from_bytes(data)
+    assert decoded.to_bytes() == data
+    assert decoded.ttl == 9
+    assert decoded.get_destination_addr() == "192.168.7.9"
+    assert decoded.payload == "payload ü"
+    assert decoded.validate()
+
+
+def test_view_updates_its_buffer():
+    buffer = bytearray(make_packet(ttl=5).to_bytes())
+    view = IPPacketView(buffer)
+    assert view.decrease_ttl()
+    assert buffer[8] == 4
+    assert view.header_checksum == full_checksum(view)
+    assert IPPacket.from_bytes(bytes(buffer)).validate()
@@ -0,0 +1,143 @@
+import pytest
+
+from messages import (
+    BGP_HEADER,
+    MARKER,
+    MAX_MESSAGE_LENGTH,
+    BGPMessage,
+    KeepAliveMessage,
+    Message,
+    NotificationMessage,
+    OpenMessage,
+    TrustRateMessage,
+    UpdateMessage,
+    VotingMessage,
+    count_messages,
+    read_messages,
+)
+
+PATH_ATTR = {
+    "ORIGIN": 0,
+    "NEXT_HOP": "10.0.0.1",
+    "MED": 5,
+    "LOC_PREF": 100,
+    "WEIGHT": 0,
+    "TRUST_RATE": 0.5,
+    "AS_PATH": "3 2 1",
+}
+
+
+def round_trip(message):
+    data = message.encode()
+    assert len(data) == message.msg_length
+    decoded = BGPMessage.decode(data, message.router_number)
+    assert type(decoded) is type(message)
+    assert decoded.msg_length == len(data)
+    return decoded
+
+
+def test_header_only_messages():
+    for message_class in (BGPMessage, KeepAliveMessage, TrustRateMessage):
+        decoded = round_trip(message_class(1))
+        assert decoded.get_message_type() == message_class(1).get_message_type()
+        assert len(decoded.encode()) == BGP_HEADER.size
+
+
+def test_open_message():
+    decoded = round_trip(OpenMessage(7, "192.168.0.7", hold_time=90))
+    assert decoded.bgp_id == "192.168.0.7"
+    assert decoded.hold_time == 90
+    assert decoded.version == 4
+
+
+def test_update_message():
+    message = UpdateMessage(
+        2,
+        withdrawn_routes_len=1,
+        withdrawn_routes=["10.1.0.0/16"],
+        total_pa_len=len(PATH_ATTR),
+        total_pa=PATH_ATTR,
+        nlri=["192.168.4.0/24", "172.16.0.0/12", "10.0.0.1/32"],
+    )
+    decoded = round_trip(message)
+    assert decoded.withdrawn_routes == ["10.1.0.0/16"]
+    assert decoded.nlri == ["192.168.4.0/24", "172.16.0.0/12", "10.0.0.1/32"]
+
+    path_attr = decoded.total_pa
+    assert str(path_attr.pop("AS_PATH")) == "3 2 1"
+    assert path_attr == {key: PATH_ATTR[key] for key in path_attr}
+    assert set(path_attr) | {"AS_PATH"} == set(PATH_ATTR)
+
+
+def test_notification_message():
+    decoded = round_trip(NotificationMessage(3, (2, 11)))
+    assert decoded.error_subcode == (2, 11)
+
+
+def test_voting_message():
+    message = VotingMessage(4, 70000, 1, 12, 0.75)
+    message.ttl = 1
+    message.set_num_of_2nd_neighbours(3)
+    decoded = round_trip(message)
+    assert decoded.get_origin() == 70000
+    assert decoded.is_answer() == 1
+    assert decoded.get_peer_to_vote_for() == 12
+    assert decoded.get_vote_value() == 0.75
+    assert decoded.ttl == 1
+    assert decoded.get_num_of_2nd_neighbours() == 3
+
+    assert round_trip(VotingMessage(4, 1, 0, 2)).get_vote_value() is None
+
+
+def test_encode_rejects_messages_over_4096_bytes():
+    nlri = [f"10.{i // 256}.{i % 256}.0/24" for i in range(1500)]
+    message = UpdateMessage(
+        1, total_pa_len=len(PATH_ATTR), total_pa=PATH_ATTR, nlri=nlri
+    )
+    with pytest.raises(ValueError):
+        message.encode()
+
+
+def test_decode_rejects_length_over_4096():
+    data = BGP_HEADER.pack(MARKER, MAX_MESSAGE_LENGTH + 1, Message.KEEPALIVE.value)
+    with pytest.raises(NotificationMessage) as error:
+        BGPMessage.decode(data + bytes(MAX_MESSAGE_LENGTH), 1)
+    assert error.value.error_subcode == (0, 2)
+
+
+def test_decode_rejects_bad_marker():
+    data = bytearray(KeepAliveMessage(1).encode())
+    data[0] = 0
+    with pytest.raises(NotificationMessage) as error:
+        BGPMessage.decode(bytes(data), 1)
+    assert error.value.error_subcode == (0, 1)
+
+
+def test_read_messages_keeps_partial_message():
+    first = KeepAliveMessage(1).encode()
+    second = OpenMessage(1, "10.0.0.1").encode()
+    buffer = bytearray(first + second[:10])
+
+    messages = read_messages(buffer, 1)
+    assert [type(m) for m in messages] == [KeepAliveMessage]
+    assert buffer == second[:10]
+
+    buffer += second[10:]
+    assert [type(m) for m in read_messages(buffer, 1)] == [OpenMessage]
+    assert buffer == b""
+
+
+def test_read_messages_rejects_length_over_4096():
+    buffer = bytearray(
+        BGP_HEADER.pack(MARKER, MAX_MESSAGE_LENGTH + 1, Message.UPDATE.value)
+    )
+    with pytest.raises(NotificationMessage) as error:
+        read_messages(buffer, 1)
+    assert error.value.error_subcode == (0, 2)
+
+
+def test_count_messages():
+    update = UpdateMessage(1, withdrawn_routes_len=1, withdrawn_routes=["10.0.0.0/8"])
+    buffer = update.encode() + KeepAliveMessage(1).encode() + update.encode()
+    assert count_messages(buffer, Message.UPDATE) == 2
+    assert count_messages(buffer, Message.KEEPALIVE) == 1
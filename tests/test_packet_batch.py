@@ -0,0 +1,64 @@
+import numpy
+
+from packet_batch import PacketBatch
+
+
+def full_checksums(batch):
+    """The checksums of the headers, summed over all of them again"""
+    return ~batch.ones_complement_sum(batch.header_words(False))
+
+
+def make_batch(ttl=64):
+    destinations = [0x0A000001, 0xC0A80001, 0x08080808, 0x7F000001]
+    payloads = ["a", "bb", "", "dddd"]
+    return PacketBatch.create(0x0A0000FE, destinations, payloads, ttl=ttl)
+
+
+def test_new_batch_is_valid():
+    batch = make_batch()
+    assert batch.validate().all()
+    assert (batch.checksum == full_checksums(batch)).all()
+
+
+def test_decrease_ttl_updates_the_checksums():
+    batch = make_batch(ttl=4)
+    batch.ttl[1] = 1
+    batch.generate_new_checksums()
+
+    alive = batch.decrease_ttl()
+    assert alive.tolist() == [True, False, True, True]
+    assert batch.ttl.tolist() == [3, 0, 3, 3]
+    assert (batch.checksum == full_checksums(batch)).all()
+    assert batch.validate().all()
+
+    for _ in range(3):
+        batch.decrease_ttl()
+    assert batch.ttl.tolist() == [0, 0, 0, 0]
+    assert (batch.checksum == full_checksums(batch)).all()
+
+
+def test_corrupted_header_is_invalid():
+    batch = make_batch()
+    batch.checksum[2] ^= 1
+    assert batch.validate().tolist() == [True, True, False, True]
+
+
+def test_wire_format_round_trip():
+    batch = make_batch()
+    decoded = PacketBatch.from_bytes(batch.to_bytes())
+    assert len(decoded) == len(batch)
+    assert decoded.to_bytes() == batch.to_bytes()
+    assert [decoded.get_payload(i) for i in range(len(decoded))] == [
+        "a",
+        "bb",
+        "",
+        "dddd",
+    ]
+
+
+def test_select_keeps_the_payloads():
+    batch = make_batch()
+    selected = batch.select(numpy.array([False, True, False, True]))
+    assert len(selected) == 2
+    assert [selected.get_payload(i) for i in range(2)] == ["bb", "dddd"]
+    assert selected.validate().all()
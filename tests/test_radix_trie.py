@@ -0,0 +1,120 @@
+import ipaddress
+import random
+
+import pytest
+
+from radix_trie import RadixTrie, parse_prefix
+
+
+def address(value):
+    return int(ipaddress.IPv4Address(value))
+
+
+def count_nodes(trie):
+    count = 0
+    stack = [trie.root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack += [child for child in node.children if child is not None]
+    return count
+
+
+def make_trie(*prefixes):
+    trie = RadixTrie()
+    for prefix in prefixes:
+        trie.insert(*parse_prefix(prefix), prefix)
+    return trie
+
+
+def test_longest_prefix_match():
+    trie = make_trie("10.0.0.0/8", "10.1.0.0/16", "10.1.2.0/24", "192.168.0.0/16")
+    assert trie.lookup(address("10.1.2.3")) == "10.1.2.0/24"
+    assert trie.lookup(address("10.1.3.3")) == "10.1.0.0/16"
+    assert trie.lookup(address("10.200.0.1")) == "10.0.0.0/8"
+    assert trie.lookup(address("192.168.255.255")) == "192.168.0.0/16"
+    assert trie.lookup(address("172.16.0.1")) is None
+
+    trie.insert(0, 0, "default")
+    assert trie.lookup(address("172.16.0.1")) == "default"
+    assert trie.lookup_batch([address("10.1.2.3"), address("11.0.0.0")]) == [
+        "10.1.2.0/24",
+        "default",
+    ]
+
+
+def test_insert_replaces_value():
+    trie = make_trie("10.0.0.0/8")
+    trie.insert(*parse_prefix("10.0.0.0/8"), "new")
+    assert len(trie) == 1
+    assert trie.get(*parse_prefix("10.0.0.0/8")) == "new"
+
+
+def test_host_bits_are_ignored():
+    trie = make_trie("10.1.2.3/16")
+    assert trie.get(address("10.1.0.0"), 16) == "10.1.2.3/16"
+    assert list(trie.items()) == [(address("10.1.0.0"), 16, "10.1.2.3/16")]
+
+
+def test_get_needs_an_exact_match():
+    trie = make_trie("10.0.0.0/8", "10.1.0.0/16")
+    assert trie.get(*parse_prefix("10.1.0.0/16")) == "10.1.0.0/16"
+    assert trie.get(*parse_prefix("10.1.0.0/24")) is None
+    assert trie.get(*parse_prefix("10.0.0.0/7"), "missing") == "missing"
+    assert trie.find(*parse_prefix("11.0.0.0/8")) is None
+
+
+def test_delete_collapses_branch_nodes():
+    trie = RadixTrie()
+    empty = count_nodes(trie)
+
+    # the two /24 prefixes branch off below a node without a value
+    trie.insert(*parse_prefix("10.1.2.0/24"), "a")
+    trie.insert(*parse_prefix("10.1.3.0/24"), "b")
+    assert count_nodes(trie) == empty + 3
+
+    trie.delete(*parse_prefix("10.1.2.0/24"))
+    assert count_nodes(trie) == empty + 1
+    assert trie.lookup(address("10.1.2.1")) is None
+    assert trie.lookup(address("10.1.3.1")) == "b"
+
+    trie.delete(*parse_prefix("10.1.3.0/24"))
+    assert count_nodes(trie) == empty
+    assert len(trie) == 0
+
+
+def test_delete_keeps_covered_prefixes():
+    trie = make_trie("10.0.0.0/8", "10.1.0.0/16", "10.1.2.0/24")
+    trie.delete(*parse_prefix("10.1.0.0/16"))
+    assert len(trie) == 2
+    assert trie.lookup(address("10.1.2.3")) == "10.1.2.0/24"
+    assert trie.lookup(address("10.1.3.3")) == "10.0.0.0/8"
+
+    with pytest.raises(KeyError):
+        trie.delete(*parse_prefix("10.1.0.0/16"))
+    with pytest.raises(KeyError):
+        trie.delete(*parse_prefix("10.2.0.0/16"))
+
+
+def test_matches_linear_scan():
+    rng = random.Random(4)
+    networks = {
+        ipaddress.IPv4Network((rng.getrandbits(32), rng.randint(0, 32)), strict=False)
+        for _ in range(300)
+    }
+    trie = RadixTrie()
+    for network in networks:
+        trie.insert(int(network.network_address), network.prefixlen, network)
+
+    # take half of them out again, the rest has to be found all the same
+    removed = set(rng.sample(sorted(networks), len(networks) // 2))
+    for network in removed:
+        trie.delete(int(network.network_address), network.prefixlen)
+    networks -= removed
+    assert len(trie) == len(networks)
+
+    for _ in range(1000):
+        value = rng.getrandbits(32)
+        matching = [n for n in networks if ipaddress.IPv4Address(value) in n]
+        expected = max(matching, key=lambda n: n.prefixlen, default=None)
+        assert trie.lookup(value) == expected
@@ -0,0 +1,87 @@
+import ipaddress
+
+from path_attributes import PathAttributes
+from rib import RIB
+
+
+def announce(rib, peer, network, as_path, loc_pref=100):
+    attributes = PathAttributes(0, "10.0.0.1", 0, loc_pref, 0, 0.5, as_path)
+    return rib.announce(peer, network, attributes, 0.5)
+
+
+def address(value):
+    return int(ipaddress.IPv4Address(value))
+
+
+def test_announce_and_withdraw():
+    rib = RIB()
+    route_id = announce(rib, 1, "10.0.0.0/8", "1")
+    assert rib.peer_route(1, "10.0.0.0/8") == route_id
+    assert rib.best_route("10.0.0.0/8") == route_id
+    assert rib.longest_match(address("10.1.1.1")) == "10.0.0.0/8"
+    assert len(rib) == 1
+
+    assert rib.withdraw(1, "10.0.0.0/8") == route_id
+    assert len(rib) == 0
+    assert rib.best_route("10.0.0.0/8") is None
+    assert rib.longest_match(address("10.1.1.1")) is None
+    assert rib.routes_for("10.0.0.0/8") == []
+
+    # the peer has nothing left to withdraw
+    assert rib.withdraw(1, "10.0.0.0/8") is None
+
+
+def test_announcing_again_replaces_the_route():
+    rib = RIB()
+    route_id = announce(rib, 1, "10.0.0.0/8", "1 2")
+    assert announce(rib, 1, "10.0.0.0/8", "1 2") is None
+
+    assert announce(rib, 1, "10.0.0.0/8", "1 3 2") == route_id
+    assert len(rib) == 1
+    assert str(rib.get(route_id, "AS_PATH")) == "1 3 2"
+
+
+def test_withdrawn_rows_are_reused():
+    rib = RIB()
+    first = announce(rib, 1, "10.0.0.0/8", "1")
+    second = announce(rib, 2, "10.0.0.0/8", "2")
+    rib.withdraw(1, "10.0.0.0/8")
+
+    reused = announce(rib, 3, "192.168.0.0/16", "3")
+    assert reused == first
+    assert list(rib) == [first, second]
+    assert rib.routes_for("10.0.0.0/8") == [second]
+    assert rib.peer_route(1, "10.0.0.0/8") is None
+    assert rib.peer_route(3, "192.168.0.0/16") == reused
+    assert rib.get(reused, "NETWORK") == "192.168.0.0/16"
+
+
+def test_best_route_follows_the_routes():
+    rib = RIB()
+    long_path = announce(rib, 1, "10.0.0.0/8", "1 4 5")
+    assert rib.best_route("10.0.0.0/8") == long_path
+
+    short_path = announce(rib, 2, "10.0.0.0/8", "2 5")
+    assert rib.best_route("10.0.0.0/8") == short_path
+
+    # a higher LOC_PREF wins over the shorter path
+    announce(rib, 1, "10.0.0.0/8", "1 4 5", loc_pref=200)
+    assert rib.best_route("10.0.0.0/8") == long_path
+
+    # the best route got worse, the other one takes over
+    announce(rib, 1, "10.0.0.0/8", "1 4 5", loc_pref=50)
+    assert rib.best_route("10.0.0.0/8") == short_path
+
+    rib.withdraw(2, "10.0.0.0/8")
+    assert rib.best_route("10.0.0.0/8") == long_path
+
+
+def test_longest_match_prefers_the_longer_prefix():
+    rib = RIB()
+    announce(rib, 1, "10.0.0.0/8", "1")
+    announce(rib, 1, "10.1.0.0/16", "1")
+    assert rib.longest_match(address("10.1.2.3")) == "10.1.0.0/16"
+    assert rib.longest_match(address("10.2.2.3")) == "10.0.0.0/8"
+
+    rib.withdraw(1, "10.1.0.0/16")
+    assert rib.longest_match(address("10.1.2.3")) == "10.0.0.0/8"
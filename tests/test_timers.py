@@ -0,0 +1,86 @@
+import random
+
+from timers import TimingWheel
+
+
+class Clock:
+    """Collects what the wheel schedules, so the tests drive the ticks"""
+
+    def __init__(self):
+        self.scheduled = []
+
+    def call_later(self, delay, action):
+        self.scheduled.append((delay, action))
+
+    def tick(self, wheel, times=1):
+        for _ in range(times):
+            delay, action = self.scheduled.pop(0)
+            assert delay == wheel.tick
+            action()
+
+
+def test_timer_expires_on_its_deadline():
+    clock = Clock()
+    wheel = TimingWheel(clock.call_later, tick=0.5, slots=8)
+    expired = []
+    wheel.start("hold", 2, lambda: expired.append("hold"))
+    assert wheel.remaining("hold") == 2
+
+    clock.tick(wheel, 3)
+    assert expired == []
+    assert wheel.remaining("hold") == 0.5
+
+    clock.tick(wheel)
+    assert expired == ["hold"]
+    assert wheel.remaining("hold") == 0
+    # nothing left to wait for, the wheel stops ticking
+    assert clock.scheduled == []
+
+
+def test_timer_beyond_one_revolution():
+    clock = Clock()
+    wheel = TimingWheel(clock.call_later, slots=4)
+    expired = []
+    wheel.start("keepalive", 10, lambda: expired.append(wheel.ticks))
+    wheel.start("connect", 2, lambda: expired.append(wheel.ticks))
+
+    clock.tick(wheel, 10)
+    assert expired == [2, 10]
+
+
+def test_restart_and_stop():
+    clock = Clock()
+    wheel = TimingWheel(clock.call_later, slots=8)
+    expired = []
+    wheel.start("hold", 3, lambda: expired.append("first"))
+    clock.tick(wheel, 2)
+    wheel.start("hold", 3, lambda: expired.append("second"))
+    assert wheel.remaining("hold") == 3
+
+    clock.tick(wheel, 3)
+    assert expired == ["second"]
+
+    wheel.start("hold", 1, lambda: expired.append("stopped"))
+    wheel.stop("hold")
+    assert wheel.remaining("hold") == 0
+    clock.tick(wheel)
+    assert expired == ["second"]
+
+
+def test_delay_is_rounded_up_to_a_tick():
+    clock = Clock()
+    wheel = TimingWheel(clock.call_later, tick=1.0)
+    wheel.start("short", 0.1, lambda: None)
+    wheel.start("long", 2.5, lambda: None)
+    assert wheel.remaining("short") == 1
+    assert wheel.remaining("long") == 3
+
+
+def test_jitter_only_shortens_jittered_timers():
+    clock = Clock()
+    wheel = TimingWheel(clock.call_later, tick=0.1, jitter=0.25, rng=random.Random(1))
+    for i in range(20):
+        wheel.start(i, 10, lambda: None, jittered=True)
+        assert 7.5 <= wheel.remaining(i) <= 10
+    wheel.start("plain", 10, lambda: None)
+    assert wheel.remaining("plain") == 10
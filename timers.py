@@ -1,54 +1,103 @@
-import asyncio
+"""
+Timers of the BGP state machine.
 
+All session timers (ConnectRetry, Hold and Keepalive) live on a single hashed
+timing wheel, instead of every state machine counting its timers down every
+second. Starting, stopping or resetting a timer is O(1), and the wheel only
+wakes up once per tick no matter how many timers are running, or not at all
+when there are none.
 
-async def decrease_connect_retry_timer(cls):
-    """Decrease connect_retry_timer every second if its value is greater than zero"""
+The wheel is driven by a call_later(delay, action) function, which is the one
+of the asyncio event loop or the event engine the routers run on, or
+thread_call_later when they run in threads.
+"""
+import math
+import random
+import threading
 
-    cls.logger.debug("Starting decrease_connect_retry_timer() coroutine")
 
-    if not hasattr(cls, "connect_retry_timer"):
-        cls.connect_retry_timer = 0
+def thread_call_later(delay, action, *argument):
+    timer = threading.Timer(delay, action, argument)
+    timer.daemon = True
+    timer.start()
+    return timer
 
-    while True:
-        await asyncio.sleep(1)
-        if cls.connect_retry_timer:
-            cls.logger.debug(f"connect_retry_timer = {cls.connect_retry_timer}")
-            cls.connect_retry_timer -= 1
-            if not cls.connect_retry_timer:
-                cls.enqueue_event("ConnectRetryTimer_Expires")
 
+class TimingWheel:
+    """
+    Each slot holds the timers expiring in it, keyed by their owner's key.
+    A timer further away than the number of slots goes into the same slot as
+    a closer one, and stays there until the wheel has gone around enough
+    times to reach its deadline.
 
-async def decrease_hold_timer(cls):
-    """Decrease hold_timer every second if its value is greater than zero"""
+    Setting a jitter applies the RFC 4271 jitter to timers started as
+    jittered, reducing their delay by a random amount of up to that fraction.
+    """
 
-    cls.logger.debug("Starting decrease_hold_timer() coroutine")
+    def __init__(self, call_later, tick=1.0, slots=512, jitter=0.0, rng=None):
+        self.call_later = call_later
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]
+        self.jitter = jitter
+        self.random = rng if rng is not None else random.Random()
 
-    if not hasattr(cls, "hold_timer"):
-        cls.hold_timer = 0
+        # deadline tick of every running timer
+        self.deadlines = {}
+        self.ticks = 0
+        self.running = False
+        self.lock = threading.Lock()
 
-    while True:
-        await asyncio.sleep(1)
-        if cls.hold_timer:
-            cls.logger.debug(f"hold_timer = {cls.hold_timer}")
-            cls.hold_timer -= 1
-            if not cls.hold_timer:
-                # create an event
-                cls.enqueue_event("HoldTimer_Expires")
+    def start(self, key, delay, callback, jittered=False):
+        """
+        Starts the timer for the key, restarting it if it is already running.
+        Once it expires, the callback is called without arguments.
+        """
+        if jittered and self.jitter:
+            delay *= 1 - self.random.uniform(0, self.jitter)
 
+        with self.lock:
+            self._remove(key)
+            deadline = self.ticks + max(1, math.ceil(delay / self.tick))
+            self.deadlines[key] = deadline
+            self.slots[deadline % len(self.slots)][key] = (deadline, callback)
 
-async def decrease_keepalive_timer(cls):
-    """Decrease keepalive_timer every second if its value is greater than zero"""
+            if not self.running:
+                self.running = True
+                self.call_later(self.tick, self.advance)
 
-    cls.logger.debug("Starting decrease_keepalive_timer() coroutine")
+    def stop(self, key):
+        with self.lock:
+            self._remove(key)
 
-    if not hasattr(cls, "keepalive_timer"):
-        cls.keepalive_timer = 0
+    def remaining(self, key):
+        """Seconds left until the timer of the key expires, 0 if not running"""
+        deadline = self.deadlines.get(key)
+        if deadline is None:
+            return 0
+        return (deadline - self.ticks) * self.tick
 
-    while True:
-        await asyncio.sleep(1)
-        if cls.keepalive_timer:
-            cls.logger.debug(f"keepalive_timer = {cls.keepalive_timer}")
-            cls.keepalive_timer -= 1
-            if not cls.keepalive_timer:
-                # create an event and pass
-                cls.enqueue_event("KeepaliveTimer_Expires")
+    def _remove(self, key):
+        deadline = self.deadlines.pop(key, None)
+        if deadline is not None:
+            del self.slots[deadline % len(self.slots)][key]
+
+    def advance(self):
+        with self.lock:
+            self.ticks += 1
+            slot = self.slots[self.ticks % len(self.slots)]
+            expired = [
+                (key, callback)
+                for key, (deadline, callback) in slot.items()
+                if deadline <= self.ticks
+            ]
+            for key, _ in expired:
+                del slot[key]
+                del self.deadlines[key]
+
+            # only keep ticking while there is something to wait for
+            self.running = bool(self.deadlines)
+            if self.running:
+                self.call_later(self.tick, self.advance)
+
+        for _, callback in expired:
+            callback()
@@ -0,0 +1,376 @@
+"""
+Generators of AS-level network topologies.
+
+All the generators are seeded, so the same seed always gives the same graph,
+and run in about linear time in the number of links, which makes topologies
+of tens of thousands of ASes a matter of seconds:
+
+- barabasi_albert(), preferential attachment, every new AS links to m
+  existing ASes picked proportionally to their degree.
+- waxman(), ASes placed at random on a unit square and linked with a
+  probability decaying with their distance.
+- tiered(), a hierarchy of a full mesh of tier 1 providers, tier 2 transit
+  providers and stub ASes, with customer/provider and peer relationships.
+
+The graphs are stored as a Topology, a compact adjacency structure in the
+CSR layout: the neighbours of all the ASes one after another in a single
+array, with the offset of the neighbours of every AS in another. ASes are
+numbered from 0 inside a Topology, while the simulation numbers them from 1.
+"""
+import ipaddress
+import math
+import random
+from array import array
+
+import numpy
+
+# relationship of an AS to its neighbour
+CUSTOMER = -1  # the neighbour is a customer of the AS
+PEER = 0
+PROVIDER = 1  # the neighbour is a provider of the AS
+
+# the addresses of the ASes that don't fit the legacy 50.<n>.0.1 and
+# 100.<n>.<n>.0/24 schemes
+ROUTER_IP_BASE = int(ipaddress.IPv4Address("128.0.0.0"))
+PREFIX_BASE = int(ipaddress.IPv4Address("64.0.0.0"))
+# the largest AS number whose /24 prefix stays below ROUTER_IP_BASE
+MAX_AS_NUMBER = (ROUTER_IP_BASE - PREFIX_BASE) // 256 - 1
+
+# the most ASes of a cell whose distances waxman() computes at once
+WAXMAN_BLOCK_SIZE = 1024
+
+
+class Topology:
+    def __init__(self, offsets, neighbours, relationships=None):
+        """
+        The neighbours of AS i are neighbours[offsets[i] : offsets[i + 1]],
+        and relationships holds the relationship of AS i to each of them.
+        """
+        self.offsets = offsets
+        self.neighbours = neighbours
+        self.relationships = relationships
+
+    @classmethod
+    def from_edges(cls, size, edges, relationships=None):
+        """
+        Builds the topology of size ASes from (a, b) links, given in any
+        order. Relationships, if passed, hold the relationship of a to b for
+        every link. Duplicate links and links of an AS to itself are ignored.
+        """
+        seen = set()
+        sources = array("I")
+        targets = array("I")
+        kinds = array("b")
+        for i, (a, b) in enumerate(edges):
+            key = (min(a, b) * size) + max(a, b)
+            if a == b or key in seen:
+                continue
+            seen.add(key)
+            kind = relationships[i] if relationships is not None else PEER
+            # store both directions of the link
+            sources.extend((a, b))
+            targets.extend((b, a))
+            kinds.extend((kind, -kind))
+
+        # counting sort of the links by their source AS
+        offsets = array("I", bytes(4 * (size + 1)))
+        for a in sources:
+            offsets[a + 1] += 1
+        for i in range(size):
+            offsets[i + 1] += offsets[i]
+
+        position = array("I", offsets[:size])
+        neighbours = array("I", bytes(4 * len(targets)))
+        kinds_sorted = array("b", bytes(len(targets)))
+        for a, b, kind in zip(sources, targets, kinds):
+            neighbours[position[a]] = b
+            kinds_sorted[position[a]] = kind
+            position[a] += 1
+
+        return cls(
+            offsets, neighbours, kinds_sorted if relationships is not None else None
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def neighbours_of(self, i):
+        return self.neighbours[self.offsets[i] : self.offsets[i + 1]]
+
+    def relationships_of(self, i):
+        """Pairs of every neighbour of AS i along with its relationship"""
+        neighbours = self.neighbours_of(i)
+        if self.relationships is None:
+            return [(b, PEER) for b in neighbours]
+        return list(
+            zip(neighbours, self.relationships[self.offsets[i] : self.offsets[i + 1]])
+        )
+
+    def degree(self, i):
+        return self.offsets[i + 1] - self.offsets[i]
+
+    def edge_count(self):
+        return len(self.neighbours) // 2
+
+    def edges(self):
+        """Every link once, as an (a, b) pair with a < b"""
+        for a in range(len(self)):
+            for b in self.neighbours_of(a):
+                if a < b:
+                    yield a, b
+
+    def subgraph(self, indices):
+        """
+        The topology induced by the passed ASes, which are numbered in the
+        order they are passed in.
+        """
+        renumbered = {a: i for i, a in enumerate(indices)}
+        edges = []
+        relationships = []
+        for a in indices:
+            for b, relationship in self.relationships_of(a):
+                if b in renumbered and a < b:
+                    edges.append((renumbered[a], renumbered[b]))
+                    relationships.append(relationship)
+
+        return Topology.from_edges(
+            len(indices),
+            edges,
+            relationships if self.relationships is not None else None,
+        )
+
+    def to_routes(self):
+        """The topology in the {"AS<n>": {peer numbers}} form of the simulation"""
+        return {
+            f"AS{i + 1}": {b + 1 for b in self.neighbours_of(i)}
+            for i in range(len(self))
+        }
+
+
+def barabasi_albert(size, m=2, seed=None):
+    """
+    Preferential attachment: starting from m ASes, every new AS links to m
+    distinct existing ones, picked with a probability proportional to their
+    degree.
+    """
+    if not 1 <= m < size:
+        raise ValueError(f"m has to be between 1 and {size - 1}")
+
+    rng = random.Random(seed)
+    edges = []
+    # every AS appears in here once per link it has
+    repeated = []
+    targets = list(range(m))
+    for source in range(m, size):
+        for target in targets:
+            edges.append((source, target))
+        repeated.extend(targets)
+        repeated.extend([source] * m)
+
+        chosen = set()
+        while len(chosen) < m:
+            chosen.add(rng.choice(repeated))
+        targets = sorted(chosen)
+
+    return Topology.from_edges(size, edges)
+
+
+def waxman(
+    size,
+    alpha=None,
+    beta=0.4,
+    seed=None,
+    min_probability=1e-4,
+    average_degree=4,
+):
+    """
+    Waxman model: ASes are placed at random on a unit square, and any two of
+    them are linked with a probability of beta * exp(-d / (alpha * L)), d
+    being their distance and L the largest possible distance.
+
+    Unless alpha is passed, it is derived from the size so that every AS
+    gets about average_degree links, keeping the topology sparse at any size.
+    Pairs further apart than the distance at which the probability drops
+    below min_probability are never linked, so only ASes in nearby cells of
+    a grid are compared, a block of pairs at a time. Components left apart
+    are linked to the rest at random, so the topology is always connected.
+    """
+    if alpha is None:
+        alpha = waxman_alpha(size, beta, average_degree)
+    rng = numpy.random.default_rng(seed)
+    points = rng.random((size, 2))
+    scale = alpha * math.sqrt(2)
+    cutoff = scale * math.log(beta / min_probability) if beta > min_probability else 0
+
+    # bucket the ASes in a grid of cells as wide as the cutoff distance
+    cells_per_side = max(1, min(int(1 / cutoff) if cutoff > 0 else 1, size))
+    cells = numpy.minimum(
+        (points * cells_per_side).astype(numpy.int64), cells_per_side - 1
+    )
+    cell_ids = cells[:, 0] * cells_per_side + cells[:, 1]
+    order = numpy.argsort(cell_ids, kind="stable")
+    bounds = numpy.searchsorted(
+        cell_ids[order], numpy.arange(cells_per_side * cells_per_side + 1)
+    )
+
+    def members(cx, cy):
+        cell = cx * cells_per_side + cy
+        return order[bounds[cell] : bounds[cell + 1]]
+
+    sources = []
+    targets = []
+    for cx in range(cells_per_side):
+        for cy in range(cells_per_side):
+            own = members(cx, cy)
+            if not len(own):
+                continue
+            # the cell itself and half of its neighbours, so every pair of
+            # cells is compared once
+            for dx, dy in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):
+                if not (
+                    0 <= cx + dx < cells_per_side and 0 <= cy + dy < cells_per_side
+                ):
+                    continue
+                others = members(cx + dx, cy + dy)
+                for block in range(0, len(own), WAXMAN_BLOCK_SIZE):
+                    a = own[block : block + WAXMAN_BLOCK_SIZE]
+                    squared = (points[a, 0, None] - points[others, 0]) ** 2 + (
+                        points[a, 1, None] - points[others, 1]
+                    ) ** 2
+                    close = squared <= cutoff * cutoff
+                    if dx == dy == 0:
+                        # within the cell, only the pairs of a before b
+                        close &= a[:, None] < others
+                    rows, columns = numpy.nonzero(close)
+                    distance = numpy.sqrt(squared[rows, columns])
+                    probability = beta * numpy.exp(-distance / scale)
+                    linked = rng.random(len(rows)) < probability
+                    rows = rows[linked]
+                    columns = columns[linked]
+                    sources.append(a[rows])
+                    targets.append(others[columns])
+
+    edges = []
+    if sources:
+        edges = list(
+            zip(
+                numpy.concatenate(sources).tolist(),
+                numpy.concatenate(targets).tolist(),
+            )
+        )
+    edges += connecting_edges(size, edges, random.Random(seed))
+    return Topology.from_edges(size, edges)
+
+
+def waxman_alpha(size, beta, average_degree):
+    """
+    The alpha of the Waxman model giving ASes average_degree links: away
+    from the edges of the square, an AS expects size * beta * 2 * pi *
+    (alpha * L) ** 2 of them.
+    """
+    if size < 2 or beta <= 0:
+        return 1.0
+    return math.sqrt(average_degree / (2 * math.pi * beta * size)) / math.sqrt(2)
+
+
+def tiered(size, tier1_size=8, tier2_fraction=0.15, seed=None):
+    """
+    A hierarchy of ASes: the tier 1 ASes peer with each other in a full
+    mesh, every tier 2 AS buys transit from one or two tier 1 ASes and peers
+    with another tier 2 AS, and all the remaining stub ASes buy transit from
+    one or two providers, picked proportionally to the number of customers
+    they already have.
+    """
+    rng = random.Random(seed)
+    tier1_size = min(tier1_size, size)
+    tier2_end = tier1_size + int((size - tier1_size) * tier2_fraction)
+
+    edges = []
+    relationships = []
+
+    def add_link(a, b, relationship):
+        edges.append((a, b))
+        relationships.append(relationship)
+
+    for a in range(tier1_size):
+        for b in range(a + 1, tier1_size):
+            add_link(a, b, PEER)
+
+    # every provider appears in here once, plus once per customer it has
+    providers = list(range(tier1_size))
+    for a in range(tier1_size, tier2_end):
+        count = min(rng.randint(1, 2), tier1_size)
+        for b in rng.sample(range(tier1_size), count):
+            add_link(a, b, PROVIDER)
+            providers.append(b)
+        if a > tier1_size:
+            add_link(a, rng.randrange(tier1_size, a), PEER)
+        providers.append(a)
+
+    for a in range(tier2_end, size):
+        chosen = {rng.choice(providers) for _ in range(rng.randint(1, 2))}
+        for b in chosen:
+            add_link(a, b, PROVIDER)
+            providers.append(b)
+
+    return Topology.from_edges(size, edges, relationships)
+
+
+def connecting_edges(size, edges, rng):
+    """
+    The links that join the components of the graph into a single one, each
+    from a random AS of a component to a random AS of the ones before it.
+    """
+    parents = list(range(size))
+
+    def find(a):
+        while parents[a] != a:
+            parents[a] = parents[parents[a]]
+            a = parents[a]
+        return a
+
+    for a, b in edges:
+        parents[find(a)] = find(b)
+
+    components = {}
+    for a in range(size):
+        components.setdefault(find(a), []).append(a)
+
+    links = []
+    joined = []
+    for members in components.values():
+        if joined:
+            links.append((rng.choice(members), rng.choice(joined)))
+        joined += members
+    return links
+
+
+def check_as_number(as_number):
+    if not 0 <= as_number <= MAX_AS_NUMBER:
+        raise ValueError(
+            f"AS number {as_number} has no address, the simulation numbers ASes "
+            f"from 0 to {MAX_AS_NUMBER}"
+        )
+
+
+def router_ip(as_number):
+    """The address of the router of the AS"""
+    check_as_number(as_number)
+    if as_number < 256:
+        return f"50.{as_number}.0.1"
+    return str(ipaddress.IPv4Address(ROUTER_IP_BASE + as_number * 256 + 1))
+
+
+def as_prefix(as_number):
+    """The prefix the AS advertises by default"""
+    check_as_number(as_number)
+    if as_number < 256:
+        return f"100.{as_number}.{as_number}.0/24"
+    return str(ipaddress.IPv4Network((PREFIX_BASE + as_number * 256, 24)))
+
+
+GENERATORS = {
+    "barabasi-albert": barabasi_albert,
+    "waxman": waxman,
+    "tiered": tiered,
+}
@@ -0,0 +1,152 @@
+"""
+Tracing of the simulation timeline.
+
+A Tracer records what the routers spend their time on as spans: every BGP
+message handled, every scheduled action run, every state change of a BGP
+session and every phase of the setup. The spans go into a ring buffer, so
+only the most recent ones are kept however long the simulation runs, and
+flushing writes them out in the Chrome trace-event format, which
+chrome://tracing and https://ui.perfetto.dev can show as a timeline with one
+track per router.
+
+The spans are timed on the wall clock, as the point is to find what the
+simulation is slow or blocked on. Routers without a tracer get DISABLED,
+which records nothing.
+"""
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+class Tracer:
+    def __init__(self, path=None, capacity=100000):
+        """
+        Keeps the last capacity spans, which flush() writes to the path.
+        """
+        self.enabled = True
+        self.path = path
+        self.events = collections.deque(maxlen=capacity)
+        self.recorded = 0
+        self.start_time = time.perf_counter()
+        # every track gets a thread id of its own in the trace
+        self.tracks = {}
+        self.lock = threading.Lock()
+
+    def track_id(self, track):
+        track_id = self.tracks.get(track)
+        if track_id is None:
+            with self.lock:
+                track_id = self.tracks.setdefault(track, len(self.tracks) + 1)
+        return track_id
+
+    def timestamp(self, when):
+        """Microseconds since the tracer was created, as Chrome expects"""
+        return (when - self.start_time) * 1e6
+
+    def complete(self, name, category, track, start, end, args=None):
+        """Records a span that ran from start to end, both from perf_counter()"""
+        self.recorded += 1
+        self.events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": self.timestamp(start),
+                "dur": (end - start) * 1e6,
+                "pid": os.getpid(),
+                "tid": self.track_id(track),
+                "args": args or {},
+            }
+        )
+
+    def instant(self, name, category, track, args=None):
+        self.recorded += 1
+        self.events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "i",
+                "s": "t",
+                "ts": self.timestamp(time.perf_counter()),
+                "pid": os.getpid(),
+                "tid": self.track_id(track),
+                "args": args or {},
+            }
+        )
+
+    @contextlib.contextmanager
+    def span(self, name, category, track, args=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, category, track, start, time.perf_counter(), args)
+
+    def traced(self, action, name, category, track, args=None):
+        """The action, recording a span every time it runs"""
+
+        def run(*argument):
+            start = time.perf_counter()
+            try:
+                return action(*argument)
+            finally:
+                self.complete(name, category, track, start, time.perf_counter(), args)
+
+        return run
+
+    def to_chrome(self):
+        """The recorded spans as a Chrome trace"""
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": track_id,
+                "args": {"name": str(track)},
+            }
+            for track, track_id in self.tracks.copy().items()
+        ]
+        return {
+            # copied first, routers in other threads might be adding spans
+            "traceEvents": metadata + list(self.events.copy()),
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "recorded": self.recorded,
+                "dropped": self.recorded - len(self.events),
+            },
+        }
+
+    def flush(self, path=None):
+        path = path or self.path
+        if path is None:
+            return
+        with open(path, "w") as file:
+            json.dump(self.to_chrome(), file)
+
+
+class NullTracer:
+    """Stands in for the tracer when tracing is off"""
+
+    enabled = False
+
+    def complete(self, name, category, track, start, end, args=None):
+        pass
+
+    def instant(self, name, category, track, args=None):
+        pass
+
+    @contextlib.contextmanager
+    def span(self, name, category, track, args=None):
+        yield
+
+    def traced(self, action, name, category, track, args=None):
+        return action
+
+    def flush(self, path=None):
+        pass
+
+
+DISABLED = NullTracer()
@@ -0,0 +1,578 @@
+"""
+Transports moving BGP messages and IP packets between the routers.
+
+Every router gets its own transport, which sends to the peers of the router
+and delivers whatever arrives for it to the router handlers. A transport
+provides the following:
+    open(connections) / poll(router, timeout) - when the router runs in a
+        thread, poll waits up to timeout seconds and handles what arrived
+    serve(router, connections) - when the router runs on an event loop
+    bgp_send(peer, message) / data_send(peer, ip_packet)
+    close()
+
+TcpTransport and AsyncTcpTransport connect the routers through loopback TCP
+sockets, while QueueTransport skips the sockets and hands messages straight to
+the inbound queue of the peer router, so big topologies are not limited by
+the port range. SimulatedTransport does the same for routers running on the
+discrete-event engine, where each delivery is an event on the virtual clock.
+
+IP packets travel as their wire format (see ip_packet.py), and the receiving
+router works on the received buffer directly. Batches of packets have a
+binary format of their own (see packet_batch.py), and any other data is
+dropped.
+"""
+import asyncio
+import copy
+import logging
+import queue
+import select
+import socket
+import struct
+import threading
+
+from ip_packet import IPPacket
+from messages import (
+    BGPMessage,
+    Message,
+    NotificationMessage,
+    count_messages,
+    read_messages,
+)
+from packet_batch import BATCH_MAGIC, PacketBatch
+
+BUFFER_SIZE = 65536  # BGP sessions are length framed, so this is only a read size
+# BGP messages don't carry their sender, so each connection starts by stating
+# the AS number of the speaking router
+PEER_AS = struct.Struct("!I")
+
+logger = logging.getLogger("BGP")
+
+
+def encode_data(ip_packet):
+    return ip_packet.to_bytes()
+
+
+def decode_data(data):
+    """
+    Turns the received data back into an IP packet, or a batch of them. The
+    data is read in place if it is a bytearray. Raises a ValueError if it is
+    neither.
+    """
+    # an IP packet starts with its version, a batch with its magic
+    if data[0] >> 4 == 4:
+        return IPPacket.from_buffer(data)
+    if data[: len(BATCH_MAGIC)] == BATCH_MAGIC:
+        return PacketBatch.from_bytes(data)
+    raise ValueError("Neither an IP packet nor a batch of them")
+
+
+def receive_data(router, data):
+    """Hands the received data to the router, unless it can't be decoded"""
+    try:
+        ip_packet = decode_data(data)
+    except ValueError as e:
+        logger.error(f"Router {router.name} dropping data: {e}")
+        return
+    router.handle_data(ip_packet)
+
+
+def get_ports(router_number):
+    """
+    This is ugly... port range will for now always be the router num
+    multiplied by 4 (since we need 4 ports), in the range of:
+        port: bgp_listener
+        port + 1: bgp_speaker
+        port + 2: data_listener
+        port + 3: data_speaker
+    """
+    base_num = 2000 + 4 * int(router_number)
+    return [base_num, base_num + 1, base_num + 2, base_num + 3]
+
+
+class TcpTransport:
+    def __init__(self, name, router_number):
+        self.name = name
+        self.ports = get_ports(router_number)
+
+        self.listener = RouterListener(name, self.ports[0], self.ports[2])
+        self.speaker = RouterSpeaker(name, self.ports[1], self.ports[3], router_number)
+
+        self.read_list = []
+        # BGP sessions stay open, so keep a receive buffer and the peer for each
+        self.bgp_sessions = {}
+
+    def open(self, connections=50):
+        # start listening
+        self.listener.listen_bgp_socket.listen(connections)
+        self.listener.listen_data_socket.listen(connections)
+
+        self.read_list = [
+            self.listener.listen_bgp_socket,
+            self.listener.listen_data_socket,
+        ]
+
+    def poll(self, router, timeout):
+        readable, writeable, errors = select.select(self.read_list, [], [], timeout)
+        for r in readable:
+            if r is self.listener.listen_bgp_socket:
+                (
+                    bgp_client_socket,
+                    bgp_client_addr,
+                ) = self.listener.listen_bgp_socket.accept()
+                self.bgp_sessions[bgp_client_socket] = [None, bytearray()]
+                self.read_list.append(bgp_client_socket)
+                continue
+
+            if r in self.bgp_sessions:
+                if not self.receive_bgp_data(router, r, self.bgp_sessions[r]):
+                    # whatever is left of the session is lost
+                    router.updates_dropped(
+                        count_messages(self.bgp_sessions[r][1], Message.UPDATE)
+                    )
+                    self.read_list.remove(r)
+                    del self.bgp_sessions[r]
+                    r.close()
+                continue
+
+            if r is self.listener.listen_data_socket:
+                (
+                    data_client_socket,
+                    data_client_addr,
+                ) = self.listener.listen_data_socket.accept()
+                # extract the data, the connection carries a single packet
+                data = bytearray()
+                while chunk := data_client_socket.recv(BUFFER_SIZE):
+                    data += chunk
+                data_client_socket.close()
+
+                # handle the message based on internal state
+                if data:
+                    receive_data(router, data)
+
+    def receive_bgp_data(self, router, bgp_client_socket, session):
+        """
+        Reads whatever arrived on a BGP session and handles every message that
+        is now complete. Returns False once the session should be closed.
+        """
+        try:
+            data = bgp_client_socket.recv(BUFFER_SIZE)
+        except OSError:
+            return False
+
+        if not data:
+            return False
+
+        peer, buffer = session
+        buffer += data
+        if peer is None:
+            # the session starts with the AS number of the speaking router
+            if len(buffer) < PEER_AS.size:
+                return True
+            (peer,) = PEER_AS.unpack_from(buffer)
+            del buffer[: PEER_AS.size]
+            session[0] = peer
+
+        try:
+            messages = read_messages(buffer, peer)
+        except NotificationMessage as e:
+            logger.error(
+                f"Router {router.name} closing session with {peer}, "
+                f"error: {e.error_sub_code[e.error_subcode]}"
+            )
+            return False
+
+        for message in messages:
+            # handle the message based on internal state
+            router.handle_bgp_data(message)
+
+        return True
+
+    def bgp_send(self, peer, message):
+        self.speaker.bgp_send_message(get_ports(peer)[0], message)
+
+    def data_send(self, peer, ip_packet):
+        self.speaker.send_data(get_ports(peer)[2], ip_packet)
+
+    def close(self):
+        for bgp_client_socket in self.bgp_sessions:
+            bgp_client_socket.close()
+        self.bgp_sessions.clear()
+        self.listener.listen_bgp_socket.close()
+        self.listener.listen_data_socket.close()
+        self.speaker.close()
+
+
+class AsyncTcpTransport:
+    def __init__(self, name, router_number, loop):
+        self.name = name
+        self.ports = get_ports(router_number)
+
+        self.listener = AsyncRouterListener(name, self.ports[0], self.ports[2])
+        self.speaker = AsyncRouterSpeaker(
+            name, self.ports[1], self.ports[3], router_number, loop
+        )
+
+    async def serve(self, router, connections=50):
+        self.speaker.dropped = router.updates_dropped
+        await self.listener.serve(router, connections)
+
+    def bgp_send(self, peer, message):
+        self.speaker.bgp_send_message(get_ports(peer)[0], message)
+
+    def data_send(self, peer, ip_packet):
+        self.speaker.send_data(get_ports(peer)[2], ip_packet)
+
+    def close(self):
+        self.listener.close()
+        self.speaker.close()
+
+
+class QueueNetwork:
+    """
+    In-memory network connecting QueueTransports. It holds the inbound queue
+    of every router, and is shared by all the routers of a simulation.
+
+    Messages are passed on encoded, unless encode is set to False, in which
+    case a shallow copy of the message object is handed over, skipping the
+    wire codec entirely.
+    """
+
+    def __init__(self, loop=None, encode=True):
+        self.loop = loop
+        self.encode = encode
+        self.inbound = {}
+
+    def register(self, router_number):
+        if self.loop is None:
+            self.inbound[int(router_number)] = queue.SimpleQueue()
+        else:
+            self.inbound[int(router_number)] = asyncio.Queue()
+
+    def deliver(self, router_number, item):
+        inbound = self.inbound[int(router_number)]
+        if self.loop is None:
+            inbound.put(item)
+            return
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self.loop:
+            inbound.put_nowait(item)
+        else:
+            self.loop.call_soon_threadsafe(inbound.put_nowait, item)
+
+
+class QueueTransport:
+    def __init__(self, name, router_number, network):
+        self.name = name
+        self.router_number = int(router_number)
+        self.network = network
+        self.inbound_task = None
+
+        network.register(router_number)
+
+    def open(self, connections=50):
+        pass
+
+    def poll(self, router, timeout):
+        inbound = self.network.inbound[self.router_number]
+        try:
+            item = inbound.get(timeout=timeout)
+        except queue.Empty:
+            return
+
+        self.receive(router, item)
+        # handle everything else that piled up in the meantime
+        while not inbound.empty():
+            self.receive(router, inbound.get_nowait())
+
+    async def serve(self, router, connections=50):
+        self.inbound_task = asyncio.create_task(self._serve_inbound(router))
+
+    async def _serve_inbound(self, router):
+        inbound = self.network.inbound[self.router_number]
+        while True:
+            self.receive(router, await inbound.get())
+
+    def receive(self, router, item):
+        is_bgp, sender, payload = item
+        if not is_bgp:
+            if isinstance(payload, (bytes, bytearray)):
+                receive_data(router, payload)
+            else:
+                router.handle_data(payload)
+            return
+
+        if isinstance(payload, bytes):
+            try:
+                payload = BGPMessage.decode(payload, sender)
+            except NotificationMessage as e:
+                logger.error(
+                    f"Router {router.name} dropping message from {sender}, "
+                    f"error: {e.error_sub_code[e.error_subcode]}"
+                )
+                router.updates_dropped(count_messages(payload, Message.UPDATE))
+                return
+
+        router.handle_bgp_data(payload)
+
+    def bgp_send(self, peer, message):
+        if self.network.encode:
+            payload = message.encode()
+        else:
+            # the sender may still change or resend its own object
+            payload = copy.copy(message)
+        self.network.deliver(peer, (True, self.router_number, payload))
+
+    def data_send(self, peer, ip_packet):
+        if self.network.encode:
+            payload = encode_data(ip_packet)
+        else:
+            payload = copy.copy(ip_packet)
+        self.network.deliver(peer, (False, self.router_number, payload))
+
+    def close(self):
+        if self.inbound_task is not None:
+            self.inbound_task.cancel()
+
+
+class SimulatedNetwork(QueueNetwork):
+    """
+    In-memory network for routers running on the EventEngine. Instead of
+    queueing a message, the delivery is scheduled as an event that happens
+    after the link delay.
+    """
+
+    def __init__(self, engine, link_delay=0.01, encode=True):
+        super().__init__(None, encode)
+        self.engine = engine
+        self.link_delay = link_delay
+        self.receivers = {}
+
+    def register(self, router_number):
+        pass
+
+    def deliver(self, router_number, item):
+        transport, router = self.receivers[int(router_number)]
+        self.engine.call_later(self.link_delay, transport.receive, router, item)
+
+
+class SimulatedTransport(QueueTransport):
+    def poll(self, router, timeout):
+        raise RuntimeError("Simulated routers have to run on the event engine")
+
+    async def serve(self, router, connections=50):
+        self.network.receivers[self.router_number] = (self, router)
+
+
+class RouterListener:
+    def __init__(self, name, bgp_port, data_port):
+        self.name = name
+        self.bgp_port = bgp_port
+        self.data_port = data_port
+
+        # Control and Data plane listener
+        self.listen_bgp_socket = socket.create_server((socket.gethostname(), bgp_port))
+        self.listen_data_socket = socket.create_server(
+            (socket.gethostname(), data_port)
+        )
+
+
+class AsyncRouterListener:
+    def __init__(self, name, bgp_port, data_port):
+        self.name = name
+        self.bgp_port = bgp_port
+        self.data_port = data_port
+
+        # Control and Data plane servers, only created once the loop is running
+        self.bgp_server = None
+        self.data_server = None
+
+    async def serve(self, router, connections=50):
+        self.bgp_server = await asyncio.start_server(
+            lambda reader, writer: self.handle_bgp_session(router, reader, writer),
+            socket.gethostname(),
+            self.bgp_port,
+            backlog=connections,
+        )
+        self.data_server = await asyncio.start_server(
+            lambda reader, writer: self.handle_data_connection(router, reader, writer),
+            socket.gethostname(),
+            self.data_port,
+            backlog=connections,
+        )
+
+    async def handle_bgp_session(self, router, reader, writer):
+        buffer = bytearray()
+        try:
+            # the session starts with the AS number of the speaking router
+            (peer,) = PEER_AS.unpack(await reader.readexactly(PEER_AS.size))
+            while True:
+                data = await reader.read(BUFFER_SIZE)
+                if not data:
+                    break
+
+                buffer += data
+                for message in read_messages(buffer, peer):
+                    # handle the message based on internal state
+                    router.handle_bgp_data(message)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except NotificationMessage as e:
+            logger.error(
+                f"Router {router.name} closing session with {peer}, "
+                f"error: {e.error_sub_code[e.error_subcode]}"
+            )
+        finally:
+            # whatever is left of the session is lost
+            router.updates_dropped(count_messages(buffer, Message.UPDATE))
+            writer.close()
+
+    async def handle_data_connection(self, router, reader, writer):
+        # a data connection carries a single packet
+        data = await reader.read()
+        writer.close()
+        if data:
+            receive_data(router, bytearray(data))
+
+    def close(self):
+        for server in (self.bgp_server, self.data_server):
+            if server is not None:
+                server.close()
+
+
+class RouterSpeaker:
+    def __init__(self, name, bgp_port, data_port, router_number):
+        self.name = name
+        self.bgp_port = bgp_port
+        self.data_port = data_port
+        self.router_number = router_number
+
+        # BGP control and data plane speaker, a BGP session is kept open for each
+        # peer listener port, the data plane still connects once per packet
+        self.bgp_sessions = {}
+        self.bgp_sessions_lock = threading.Lock()
+        self.speaker_data_socket = None
+
+    def _bgp_connect(self, listener_port):
+        speaker_bgp_socket = socket.create_connection(
+            (socket.gethostname(), listener_port)
+        )
+        speaker_bgp_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        speaker_bgp_socket.sendall(PEER_AS.pack(self.router_number))
+        self.bgp_sessions[listener_port] = speaker_bgp_socket
+        return speaker_bgp_socket
+
+    def bgp_send_message(self, l_port, data):
+        encoded_data = data.encode()
+        # messages can be sent from the listener thread and the main thread
+        with self.bgp_sessions_lock:
+            speaker_bgp_socket = self.bgp_sessions.get(l_port)
+            if speaker_bgp_socket is not None:
+                try:
+                    speaker_bgp_socket.sendall(encoded_data)
+                    return
+                except OSError:
+                    # the peer dropped the session, set up a new one
+                    speaker_bgp_socket.close()
+
+            self._bgp_connect(l_port).sendall(encoded_data)
+
+    def close(self):
+        with self.bgp_sessions_lock:
+            for speaker_bgp_socket in self.bgp_sessions.values():
+                speaker_bgp_socket.close()
+            self.bgp_sessions.clear()
+
+    def _data_connect(self, listener_port):
+        self.speaker_data_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.speaker_data_socket.connect((socket.gethostname(), listener_port))
+
+    def send_data(self, l_port, data):
+        self._data_connect(l_port)
+        self.speaker_data_socket.sendall(encode_data(data))
+        self.speaker_data_socket.close()
+
+
+class AsyncRouterSpeaker:
+    def __init__(self, name, bgp_port, data_port, router_number, loop):
+        self.name = name
+        self.bgp_port = bgp_port
+        self.data_port = data_port
+        self.router_number = router_number
+        self.loop = loop
+
+        # a queue of encoded messages and a task writing them out for each
+        # peer listener port
+        self.bgp_queues = {}
+        self.bgp_tasks = {}
+        # called with the number of UPDATE messages lost with a session
+        self.dropped = None
+
+    def bgp_send_message(self, l_port, data):
+        # may be called from outside the event loop thread as well
+        self.loop.call_soon_threadsafe(self._enqueue_bgp_message, l_port, data.encode())
+
+    def _enqueue_bgp_message(self, l_port, encoded_data):
+        if l_port not in self.bgp_queues:
+            self.bgp_queues[l_port] = asyncio.Queue()
+            self.bgp_tasks[l_port] = self.loop.create_task(
+                self._bgp_session(l_port, self.bgp_queues[l_port])
+            )
+        self.bgp_queues[l_port].put_nowait(encoded_data)
+
+    async def _bgp_session(self, l_port, queue):
+        writer = None
+        batch = []
+        try:
+            while True:
+                batch = [await queue.get()]
+                # write out whatever else piled up before waiting on the socket
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+
+                if writer is None or writer.is_closing():
+                    _, writer = await asyncio.open_connection(
+                        socket.gethostname(), l_port
+                    )
+                    writer.write(PEER_AS.pack(self.router_number))
+
+                for encoded_data in batch:
+                    writer.write(encoded_data)
+                await writer.drain()
+                batch = []
+        except ConnectionError as e:
+            logger.error(f"Speaker {self.name} lost the session on port {l_port}: {e}")
+            if self.dropped is not None:
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+                self.dropped(
+                    sum(count_messages(data, Message.UPDATE) for data in batch)
+                )
+        finally:
+            del self.bgp_queues[l_port]
+            del self.bgp_tasks[l_port]
+            if writer is not None:
+                writer.close()
+
+    def send_data(self, l_port, data):
+        asyncio.run_coroutine_threadsafe(
+            self._send_data(l_port, encode_data(data)), self.loop
+        )
+
+    async def _send_data(self, l_port, encoded_data):
+        try:
+            _, writer = await asyncio.open_connection(socket.gethostname(), l_port)
+            writer.write(encoded_data)
+            await writer.drain()
+            writer.close()
+        except OSError as e:
+            # nobody waits on the result, so the packet would vanish unnoticed
+            logger.error(f"Speaker {self.name} lost data for port {l_port}: {e}")
+
+    def close(self):
+        for task in list(self.bgp_tasks.values()):
+            task.cancel()